@@ -1,23 +1,37 @@
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 from .config import Settings
 from .db import init_db
+from .events import configure as configure_events
 from .routes import api
+from .batch import start_batch_runner
 from .seed import maybe_seed_from_excel
+from . import metrics, tracing
 
 def create_app() -> Flask:
     settings = Settings.from_env()
     app = Flask(__name__)
     app.config["SETTINGS"] = settings
+    # Spans for requests, background extraction and SQL (TRACING, off by default)
+    tracing.configure(settings, "api")
+    tracing.instrument_app(app)
+    # Hard cap on any request body, enforced by werkzeug while it reads; the upload
+    # routes apply the tighter per-file and per-request limits themselves
+    app.config["MAX_CONTENT_LENGTH"] = (max(settings.max_upload_mb, settings.bulk_max_mb) + 1) * 1024 * 1024
 
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     # Ensure directories + DB
     init_db(settings)
+    configure_events(settings)
 
     # Seed from Excel if present (idempotent)
     maybe_seed_from_excel(app)
 
+    # Bulk (priority=bulk) uploads; with JOB_QUEUE=db the worker runs this instead
+    if settings.job_queue != "db":
+        start_batch_runner(settings)
+
     # API routes
     app.register_blueprint(api, url_prefix="/api")
 
@@ -25,4 +39,9 @@ def create_app() -> Flask:
     def health():
         return {"status": "ok"}
 
+    # Prometheus scrape target; each gunicorn worker answers with its own numbers
+    @app.get("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
     return app
@@ -0,0 +1,348 @@
+"""
+Bulk extraction through the provider batch APIs (uploads with priority=bulk).
+
+Bulk documents wait in status "queued". The runner renders their pages, submits
+them as one provider batch (Anthropic Message Batches / OpenAI Batch API: lower
+price per token, separate rate limits, results within 24h), polls until the batch
+ends and fans the results back into the documents. Documents whose pages come back
+errored or expired are handed to the regular interactive path, so a document never
+fails just because its batch did.
+
+The runner is a daemon thread: in the API process for JOB_QUEUE=memory and in
+`python -m app.worker` for JOB_QUEUE=db. Documents and batches are claimed with
+conditional UPDATEs, so several runners can share one database.
+"""
+from __future__ import annotations
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime, timezone
+from sqlalchemy import select, update, func
+
+from .config import Settings
+from .db import get_session_factory
+from .events import publish
+from .models import Document, ExtractionBatch
+from .llm.factory import get_extractor
+from . import services
+
+log = logging.getLogger("app.batch")
+
+# provider -> smallest payload (bytes) it refused as too large, in this process; later
+# batches stay below it even if BATCH_MAX_BYTES is set higher than the provider allows
+_refused_bytes: dict[str, int] = {}
+
+def collect(settings: Settings) -> int | None:
+    """
+    Submits one batch when enough bulk documents are waiting (BATCH_MAX_REQUESTS) or the
+    oldest has waited BATCH_MAX_WAIT_S. A batch holds at most BATCH_MAX_REQUESTS pages and
+    BATCH_MAX_BYTES of (base64) image data. Returns the batch id, or None if nothing was submitted.
+    """
+    sess_factory = get_session_factory(settings)
+    waiting_q = (Document.priority == "bulk", Document.status == "queued", Document.batch_id.is_(None))
+    with sess_factory() as db:
+        waiting = db.execute(
+            select(Document.id, Document.created_at).where(*waiting_q)
+            .order_by(Document.id).limit(settings.batch_max_requests)
+        ).all()
+    if not waiting:
+        return None
+    if len(waiting) < settings.batch_max_requests and _age_s(waiting[0].created_at) < settings.batch_max_wait_s:
+        return None
+
+    provider = settings.llm_provider.lower()
+    with sess_factory() as db:
+        batch = ExtractionBatch(provider=provider, status="preparing")
+        db.add(batch)
+        db.flush()
+        batch_id = batch.id
+        db.execute(
+            update(Document).where(Document.id.in_([w.id for w in waiting]), *waiting_q)
+            .values(batch_id=batch_id, status="batched")
+        )
+        db.commit()
+        docs = db.execute(select(Document).where(Document.batch_id == batch_id).order_by(Document.id)).scalars().all()
+
+    extractor = get_extractor(settings)
+    max_bytes = min(settings.batch_max_bytes, _refused_bytes.get(provider, settings.batch_max_bytes + 1) - 1)
+    pages: list[tuple[str, bytes, str]] = []
+    included: list[tuple[int, int]] = []  # (document id, its number of pages)
+    for n, doc in enumerate(docs):
+        try:
+            with services.open_upload(settings, doc.storage_path) as (raw, path):
+                if services.extract_from_cache(settings, doc.id, services.document_hash(doc, raw)):
+                    continue
+                doc_pages = [(f"doc-{doc.id}-p{page.index}", page.data, page.media_type)
+                             for page in services.render_pages(settings, extractor, doc.id, raw,
+                                                               doc.content_type, path)]
+        except Exception as e:
+            services.mark_failed(settings, doc.id, str(e))
+            publish(doc.id, {"type": "error", "message": str(e)})
+            continue
+        if pages and (len(pages) + len(doc_pages) > settings.batch_max_requests
+                      or _payload_bytes(pages) + _payload_bytes(doc_pages) > max_bytes):
+            # full: the rest go in the next batch
+            _release(settings, [d.id for d in docs[n:]])
+            break
+        pages.extend(doc_pages)
+        included.append((doc.id, len(doc_pages)))
+
+    while True:
+        if not pages:
+            _set_batch(settings, batch_id, status="ended", ended_at=datetime.utcnow())
+            return batch_id
+        try:
+            provider_batch_id = extractor.submit_batch(pages)
+            break
+        except Exception as e:
+            if not _too_large(e):
+                # provider unavailable: put the documents back for the next round
+                log.warning("batch %d submit failed: %s", batch_id, e)
+                _release(settings, [doc_id for doc_id, _ in included])
+                _set_batch(settings, batch_id, status="failed", error=str(e), ended_at=datetime.utcnow())
+                return None
+            size = _payload_bytes(pages)
+            _refused_bytes[provider] = min(size, _refused_bytes.get(provider, size))
+            if len(included) == 1:
+                # one document is too large for any batch
+                log.warning("batch %d: document %d is too large for a batch: %s", batch_id, included[0][0], e)
+                services.requeue_interactive(settings, included[0][0], "too large for a batch; extracting individually")
+                included, pages = [], []
+                continue
+            # split: the second half goes back to the queue for the next (smaller) batch
+            keep = len(included) // 2
+            kept_pages = sum(count for _, count in included[:keep])
+            log.warning("batch %d refused as too large (%d bytes); retrying with %d of %d document(s)",
+                        batch_id, size, keep, len(included))
+            _release(settings, [doc_id for doc_id, _ in included[keep:]])
+            included, pages = included[:keep], pages[:kept_pages]
+
+    with sess_factory() as db:
+        # conditional: recover() may have given up on this batch while it was being prepared
+        submitted = db.execute(
+            update(ExtractionBatch).where(ExtractionBatch.id == batch_id, ExtractionBatch.status == "preparing")
+            .values(status="submitted", provider_batch_id=provider_batch_id, request_count=len(pages))
+        ).rowcount
+        db.commit()
+    if not submitted:
+        log.warning("batch %d was recovered while being prepared; provider batch %s is ignored",
+                    batch_id, provider_batch_id)
+        return None
+    for doc_id, _ in included:
+        publish(doc_id, {"type": "status", "status": "batched", "batch_id": batch_id})
+    log.info("submitted batch %d (%s %s): %d document(s), %d page(s)",
+             batch_id, provider, provider_batch_id, len(included), len(pages))
+    return batch_id
+
+def poll(settings: Settings) -> int:
+    """Collects results of submitted batches that have ended; returns how many were collected."""
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        running = db.execute(
+            select(ExtractionBatch).where(ExtractionBatch.status == "submitted").order_by(ExtractionBatch.id)
+        ).scalars().all()
+
+    collected = 0
+    for batch in running:
+        # a batch is always read back through the provider that ran it
+        extractor = get_extractor(replace(settings, llm_provider=batch.provider))
+        try:
+            state = extractor.batch_status(batch.provider_batch_id)
+        except Exception as e:
+            log.warning("batch %d status check failed: %s", batch.id, e)
+            continue
+        if state == "in_progress":
+            continue
+        # claim it, so only one runner fans out the results
+        with sess_factory() as db:
+            won = db.execute(
+                update(ExtractionBatch)
+                .where(ExtractionBatch.id == batch.id, ExtractionBatch.status == "submitted")
+                .values(status="ended" if state == "ended" else "failed", ended_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+        if not won:
+            continue
+
+        results: dict[int, dict] = defaultdict(dict)
+        if state == "ended":
+            try:
+                for custom_id, result in extractor.batch_results(batch.provider_batch_id):
+                    doc_id, index = _parse_custom_id(custom_id)
+                    results[doc_id][index] = result
+            except Exception as e:
+                log.warning("batch %d results could not be read: %s", batch.id, e)
+                results.clear()
+        _fan_out(settings, batch.id, results)
+        collected += 1
+    return collected
+
+def recover(settings: Settings) -> int:
+    """
+    Re-queues documents stranded in batches that ended or failed without handing
+    them back (the runner died mid-way), and in batches stuck preparing (see
+    recover_preparing). Returns how many documents were re-queued.
+    """
+    recovered = recover_preparing(settings)
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        stranded = db.execute(
+            select(Document.id).join(ExtractionBatch, Document.batch_id == ExtractionBatch.id)
+            .where(Document.status == "batched", ExtractionBatch.status.in_(("ended", "failed")))
+        ).scalars().all()
+    for doc_id in stranded:
+        services.requeue_interactive(settings, doc_id, "batch interrupted; extracting individually")
+    return recovered + len(stranded)
+
+def recover_preparing(settings: Settings) -> int:
+    """
+    Fails batches still preparing after BATCH_PREPARE_TIMEOUT_S (the runner died between
+    claiming their documents and submitting) and re-queues their documents on the
+    interactive path. Returns how many documents were re-queued.
+    """
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        preparing = db.execute(
+            select(ExtractionBatch.id, ExtractionBatch.created_at).where(ExtractionBatch.status == "preparing")
+        ).all()
+    requeued = 0
+    for batch_id, created_at in preparing:
+        if _age_s(created_at) < settings.batch_prepare_timeout_s:
+            continue
+        with sess_factory() as db:
+            won = db.execute(
+                update(ExtractionBatch)
+                .where(ExtractionBatch.id == batch_id, ExtractionBatch.status == "preparing")
+                .values(status="failed", error="preparation interrupted", ended_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+            stranded = db.execute(
+                select(Document.id).where(Document.batch_id == batch_id, Document.status == "batched")
+            ).scalars().all() if won else []
+        for doc_id in stranded:
+            services.requeue_interactive(settings, doc_id, "batch interrupted; extracting individually")
+        requeued += len(stranded)
+    return requeued
+
+def stats(settings: Settings) -> dict:
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        batches = dict(db.execute(
+            select(ExtractionBatch.status, func.count()).group_by(ExtractionBatch.status)
+        ).all())
+        waiting = db.execute(
+            select(func.count()).select_from(Document)
+            .where(Document.priority == "bulk", Document.status == "queued")
+        ).scalar_one()
+    return {"batches": batches, "documents_waiting": waiting}
+
+def _fan_out(settings: Settings, batch_id: int, results: dict[int, dict]):
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        docs = db.execute(
+            select(Document).where(Document.batch_id == batch_id, Document.status == "batched")
+        ).scalars().all()
+    for doc in docs:
+        pages = results.get(doc.id, {})
+        expected = min(doc.page_count or 1, settings.max_pdf_pages)
+        errors = [r for r in pages.values() if isinstance(r, Exception)]
+        if errors or len(pages) < expected:
+            reason = f"batch returned no result: {errors[0]}" if errors else "batch returned no result"
+            services.requeue_interactive(settings, doc.id, reason)
+            continue
+        try:
+            file_hash = doc.content_sha256
+            if not file_hash:
+                with services.open_upload(settings, doc.storage_path) as (raw, _):
+                    file_hash = services.document_hash(doc, raw)
+            services.finish_extraction(settings, doc.id, file_hash, pages, doc.page_count or 1)
+        except Exception as e:
+            services.mark_failed(settings, doc.id, str(e))
+            publish(doc.id, {"type": "error", "message": str(e)})
+
+def _release(settings: Settings, doc_ids: list[int]):
+    if not doc_ids:
+        return
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        db.execute(
+            update(Document).where(Document.id.in_(doc_ids), Document.status == "batched")
+            .values(batch_id=None, status="queued")
+        )
+        db.commit()
+
+def _set_batch(settings: Settings, batch_id: int, **values):
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        db.execute(update(ExtractionBatch).where(ExtractionBatch.id == batch_id).values(**values))
+        db.commit()
+
+def _payload_bytes(pages: list[tuple[str, bytes, str]]) -> int:
+    # images travel base64-encoded inside the request
+    return sum(4 * ((len(data) + 2) // 3) for _, data, _ in pages)
+
+def _too_large(e: Exception) -> bool:
+    """Whether the provider refused a batch for its size (413, or a 400 saying so)."""
+    if getattr(e, "status_code", None) == 413:
+        return True
+    message = str(e).lower()
+    return getattr(e, "status_code", None) == 400 and ("too large" in message or "exceeds" in message)
+
+def _parse_custom_id(custom_id: str) -> tuple[int, int]:
+    # "doc-<document id>-p<page index>"
+    _, doc_id, page = custom_id.split("-")
+    return int(doc_id), int(page[1:])
+
+def _age_s(ts: datetime | None) -> float:
+    if ts is None:
+        return float("inf")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (datetime.utcnow() - ts).total_seconds()
+
+class BatchRunner:
+    """Daemon thread that submits and collects bulk batches every BATCH_POLL_INTERVAL_S."""
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="batch-runner", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            n = recover(self.settings)
+            if n:
+                log.info("re-queued %d document(s) from interrupted batches", n)
+        except Exception:
+            log.exception("batch recovery failed")
+        while True:
+            try:
+                n = recover_preparing(self.settings)
+                if n:
+                    log.info("re-queued %d document(s) from batches stuck preparing", n)
+                while collect(self.settings) is not None:
+                    pass
+                poll(self.settings)
+            except Exception:
+                log.exception("batch runner tick failed")
+            if self._stop.wait(self.settings.batch_poll_interval_s):
+                return
+
+    def stop(self, timeout: float | None = None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+_runner: BatchRunner | None = None
+_runner_lock = threading.Lock()
+
+def start_batch_runner(settings: Settings) -> BatchRunner:
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = BatchRunner(settings)
+                atexit.register(_runner.stop, 5)
+    return _runner
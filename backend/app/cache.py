@@ -0,0 +1,125 @@
+"""
+Content-addressed cache of extraction results.
+
+Key: sha256(file bytes) + provider + model + extraction version, where the version
+hashes the provider's system prompt, the ExtractedInvoice JSON schema, everything
+that decides which pages are sent and how (MAX_PDF_PAGES, the image budget settings),
+the provider's base URL and PIPELINE_VERSION. Changing any of those invalidates old
+entries automatically.
+
+Two tiers: a small in-process LRU, backed by the extraction_cache table so hits
+survive restarts and are shared between API and worker processes.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from sqlalchemy.exc import IntegrityError
+
+from .config import Settings
+from .db import get_session_factory
+from .models import ExtractionCacheEntry
+from .schemas import ExtractedInvoice
+from .image_budget import ImageBudget
+
+# Bump when the rendering/normalization pipeline changes in a way that can change results
+PIPELINE_VERSION = "3"
+
+_lock = threading.Lock()
+_lru: OrderedDict[str, str] = OrderedDict()  # cache_key -> extracted json
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _system_prompt(provider: str) -> str:
+    if provider == "anthropic":
+        from .llm.anthropic_provider import SYSTEM_PROMPT
+        return SYSTEM_PROMPT
+    if provider == "openai":
+        from .llm.openai_provider import SYSTEM_PROMPT
+        return SYSTEM_PROMPT
+    return ""
+
+def extractor_fingerprint(settings: Settings) -> tuple[str, str, str]:
+    """Returns (provider, model, version) for the configured extractor."""
+    provider = settings.llm_provider.lower()
+    model = {"anthropic": settings.anthropic_model, "openai": settings.openai_model}.get(provider, "")
+    schema = json.dumps(ExtractedInvoice.model_json_schema(), sort_keys=True)
+    budget = ImageBudget.from_settings(settings) if settings.image_budget_enabled else None
+    # a different endpoint (proxy, fake server) may answer differently under the same model name
+    base_url = {"anthropic": settings.anthropic_base_url, "openai": settings.openai_base_url}.get(provider)
+    version = hashlib.sha256(
+        f"{PIPELINE_VERSION}\n{_system_prompt(provider)}\n{schema}\n{budget!r}\n"
+        f"max_pdf_pages={settings.max_pdf_pages}\n{base_url or ''}".encode("utf-8")
+    ).hexdigest()[:16]
+    return provider, model, version
+
+def _key(settings: Settings, file_hash: str) -> tuple[str, tuple[str, str, str]]:
+    fp = extractor_fingerprint(settings)
+    return hashlib.sha256("|".join((file_hash, *fp)).encode("utf-8")).hexdigest(), fp
+
+def _remember(settings: Settings, key: str, payload: str):
+    with _lock:
+        _lru[key] = payload
+        _lru.move_to_end(key)
+        while len(_lru) > settings.cache_memory_entries:
+            _lru.popitem(last=False)
+
+def get(settings: Settings, file_hash: str) -> ExtractedInvoice | None:
+    if not settings.cache_enabled:
+        return None
+    key, _ = _key(settings, file_hash)
+
+    with _lock:
+        payload = _lru.get(key)
+        if payload is not None:
+            _lru.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return ExtractedInvoice.model_validate_json(payload)
+
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        entry = db.get(ExtractionCacheEntry, key)
+        payload = entry.extracted_json if entry else None
+
+    with _lock:
+        _stats["db_hits" if payload is not None else "misses"] += 1
+    if payload is None:
+        return None
+    _remember(settings, key, payload)
+    return ExtractedInvoice.model_validate_json(payload)
+
+def put(settings: Settings, file_hash: str, extracted: ExtractedInvoice):
+    if not settings.cache_enabled:
+        return
+    key, (provider, model, version) = _key(settings, file_hash)
+    payload = extracted.model_dump_json()
+    _remember(settings, key, payload)
+
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        db.add(ExtractionCacheEntry(
+            cache_key=key, content_hash=file_hash, provider=provider,
+            model=model, version=version, extracted_json=payload,
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same result first
+            db.rollback()
+            return
+    with _lock:
+        _stats["stores"] += 1
+
+def stats() -> dict:
+    with _lock:
+        hits = _stats["memory_hits"] + _stats["db_hits"]
+        lookups = hits + _stats["misses"]
+        return {
+            **_stats,
+            "hits": hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(_lru),
+        }
@@ -1,19 +1,98 @@
 import os
 from dataclasses import dataclass
 
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() not in ("0", "off", "false", "no")
+
 @dataclass(frozen=True)
 class Settings:
     app_host: str
     app_port: int
     database_url: str
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout_s: float
+    db_pool_recycle_s: int
+    sqlite_journal_mode: str
+    sqlite_synchronous: str
+    sqlite_busy_timeout_ms: int
+    sqlite_mmap_size_mb: int
+    sqlite_write_queue: bool
     upload_dir: str
+    storage_backend: str
+    s3_bucket: str
+    s3_prefix: str
+    s3_endpoint_url: str | None
+    s3_region: str | None
     max_upload_mb: int
+    bulk_max_files: int
+    bulk_max_mb: int
     llm_provider: str
     openai_api_key: str
     openai_model: str
     anthropic_api_key: str
     anthropic_model: str
+    openai_base_url: str | None
+    anthropic_base_url: str | None
+    llm_max_connections: int
+    llm_timeout_s: float
+    anthropic_rpm: int
+    anthropic_tpm: int
+    openai_rpm: int
+    openai_tpm: int
+    llm_max_retries: int
+    llm_backoff_base_s: float
+    llm_backoff_max_s: float
+    llm_breaker_threshold: int
+    llm_breaker_cooldown_s: float
+    fake_llm_latency_ms: float
+    fake_llm_jitter_ms: float
+    fake_llm_error_rate: float
+    fake_llm_failure_rate: float
     case_study_xlsx_path: str | None
+    seed_mode: str
+    worker_concurrency: int
+    worker_queue_size: int
+    worker_drain_timeout_s: float
+    worker_metrics_port: int
+    tracing: str
+    trace_file: str
+    trace_otlp_endpoint: str
+    trace_sample_ratio: float
+    trace_service_name: str
+    anthropic_max_concurrency: int
+    openai_max_concurrency: int
+    job_queue: str
+    job_lease_s: int
+    job_max_attempts: int
+    job_backoff_base_s: float
+    job_backoff_max_s: float
+    job_poll_interval_s: float
+    cache_enabled: bool
+    cache_memory_entries: int
+    max_pdf_pages: int
+    render_processes: int
+    image_budget_enabled: bool
+    image_max_edge: int
+    image_max_bytes: int
+    image_format: str
+    image_quality: int
+    image_grayscale: bool
+    image_crop_margins: bool
+    batch_max_requests: int
+    batch_max_bytes: int
+    batch_max_wait_s: float
+    batch_poll_interval_s: float
+    batch_prepare_timeout_s: float
+    event_bus: str
+    event_poll_interval_s: float
+    event_retention_s: float
+    sse_heartbeat_s: float
+    sse_max_streams_per_doc: int
+
+    def __post_init__(self):
+        if self.max_pdf_pages < 1:
+            raise ValueError(f"MAX_PDF_PAGES must be at least 1 (got {self.max_pdf_pages})")
 
     @staticmethod
     def from_env() -> "Settings":
@@ -21,12 +100,84 @@ class Settings:
             app_host=os.getenv("APP_HOST", "0.0.0.0"),
             app_port=int(os.getenv("APP_PORT", "8000")),
             database_url=os.getenv("DATABASE_URL", "sqlite:///./data/app.db"),
+            db_pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            db_pool_timeout_s=float(os.getenv("DB_POOL_TIMEOUT_S", "30")),
+            db_pool_recycle_s=int(os.getenv("DB_POOL_RECYCLE_S", "1800")),
+            sqlite_journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "wal").lower(),
+            sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", "normal").lower(),
+            sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000")),
+            sqlite_mmap_size_mb=int(os.getenv("SQLITE_MMAP_SIZE_MB", "256")),
+            sqlite_write_queue=_flag("SQLITE_WRITE_QUEUE", "on"),
             upload_dir=os.getenv("UPLOAD_DIR", "./data/uploads"),
+            storage_backend=os.getenv("STORAGE_BACKEND", "local").lower(),
+            s3_bucket=os.getenv("S3_BUCKET", ""),
+            s3_prefix=os.getenv("S3_PREFIX", "uploads/"),
+            s3_endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            s3_region=os.getenv("S3_REGION") or None,
             max_upload_mb=int(os.getenv("MAX_UPLOAD_MB", "20")),
+            bulk_max_files=int(os.getenv("BULK_MAX_FILES", "1000")),
+            bulk_max_mb=int(os.getenv("BULK_MAX_MB", "500")),
             llm_provider=os.getenv("LLM_PROVIDER", "anthropic"),
             openai_api_key=os.getenv("OPENAI_API_KEY", ""),
             openai_model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
             anthropic_api_key=os.getenv("ANTHROPIC_API_KEY", ""),
             anthropic_model=os.getenv("ANTHROPIC_DEFAULT_MODEL", "claude-3-5-sonnet-20240620"),
+            openai_base_url=os.getenv("OPENAI_BASE_URL") or None,
+            anthropic_base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+            llm_max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            llm_timeout_s=float(os.getenv("LLM_TIMEOUT_S", "120")),
+            anthropic_rpm=int(os.getenv("ANTHROPIC_RPM", "0")),
+            anthropic_tpm=int(os.getenv("ANTHROPIC_TPM", "0")),
+            openai_rpm=int(os.getenv("OPENAI_RPM", "0")),
+            openai_tpm=int(os.getenv("OPENAI_TPM", "0")),
+            llm_max_retries=int(os.getenv("LLM_MAX_RETRIES", "6")),
+            llm_backoff_base_s=float(os.getenv("LLM_BACKOFF_BASE_S", "1")),
+            llm_backoff_max_s=float(os.getenv("LLM_BACKOFF_MAX_S", "60")),
+            llm_breaker_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            llm_breaker_cooldown_s=float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30")),
+            fake_llm_latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "500")),
+            fake_llm_jitter_ms=float(os.getenv("FAKE_LLM_JITTER_MS", "0")),
+            fake_llm_error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            fake_llm_failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
             case_study_xlsx_path=os.getenv("CASE_STUDY_XLSX_PATH") or None,
+            seed_mode=os.getenv("SEED_MODE", "empty").lower(),
+            worker_concurrency=int(os.getenv("WORKER_CONCURRENCY", "4")),
+            worker_queue_size=int(os.getenv("WORKER_QUEUE_SIZE", "1000")),
+            worker_drain_timeout_s=float(os.getenv("WORKER_DRAIN_TIMEOUT_S", "30")),
+            worker_metrics_port=int(os.getenv("WORKER_METRICS_PORT", "0")),
+            tracing=os.getenv("TRACING", "off").lower(),
+            trace_file=os.getenv("TRACE_FILE", "./data/traces.jsonl"),
+            trace_otlp_endpoint=os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces"),
+            trace_sample_ratio=float(os.getenv("TRACE_SAMPLE_RATIO", "1.0")),
+            trace_service_name=os.getenv("TRACE_SERVICE_NAME", "invoice-extraction"),
+            anthropic_max_concurrency=int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "4")),
+            openai_max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")),
+            job_queue=os.getenv("JOB_QUEUE", "memory"),
+            job_lease_s=int(os.getenv("JOB_LEASE_S", "300")),
+            job_max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+            job_backoff_base_s=float(os.getenv("JOB_BACKOFF_BASE_S", "5")),
+            job_backoff_max_s=float(os.getenv("JOB_BACKOFF_MAX_S", "600")),
+            job_poll_interval_s=float(os.getenv("JOB_POLL_INTERVAL_S", "1.0")),
+            cache_enabled=_flag("EXTRACTION_CACHE", "on"),
+            cache_memory_entries=int(os.getenv("EXTRACTION_CACHE_MEMORY_ENTRIES", "256")),
+            max_pdf_pages=int(os.getenv("MAX_PDF_PAGES", "20")),
+            render_processes=int(os.getenv("RENDER_PROCESSES", "2")),
+            image_budget_enabled=_flag("IMAGE_BUDGET", "on"),
+            image_max_edge=int(os.getenv("IMAGE_MAX_EDGE", "1568")),
+            image_max_bytes=int(os.getenv("IMAGE_MAX_BYTES", "1500000")),
+            image_format=os.getenv("IMAGE_FORMAT", "auto").lower(),
+            image_quality=int(os.getenv("IMAGE_QUALITY", "85")),
+            image_grayscale=_flag("IMAGE_GRAYSCALE", "on"),
+            image_crop_margins=_flag("IMAGE_CROP_MARGINS", "on"),
+            batch_max_requests=int(os.getenv("BATCH_MAX_REQUESTS", "500")),
+            batch_max_bytes=int(os.getenv("BATCH_MAX_BYTES", str(100 * 1024 * 1024))),
+            batch_max_wait_s=float(os.getenv("BATCH_MAX_WAIT_S", "300")),
+            batch_poll_interval_s=float(os.getenv("BATCH_POLL_INTERVAL_S", "30")),
+            batch_prepare_timeout_s=float(os.getenv("BATCH_PREPARE_TIMEOUT_S", "1800")),
+            event_bus=os.getenv("EVENT_BUS", "memory").lower(),
+            event_poll_interval_s=float(os.getenv("EVENT_POLL_INTERVAL_S", "0.5")),
+            event_retention_s=float(os.getenv("EVENT_RETENTION_S", "86400")),
+            sse_heartbeat_s=float(os.getenv("SSE_HEARTBEAT_S", "15")),
+            sse_max_streams_per_doc=int(os.getenv("SSE_MAX_STREAMS_PER_DOC", "10")),
         )
@@ -1,26 +1,158 @@
+import logging
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
+from . import tracing
+
+log = logging.getLogger("app.db")
+
 _engine = None
 _SessionLocal = None
 
+SQLITE_JOURNAL_MODES = {"wal", "delete", "truncate", "persist", "memory"}
+SQLITE_SYNCHRONOUS = {"off", "normal", "full", "extra"}
+
 class Base(DeclarativeBase):
     pass
 
 def get_engine(settings):
     global _engine
     if _engine is None:
-        _engine = create_engine(settings.database_url, future=True)
+        _engine = build_engine(settings)
+        tracing.instrument_engine(_engine)
     return _engine
 
+def build_engine(settings):
+    """
+    Engine for DATABASE_URL with the pool sized from DB_POOL_* settings. SQLite
+    connections get the SQLITE_* pragma profile: WAL lets readers run while one
+    connection writes, synchronous=NORMAL fsyncs at checkpoints instead of every
+    commit (safe in WAL mode), busy_timeout makes a blocked writer wait instead of
+    failing with "database is locked", and mmap_size serves reads from the page cache.
+    """
+    url = settings.database_url
+    if not is_sqlite(settings):
+        return create_engine(url, future=True, pool_size=settings.db_pool_size,
+                             max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout_s,
+                             pool_recycle=settings.db_pool_recycle_s, pool_pre_ping=True)
+
+    if settings.sqlite_journal_mode not in SQLITE_JOURNAL_MODES:
+        raise RuntimeError(f"Unsupported SQLITE_JOURNAL_MODE: {settings.sqlite_journal_mode}")
+    if settings.sqlite_synchronous not in SQLITE_SYNCHRONOUS:
+        raise RuntimeError(f"Unsupported SQLITE_SYNCHRONOUS: {settings.sqlite_synchronous}")
+    pool = {}
+    if ":memory:" not in url and url.rstrip("/") != "sqlite:":
+        # file databases use a QueuePool; in-memory ones keep SQLAlchemy's default
+        pool = dict(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow,
+                    pool_timeout=settings.db_pool_timeout_s)
+    engine = create_engine(url, future=True, connect_args={
+        "check_same_thread": False,
+        "timeout": settings.sqlite_busy_timeout_ms / 1000,
+    }, **pool)
+    pragmas = (
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}",
+    )
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cur.execute(pragma)
+        cur.close()
+
+    return engine
+
+def is_postgres(settings) -> bool:
+    return settings.database_url.startswith(("postgresql", "postgres"))
+
+def is_sqlite(settings) -> bool:
+    return settings.database_url.startswith("sqlite")
+
 def get_session_factory(settings):
     global _SessionLocal
     if _SessionLocal is None:
         engine = get_engine(settings)
         _SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False, future=True)
+        if is_sqlite(settings) and settings.sqlite_write_queue:
+            _write_queue.install(_SessionLocal, settings.sqlite_busy_timeout_ms / 1000)
     return _SessionLocal
 
+class WriteQueue:
+    """
+    Serializes SQLite write transactions within the process (SQLITE_WRITE_QUEUE).
+
+    SQLite allows one writer at a time. Without this, concurrent extraction threads
+    all take the database lock themselves and sit in busy_timeout retries (polling,
+    with backoff) or give up with "database is locked". Here a session waits its turn
+    on a lock from its first write (flush or INSERT/UPDATE/DELETE) until its
+    transaction ends, so writers hand over directly. Reads never wait. Writers in
+    other processes (python -m app.worker) are still arbitrated by busy_timeout.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"writes": 0, "waited": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0, "timeouts": 0}
+        self._timeout_s = 10.0
+
+    def install(self, session_factory, timeout_s: float):
+        self._timeout_s = timeout_s
+        event.listen(session_factory, "before_flush", self._on_flush)
+        event.listen(session_factory, "do_orm_execute", self._on_execute)
+        event.listen(session_factory, "after_transaction_end", self._on_transaction_end)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {**self._stats, "wait_ms_total": round(self._stats["wait_ms_total"], 1),
+                    "wait_ms_max": round(self._stats["wait_ms_max"], 1)}
+
+    def _acquire(self, session):
+        if session.info.get("holds_write_lock"):
+            return
+        t0 = time.perf_counter()
+        acquired = self._lock.acquire(blocking=False)
+        waited = not acquired
+        if not acquired:
+            acquired = self._lock.acquire(timeout=self._timeout_s)
+        wait_ms = (time.perf_counter() - t0) * 1000
+        with self._stats_lock:
+            self._stats["writes"] += 1
+            if waited:
+                self._stats["waited"] += 1
+                self._stats["wait_ms_total"] += wait_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+            if not acquired:
+                self._stats["timeouts"] += 1
+        if waited:
+            tracing.record_span("db.write_queue_wait", wait_ms / 1000)
+        if not acquired:
+            # a stuck writer must not stall everyone forever: fall back to SQLite's own locking
+            log.warning("write queue wait exceeded %.1fs; writing without it", self._timeout_s)
+            return
+        session.info["holds_write_lock"] = True
+
+    def _on_flush(self, session, _flush_context, _instances):
+        self._acquire(session)
+
+    def _on_execute(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            self._acquire(state.session)
+
+    def _on_transaction_end(self, session, transaction):
+        if transaction.parent is None and session.info.pop("holds_write_lock", False):
+            self._lock.release()
+
+_write_queue = WriteQueue()
+
+def write_queue_stats(settings) -> dict | None:
+    return _write_queue.stats() if is_sqlite(settings) and settings.sqlite_write_queue else None
+
 def init_db(settings):
     os.makedirs(os.path.dirname(settings.upload_dir), exist_ok=True)
     os.makedirs(settings.upload_dir, exist_ok=True)
@@ -31,3 +163,32 @@ def init_db(settings):
     from . import models  # noqa: F401
     engine = get_engine(settings)
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    _add_missing_indexes(engine)
+
+def _add_missing_columns(engine):
+    # create_all() never alters existing tables; add new nullable columns so older
+    # databases keep working after a model gains a field
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+                col_type = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{col.name}" {col_type}'))
+
+def _add_missing_indexes(engine):
+    # likewise for indexes declared after a table was created
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn)
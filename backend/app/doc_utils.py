@@ -1,53 +1,216 @@
 from __future__ import annotations
 import io
+import mmap
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterator
 from PIL import Image
 import pypdfium2 as pdfium
 
+from .image_budget import ImageBudget, fit_to_budget, render_scale
+
 # Supported image MIME types
 SUPPORTED_IMAGE_TYPES = {
     "image/png", "image/jpeg", "image/jpg", "image/gif", 
     "image/webp", "image/tiff", "image/bmp"
 }
 
-def normalize_to_png_bytes(file_bytes: bytes, content_type: str) -> bytes:
-    """
-    Returns a single PNG image bytes for the first page.
-    - If PDF: renders page 1 to an image.
-    - If image: converts to PNG.
-    
-    Raises ValueError for unsupported file types.
-    """
-    # Check for PDF
-    if content_type == "application/pdf" or file_bytes[:4] == b"%PDF":
-        try:
-            pdf = pdfium.PdfDocument(file_bytes)
-            page = pdf.get_page(0)
-            pil_image = page.render(scale=2.0).to_pil()
-            page.close()
-            pdf.close()
-            return pil_to_png_bytes(pil_image)
-        except Exception as e:
-            raise ValueError(f"Failed to process PDF: {str(e)}")
+PDF_RENDER_SCALE = 2.0
+
+# Largest image forwarded untouched when no image budget is configured
+PASSTHROUGH_MAX_EDGE = 8000
+PASSTHROUGH_MAX_BYTES = 3_500_000
+
+_render_pool: ProcessPoolExecutor | None = None
+_render_pool_lock = threading.Lock()
+# pdfium is not thread-safe: every use of it in this process (page counts, single-page
+# renders on extraction threads) goes through this lock, or concurrent uploads crash the process
+_pdfium_lock = threading.Lock()
 
+@dataclass
+class RenderedPage:
+    index: int         # 0-based page number
+    page_count: int    # pages in the file (may exceed the number rendered)
+    data: bytes
+    media_type: str
+    render_ms: float   # rasterizing / decoding
+    encode_ms: float   # image budget (crop, downscale, re-encode) or PNG encode
+    source_bytes: int | None = None   # original upload size, for images
+    wait_ms: float = 0.0   # waiting for _pdfium_lock before rendering (not part of render_ms)
+
+def load_image(file_bytes: bytes, content_type: str) -> Image.Image:
+    """Decodes an image upload to RGB. Raises ValueError for unsupported file types."""
     # Check for supported image types
     if content_type and content_type.startswith("image/"):
         try:
-            img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-            return pil_to_png_bytes(img)
+            return Image.open(_image_file(file_bytes)).convert("RGB")
         except Exception as e:
             raise ValueError(f"Failed to process image: {str(e)}")
-    
+
     # Try to open as image anyway (for cases where content_type is wrong)
     try:
-        img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-        return pil_to_png_bytes(img)
+        return Image.open(_image_file(file_bytes)).convert("RGB")
     except Exception:
         raise ValueError(
             f"Unsupported file type: {content_type}. "
             "Please upload a PDF or image file (PNG, JPEG, GIF, WEBP, TIFF, BMP)."
         )
 
+def _image_file(file_bytes):
+    # A memory-mapped upload is already a seekable file; wrapping it in BytesIO would copy it
+    if isinstance(file_bytes, mmap.mmap):
+        file_bytes.seek(0)
+        return file_bytes
+    return io.BytesIO(file_bytes)
+
 def pil_to_png_bytes(img: Image.Image) -> bytes:
     buf = io.BytesIO()
     img.save(buf, format="PNG")
     return buf.getvalue()
+
+def is_pdf(file_bytes: bytes, content_type: str | None) -> bool:
+    return content_type == "application/pdf" or file_bytes[:4] == b"%PDF"
+
+def iter_rendered_pages(file_bytes: bytes, content_type: str, max_pages: int = 20,
+                        processes: int = 2, budget: ImageBudget | None = None,
+                        passthrough_types: set[str] | frozenset[str] | None = None,
+                        source_path: str | None = None) -> Iterator[RenderedPage]:
+    """
+    Yields one image per page, in completion order (check `index`), as soon as each is ready.
+    - PDF: multi-page documents are rendered in parallel in a process pool
+      (pdfium is not thread-safe), capped at `max_pages`.
+    - Image: a single page. If its real format is in `passthrough_types` and it already
+      fits the size limits, the original bytes are forwarded without decoding.
+    With a `budget`, pages are rendered at a size-dependent scale and shrunk/re-encoded
+    per ImageBudget; without one, PDFs render at PDF_RENDER_SCALE to lossless PNG.
+    `file_bytes` may be a memory-mapped file; pass its `source_path` too, so PDF pages
+    are rendered from the file and the render processes never get a copy of it.
+
+    Raises ValueError for unsupported or unreadable files.
+    """
+    if not is_pdf(file_bytes, content_type):
+        t0 = time.perf_counter()
+        media_type = _passthrough_media_type(file_bytes, budget, passthrough_types)
+        if media_type:
+            ms = (time.perf_counter() - t0) * 1000
+            yield RenderedPage(0, 1, bytes(file_bytes), media_type, ms, 0.0, source_bytes=len(file_bytes))
+            return
+        img = load_image(file_bytes, content_type)
+        render_ms = (time.perf_counter() - t0) * 1000
+        data, media_type, encode_ms = _encode_page(img, budget)
+        yield RenderedPage(0, 1, data, media_type, render_ms, encode_ms, source_bytes=len(file_bytes))
+        return
+
+    source = source_path or file_bytes
+    try:
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(source)
+            page_count = len(pdf)
+            pdf.close()
+    except Exception as e:
+        raise ValueError(f"Failed to process PDF: {str(e)}")
+    if page_count == 0:
+        raise ValueError("Failed to process PDF: document has no pages")
+    n = min(page_count, max_pages)
+
+    if n == 1 or processes <= 1:
+        for i in range(n):
+            yield _pdf_page(i, page_count, _render_pdf_page(source, i, budget))
+        return
+
+    pool = _get_render_pool(processes)
+    futures = {pool.submit(_render_pdf_page, source, i, budget): i for i in range(n)}
+    try:
+        for fut in as_completed(futures):
+            yield _pdf_page(futures[fut], page_count, fut.result())
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+def sniff_image_type(header: bytes) -> str | None:
+    """Media type from the file's magic bytes (first 12 are enough), or None."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    if header[:2] == b"BM":
+        return "image/bmp"
+    return None
+
+def _passthrough_media_type(file_bytes: bytes, budget: ImageBudget | None,
+                            passthrough_types) -> str | None:
+    # Forward the upload as-is when the provider accepts its format and it is within
+    # the size limits: skips a full decode + PNG re-encode, which for photos is slow
+    # and usually produces a bigger file
+    if not passthrough_types:
+        return None
+    media_type = sniff_image_type(file_bytes[:12])
+    if media_type not in passthrough_types:
+        return None
+    max_edge = budget.max_edge if budget else PASSTHROUGH_MAX_EDGE
+    max_bytes = budget.max_bytes if budget else PASSTHROUGH_MAX_BYTES
+    if len(file_bytes) > max_bytes:
+        return None
+    try:
+        # Image.open only parses the header; pixel data is not decoded here
+        with Image.open(_image_file(file_bytes)) as img:
+            if max(img.size) > max_edge or getattr(img, "is_animated", False):
+                return None
+    except Exception:
+        return None
+    return media_type
+
+def _pdf_page(index: int, page_count: int, rendered: tuple) -> RenderedPage:
+    data, media_type, render_ms, encode_ms, wait_ms = rendered
+    return RenderedPage(index, page_count, data, media_type, render_ms, encode_ms, wait_ms=wait_ms)
+
+def _render_pdf_page(source: bytes | str, index: int,
+                     budget: ImageBudget | None) -> tuple[bytes, str, float, float, float]:
+    # Runs inside the render pool; must stay a module-level function so it pickles.
+    # `source` is the PDF's bytes or, cheaper to send, its path.
+    t0 = time.perf_counter()
+    try:
+        with _pdfium_lock:
+            wait_ms = (time.perf_counter() - t0) * 1000
+            pdf = pdfium.PdfDocument(source)
+            page = pdf.get_page(index)
+            if budget:
+                scale = render_scale(*page.get_size(), budget.max_edge)
+            else:
+                scale = PDF_RENDER_SCALE
+            pil_image = page.render(scale=scale, grayscale=bool(budget and budget.grayscale)).to_pil()
+            page.close()
+            pdf.close()
+    except Exception as e:
+        raise ValueError(f"Failed to render PDF page {index + 1}: {str(e)}")
+    render_ms = (time.perf_counter() - t0) * 1000 - wait_ms
+    data, media_type, encode_ms = _encode_page(pil_image, budget)
+    return data, media_type, render_ms, encode_ms, wait_ms
+
+def _encode_page(img: Image.Image, budget: ImageBudget | None) -> tuple[bytes, str, float]:
+    if budget is None:
+        t0 = time.perf_counter()
+        png = pil_to_png_bytes(img)
+        return png, "image/png", (time.perf_counter() - t0) * 1000
+    enc = fit_to_budget(img, budget)
+    return enc.data, enc.media_type, enc.encode_ms
+
+def _get_render_pool(processes: int) -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        with _render_pool_lock:
+            if _render_pool is None:
+                # spawn, not fork: the parent is a multi-threaded server process
+                _render_pool = ProcessPoolExecutor(
+                    max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _render_pool
@@ -1,23 +1,298 @@
+"""
+Per-document event bus behind the SSE endpoint.
+
+EVENT_BUS=memory (default) fans events out inside this process only, which is fine
+for the dev server. EVENT_BUS=db appends every event to the document_events table,
+so a stream served by any API process (gunicorn worker) sees events published by
+any other process, including `python -m app.worker`. Postgres wakes listeners with
+LISTEN/NOTIFY; other databases are polled every EVENT_POLL_INTERVAL_S.
+
+Every event gets an id, sent as the SSE `id:` field. A reconnecting browser sends
+it back as Last-Event-ID and gets the events it missed; a new stream replays the
+document's history first, so events published between the upload and the browser
+subscribing are not lost. Ids are not guaranteed to arrive in order (concurrent
+publishers; on Postgres a lower id can commit after a higher one), so a stream
+remembers which ids it sent within the last `lookback` ids instead of only the
+highest, and a reconnect replays from `lookback` ids below Last-Event-ID: events that
+showed up late are not lost, at the price of possibly repeating a few. Events are
+status updates, so a repeat is harmless.
+
+Upload batches have a channel of their own (upload_batch_channel()): each document of
+the batch that changes status posts a bare "progress" nudge there, and the batch's
+stream re-reads its counts when woken instead of polling the database.
+"""
+from __future__ import annotations
+import json
+import logging
 import queue
-from collections import defaultdict
+import select as _select
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select, text
+
+from .db import get_engine, get_session_factory, is_postgres
+from .models import DocumentEvent
+
+log = logging.getLogger("app.events")
+
+def upload_batch_channel(upload_id: int) -> int:
+    """Bus key of an upload batch's progress nudges; negative, so it never collides with a document id."""
+    return -upload_id
+
+class StreamLimitReached(RuntimeError):
+    """Too many open streams for one document."""
+
+class Subscription:
+    """
+    (event_id, event) pairs for one SSE stream, each id at most once. Ids more than
+    `window` below the highest one sent are dropped (they can no longer be re-read);
+    within the window, lower ids that arrive late are still delivered.
+    """
+
+    def __init__(self, doc_id: int, last_id: int = 0, window: int = 0):
+        self.doc_id = doc_id
+        self.last_id = last_id  # highest id sent (or the client's Last-Event-ID)
+        self.window = window
+        self._seen: set[int] = {last_id} if last_id else set()
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    @property
+    def replay_from(self) -> int:
+        """Ids above this may still be missing from the stream."""
+        return max(0, self.last_id - self.window)
+
+    def deliver(self, event_id: int, event: dict):
+        with self._lock:
+            if event_id in self._seen or event_id <= self.replay_from:
+                return
+            self._seen.add(event_id)
+            if event_id > self.last_id:
+                self.last_id = event_id
+                floor = self.replay_from
+                self._seen = {i for i in self._seen if i > floor}
+        self._queue.put_nowait((event_id, event))
+
+    def get(self, timeout: float | None = None) -> tuple[int, dict]:
+        return self._queue.get(timeout=timeout)
+
+class InProcessBus:
+    history_per_doc = 200
+    history_docs = 1000
+    lookback = 100
+
+    def __init__(self):
+        self._subs: dict[int, list[Subscription]] = defaultdict(list)
+        self._lock = threading.Lock()
+        # Millisecond-based start, so ids keep growing across restarts and a browser's
+        # Last-Event-ID from before a restart does not hide new events
+        self._next_id = int(time.time() * 1000)
+        self._history: OrderedDict[int, deque] = OrderedDict()
+
+    def publish(self, doc_id: int, event: dict) -> int | None:
+        with self._lock:
+            self._next_id += 1
+            event_id = self._next_id
+            history = self._history.pop(doc_id, None) or deque(maxlen=self.history_per_doc)
+            history.append((event_id, event))
+            self._history[doc_id] = history
+            if len(self._history) > self.history_docs:
+                self._history.popitem(last=False)
+            subs = list(self._subs.get(doc_id, []))
+        for sub in subs:
+            sub.deliver(event_id, event)
+        return event_id
+
+    def subscribe(self, doc_id: int, last_event_id: int | None = None,
+                  max_streams: int | None = None, replay: bool = True) -> Subscription:
+        sub = Subscription(doc_id, last_event_id or 0, self.lookback)
+        with self._lock:
+            self._add(sub, max_streams)
+            for event_id, event in self._history.get(doc_id, ()) if replay else ():
+                sub.deliver(event_id, event)
+        return sub
+
+    def _add(self, sub: Subscription, max_streams: int | None):
+        # caller holds self._lock
+        streams = self._subs[sub.doc_id]
+        if max_streams and len(streams) >= max_streams:
+            if not streams:
+                self._subs.pop(sub.doc_id, None)
+            raise StreamLimitReached(f"too many open streams for document {sub.doc_id} (max {max_streams})")
+        streams.append(sub)
 
-# doc_id -> list[queue.Queue]
-_subscribers: dict[int, list[queue.Queue]] = defaultdict(list)
+    def unsubscribe(self, doc_id: int, sub: Subscription):
+        with self._lock:
+            if sub in self._subs.get(doc_id, []):
+                self._subs[doc_id].remove(sub)
+                if not self._subs[doc_id]:
+                    self._subs.pop(doc_id, None)
 
-def subscribe(doc_id: int) -> queue.Queue:
-    q: queue.Queue = queue.Queue()
-    _subscribers[doc_id].append(q)
-    return q
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "streams": sum(len(s) for s in self._subs.values())}
 
-def publish(doc_id: int, event: dict):
-    for q in list(_subscribers.get(doc_id, [])):
+class DatabaseBus(InProcessBus):
+    """
+    Events live in the document_events table. A new stream replays its document's rows,
+    then one listener thread per process delivers new rows to all local streams.
+    """
+    channel = "document_events"
+    prune_every_s = 300
+
+    def __init__(self, settings):
+        super().__init__()
+        self.settings = settings
+        self._wake = threading.Event()
+        self._poll_lock = threading.Lock()
+        self._listener: threading.Thread | None = None
+        self._last_prune = 0.0
+        self._listen_conn = None
+        self._cursor = 0
+
+    def publish(self, doc_id: int, event: dict) -> int | None:
         try:
-            q.put_nowait(event)
-        except Exception:
-            pass
-
-def unsubscribe(doc_id: int, q: queue.Queue):
-    if doc_id in _subscribers and q in _subscribers[doc_id]:
-        _subscribers[doc_id].remove(q)
-        if not _subscribers[doc_id]:
-            _subscribers.pop(doc_id, None)
+            with get_session_factory(self.settings)() as db:
+                row = DocumentEvent(document_id=doc_id, type=event.get("type", "message"),
+                                    payload=json.dumps(event))
+                db.add(row)
+                db.flush()
+                if is_postgres(self.settings):
+                    db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                               {"channel": self.channel, "payload": str(doc_id)})
+                db.commit()
+                event_id = row.id
+        except Exception as e:
+            # a lost progress event must never fail the extraction that published it
+            log.warning("could not publish event for document %s: %s", doc_id, e)
+            return None
+        self._wake.set()
+        return event_id
+
+    def subscribe(self, doc_id: int, last_event_id: int | None = None,
+                  max_streams: int | None = None, replay: bool = True) -> Subscription:
+        sub = Subscription(doc_id, last_event_id or 0, self.lookback)
+        self._ensure_listener()
+        self._replay(sub, max_streams, replay)
+        return sub
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "db"}
+
+    def _ensure_listener(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+                    self._listener.start()
+
+    def _listen(self):
+        with get_session_factory(self.settings)() as db:
+            self._cursor = db.execute(select(func.max(DocumentEvent.id))).scalar() or 0
+        conn = self._pg_listen_connection()
+        interval = self.settings.event_poll_interval_s
+        while True:
+            try:
+                if conn is not None:
+                    if _select.select([conn], [], [], interval) != ([], [], []):
+                        conn.poll()
+                        conn.notifies.clear()
+                else:
+                    self._wake.wait(interval)
+                self._wake.clear()
+                self._poll()
+                self._maybe_prune()
+            except Exception:
+                log.exception("event listener failed; retrying")
+                time.sleep(interval)
+
+    def _pg_listen_connection(self):
+        if not is_postgres(self.settings):
+            return None
+        try:
+            # keep the pool's wrapper referenced, or the connection goes back to the pool
+            self._listen_conn = get_engine(self.settings).raw_connection()
+            raw = self._listen_conn.driver_connection
+            if not hasattr(raw, "notifies") or not hasattr(raw, "poll"):
+                return None  # not psycopg2: fall back to polling
+            raw.autocommit = True
+            with raw.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            return raw
+        except Exception as e:
+            log.warning("LISTEN unavailable, polling for events instead: %s", e)
+            return None
+
+    def _replay(self, sub: Subscription, max_streams: int | None, replay: bool = True):
+        # Under the poll lock, so the listener cannot deliver a newer event to this
+        # stream before its backlog
+        with self._poll_lock:
+            with self._lock:
+                self._add(sub, max_streams)
+            if not replay:
+                return
+            with get_session_factory(self.settings)() as db:
+                rows = db.execute(
+                    select(DocumentEvent.id, DocumentEvent.payload)
+                    .where(DocumentEvent.document_id == sub.doc_id, DocumentEvent.id > sub.replay_from)
+                    .order_by(DocumentEvent.id)
+                ).all()
+            for row in rows:
+                sub.deliver(row.id, json.loads(row.payload))
+
+    def _poll(self):
+        with self._poll_lock:
+            with self._lock:
+                by_doc = {doc_id: list(subs) for doc_id, subs in self._subs.items() if subs}
+            if not by_doc:
+                return
+            # Rows just below the cursor are re-read: on Postgres a lower id can commit after
+            # a higher one. Each stream skips the ids it has already sent (Subscription keeps
+            # them for the same `lookback` window).
+            since = self._cursor - self.lookback
+            doc_ids = list(by_doc)
+            with get_session_factory(self.settings)() as db:
+                for i in range(0, len(doc_ids), 500):
+                    rows = db.execute(
+                        select(DocumentEvent.id, DocumentEvent.document_id, DocumentEvent.payload)
+                        .where(DocumentEvent.id > since, DocumentEvent.document_id.in_(doc_ids[i:i + 500]))
+                        .order_by(DocumentEvent.id)
+                    ).all()
+                    for row in rows:
+                        self._cursor = max(self._cursor, row.id)
+                        event = json.loads(row.payload)
+                        for sub in by_doc[row.document_id]:
+                            sub.deliver(row.id, event)
+
+    def _maybe_prune(self):
+        if time.monotonic() - self._last_prune < self.prune_every_s:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.settings.event_retention_s)
+        with get_session_factory(self.settings)() as db:
+            db.execute(delete(DocumentEvent).where(DocumentEvent.created_at < cutoff))
+            db.commit()
+
+_bus: InProcessBus = InProcessBus()
+
+def configure(settings):
+    """Selects the backend from EVENT_BUS; call once per process before serving streams."""
+    global _bus
+    if settings.event_bus == "db" and not isinstance(_bus, DatabaseBus):
+        _bus = DatabaseBus(settings)
+
+def subscribe(doc_id: int, last_event_id: int | None = None, max_streams: int | None = None,
+              replay: bool = True) -> Subscription:
+    """`replay=False` skips the channel's history (for streams that read their state themselves)."""
+    return _bus.subscribe(doc_id, last_event_id, max_streams, replay)
+
+def publish(doc_id: int, event: dict) -> int | None:
+    return _bus.publish(doc_id, event)
+
+def unsubscribe(doc_id: int, sub: Subscription):
+    _bus.unsubscribe(doc_id, sub)
+
+def stats() -> dict:
+    return _bus.stats()
@@ -0,0 +1,113 @@
+"""
+Image budget: shrinks page images before they are base64'd and sent to the LLM.
+
+Rendering resolution is picked from the page size so the long edge lands on
+IMAGE_MAX_EDGE pixels, white margins are cropped, the page is converted to
+grayscale and re-encoded under IMAGE_MAX_BYTES. Invoices are black-on-white
+text, so this keeps legibility while cutting payload size (and vision token
+cost, which scales with pixel count).
+
+IMAGE_FORMAT=auto encodes both grayscale PNG and JPEG and keeps the smaller:
+PNG wins on clean rendered PDFs (flat white, few grey levels), JPEG on photos
+and scans.
+"""
+from __future__ import annotations
+import io
+import time
+from dataclasses import dataclass
+from PIL import Image
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+# PDF points are 1/72 inch, so render scale 1.0 == 72 DPI
+MIN_RENDER_SCALE = 0.5
+MAX_RENDER_SCALE = 4.0
+MIN_QUALITY = 45
+
+@dataclass(frozen=True)
+class ImageBudget:
+    max_edge: int = 1568
+    max_bytes: int = 1_500_000
+    fmt: str = "auto"          # auto|jpeg|webp|png
+    quality: int = 85
+    grayscale: bool = True
+    crop_margins: bool = True
+
+    @staticmethod
+    def from_settings(settings) -> "ImageBudget":
+        return ImageBudget(
+            max_edge=settings.image_max_edge,
+            max_bytes=settings.image_max_bytes,
+            fmt=settings.image_format,
+            quality=settings.image_quality,
+            grayscale=settings.image_grayscale,
+            crop_margins=settings.image_crop_margins,
+        )
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+    encode_ms: float
+
+def render_scale(page_width_pt: float, page_height_pt: float, max_edge: int) -> float:
+    """Render scale that puts the page's long edge at `max_edge` pixels."""
+    long_edge = max(page_width_pt, page_height_pt) or 1.0
+    return max(MIN_RENDER_SCALE, min(MAX_RENDER_SCALE, max_edge / long_edge))
+
+def crop_whitespace(img: Image.Image, threshold: int = 245, pad: int = 12) -> Image.Image:
+    """Crops near-white margins, keeping `pad` pixels around the content."""
+    gray = img if img.mode == "L" else img.convert("L")
+    bbox = gray.point(lambda v: 255 if v < threshold else 0).getbbox()
+    if not bbox:
+        return img
+    left, top, right, bottom = bbox
+    return img.crop((
+        max(0, left - pad), max(0, top - pad),
+        min(img.width, right + pad), min(img.height, bottom + pad),
+    ))
+
+def fit_to_budget(img: Image.Image, budget: ImageBudget) -> EncodedImage:
+    t0 = time.perf_counter()
+    img = img.convert("L") if budget.grayscale else img.convert("RGB")
+    if budget.crop_margins:
+        img = crop_whitespace(img)
+    if max(img.size) > budget.max_edge:
+        img.thumbnail((budget.max_edge, budget.max_edge), Image.LANCZOS)
+
+    fmt = budget.fmt if budget.fmt in MEDIA_TYPES else "auto"
+    quality = budget.quality
+    if fmt == "auto":
+        png = _encode(img, "png", quality)
+        jpeg = _encode(img, "jpeg", quality)
+        fmt, data = ("png", png) if len(png) <= len(jpeg) else ("jpeg", jpeg)
+        if len(data) <= budget.max_bytes:
+            return EncodedImage(data, MEDIA_TYPES[fmt], img.width, img.height, (time.perf_counter() - t0) * 1000)
+        fmt = "jpeg"
+
+    while True:
+        data = _encode(img, fmt, quality)
+        if len(data) <= budget.max_bytes:
+            break
+        if fmt != "png" and quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - 10)
+            continue
+        if max(img.size) <= 512:
+            break
+        # Still too big at the lowest quality: shrink and try again
+        img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+        quality = budget.quality
+
+    return EncodedImage(data, MEDIA_TYPES[fmt], img.width, img.height, (time.perf_counter() - t0) * 1000)
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG", compress_level=6)
+    elif fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+
+from .config import Settings
+from .db import get_session_factory, is_postgres
+from .models import Job
+from . import tracing
+
+def enqueue(db: Session, settings: Settings, doc_id: int, kind: str = "extract") -> Job:
+    """Adds a job to the caller's session so it commits atomically with the document row."""
+    job = Job(
+        document_id=doc_id,
+        kind=kind,
+        status="queued",
+        attempts=0,
+        max_attempts=settings.job_max_attempts,
+        run_after=datetime.utcnow(),
+        traceparent=tracing.current_traceparent(),
+    )
+    db.add(job)
+    return job
+
+def claim(settings: Settings, worker_id: str, limit: int) -> list[Job]:
+    """
+    Claims up to `limit` runnable jobs for `worker_id` and leases them for JOB_LEASE_S.
+    - Postgres: SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never block on each other.
+    - SQLite: optimistic compare-and-set on status, so a job is only ever claimed once.
+    """
+    if limit <= 0:
+        return []
+    sess_factory = get_session_factory(settings)
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=settings.job_lease_s)
+    runnable = (
+        select(Job)
+        .where(Job.status == "queued", Job.run_after <= now)
+        .order_by(Job.run_after, Job.id)
+        .limit(limit)
+    )
+
+    with sess_factory() as db:
+        if is_postgres(settings):
+            jobs = db.execute(runnable.with_for_update(skip_locked=True)).scalars().all()
+            for job in jobs:
+                job.status = "running"
+                job.attempts += 1
+                job.lease_owner = worker_id
+                job.lease_expires_at = lease_until
+            db.commit()
+            return list(jobs)
+
+        claimed = []
+        for job in db.execute(runnable).scalars().all():
+            res = db.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.status == "queued")
+                .values(status="running", attempts=Job.attempts + 1,
+                        lease_owner=worker_id, lease_expires_at=lease_until)
+            )
+            if res.rowcount == 1:
+                claimed.append(job.id)
+        db.commit()
+        if not claimed:
+            return []
+        return list(db.execute(select(Job).where(Job.id.in_(claimed)).order_by(Job.id)).scalars().all())
+
+def renew_leases(settings: Settings, worker_id: str) -> int:
+    """Extends the lease on every job this worker is still running."""
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        res = db.execute(
+            update(Job)
+            .where(Job.status == "running", Job.lease_owner == worker_id)
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.job_lease_s))
+        )
+        db.commit()
+        return res.rowcount
+
+def release_leases(settings: Settings, worker_id: str) -> int:
+    """Returns this worker's running jobs to the queue (used on shutdown)."""
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        res = db.execute(
+            update(Job)
+            .where(Job.status == "running", Job.lease_owner == worker_id)
+            .values(status="queued", run_after=datetime.utcnow(), lease_owner=None,
+                    lease_expires_at=None, last_error="released on worker shutdown")
+        )
+        db.commit()
+        return res.rowcount
+
+def complete(settings: Settings, job_id: int):
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        db.execute(
+            update(Job).where(Job.id == job_id)
+            .values(status="done", lease_owner=None, lease_expires_at=None)
+        )
+        db.commit()
+
+def fail(settings: Settings, job_id: int, error: str, retryable: bool = True,
+         transient_delay: float | None = None) -> float | None:
+    """
+    Records a failed attempt. Returns the retry delay in seconds when the job was
+    re-queued, or None when it is out of attempts (or not retryable) and is now failed.
+    With transient_delay (the provider was rate limiting or down) the attempt is not
+    counted and the job is always re-queued after that delay.
+    """
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        job = db.get(Job, job_id)
+        if not job:
+            return None
+        job.last_error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        if transient_delay is not None:
+            delay = transient_delay
+            job.attempts = max(0, job.attempts - 1)
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        elif retryable and job.attempts < job.max_attempts:
+            delay = backoff_seconds(settings, job.attempts)
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            delay = None
+            job.status = "failed"
+        db.commit()
+        return delay
+
+def recover_expired(settings: Settings, on_exhausted=None) -> int:
+    """
+    Re-queues running jobs whose lease has expired (their worker died or was recycled).
+    Jobs that already used all their attempts are failed instead, so a document that
+    crashes the worker cannot loop forever; `on_exhausted(document_id, error)` is then
+    called for each, after the commit, to fail the document too. Returns the number of
+    re-queued jobs.
+    """
+    sess_factory = get_session_factory(settings)
+    now = datetime.utcnow()
+    expired = (Job.status == "running", Job.lease_expires_at < now)
+    error = "lease expired (out of attempts)"
+    failed_docs = []
+    with sess_factory() as db:
+        exhausted = db.execute(
+            select(Job.id, Job.document_id).where(*expired, Job.attempts >= Job.max_attempts)
+        ).all()
+        for job_id, doc_id in exhausted:
+            # re-checks the lease: a job renewed or finished since the select is left alone
+            res = db.execute(
+                update(Job)
+                .where(Job.id == job_id, *expired)
+                .values(status="failed", lease_owner=None, lease_expires_at=None, last_error=error)
+            )
+            if res.rowcount == 1:
+                failed_docs.append(doc_id)
+        res = db.execute(
+            update(Job)
+            .where(*expired)
+            .values(status="queued", run_after=now, lease_owner=None, lease_expires_at=None,
+                    last_error="lease expired")
+        )
+        db.commit()
+    if on_exhausted is not None:
+        for doc_id in failed_docs:
+            on_exhausted(doc_id, error)
+    return res.rowcount
+
+def backoff_seconds(settings: Settings, attempts: int) -> float:
+    # Exponential backoff, capped, jittered so retries from a burst spread out
+    ceiling = min(settings.job_backoff_max_s, settings.job_backoff_base_s * (2 ** max(0, attempts - 1)))
+    return random.uniform(ceiling / 2, ceiling)
+
+def queue_stats(settings: Settings) -> dict:
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        rows = db.execute(select(Job.status, func.count()).group_by(Job.status)).all()
+    return {status: count for status, count in rows}
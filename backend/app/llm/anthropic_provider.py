@@ -1,7 +1,11 @@
 import base64
 import json
-from anthropic import Anthropic
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
 from ..schemas import ExtractedInvoice
+from ..metrics import atimed_request, record_llm_tokens, timed_request
+from .clients import PerLoopClient, sdk_max_retries
+from .ratelimit import RateGovernor, estimate_tokens, response_token_counts
 
 SYSTEM_PROMPT = """You are an expert data extraction assistant.
 Your task is to extract structured data from sales invoices.
@@ -10,29 +14,89 @@ If a field is not present in the document, return null for that field.
 Do not guess or hallucinate values.
 """
 
+TOOL_NAME = "extract_invoice"
+
+# Generate the JSON schema from the Pydantic model
+# This ensures the schema is always in sync with the code
+INPUT_SCHEMA = ExtractedInvoice.model_json_schema()
+
 class AnthropicInvoiceExtractor:
-    def __init__(self, api_key: str, model: str = "claude-3-5-sonnet-20240620"):
-        self.client = Anthropic(api_key=api_key)
+    # Image formats the API accepts as-is; anything else is converted before upload
+    accepted_media_types = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp"})
+    provider = "anthropic"
+
+    def __init__(self, api_key: str, model: str = "claude-3-5-sonnet-20240620",
+                 base_url: str | None = None, http_client: httpx.Client | None = None,
+                 async_limits: httpx.Limits | None = None, timeout: float = 120.0,
+                 governor: RateGovernor | None = None):
+        self.max_retries = sdk_max_retries(governor)
+        self.client = Anthropic(api_key=api_key, base_url=base_url, http_client=http_client,
+                                timeout=timeout, max_retries=self.max_retries)
         self.model = model
+        self._async_clients = PerLoopClient(lambda: AsyncAnthropic(
+            api_key=api_key, base_url=base_url, timeout=timeout, max_retries=self.max_retries,
+            http_client=httpx.AsyncClient(limits=async_limits or httpx.Limits(), timeout=timeout),
+        ))
+        self.governor = governor
+
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        # the one for the event loop calling aextract()
+        return self._async_clients.get()
+
+    def extract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        request = self._request(image_bytes, media_type)
+        send = timed_request(self.provider, lambda: self.client.messages.create(**request))
+        response = self.governor.call(send, estimate_tokens(image_bytes)) if self.governor else send()
+        record_llm_tokens(self.provider, *response_token_counts(response))
+        return self._parse(response)
+
+    async def aextract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        request = self._request(image_bytes, media_type)
+        send = atimed_request(self.provider, lambda: self.async_client.messages.create(**request))
+        response = await (self.governor.acall(send, estimate_tokens(image_bytes)) if self.governor else send())
+        record_llm_tokens(self.provider, *response_token_counts(response))
+        return self._parse(response)
 
-    def extract(self, image_bytes: bytes) -> ExtractedInvoice:
+    def submit_batch(self, pages: list[tuple[str, bytes, str]]) -> str:
+        """Submits (custom_id, image_bytes, media_type) pages as one Message Batch; returns its id."""
+        requests = [{"custom_id": custom_id, "params": self._request(image_bytes, media_type)}
+                    for custom_id, image_bytes, media_type in pages]
+        send = lambda: self.client.messages.batches.create(requests=requests)  # noqa: E731
+        batch = self.governor.call(send) if self.governor else send()
+        return batch.id
+
+    def batch_status(self, batch_id: str) -> str:
+        """in_progress | ended"""
+        send = lambda: self.client.messages.batches.retrieve(batch_id)  # noqa: E731
+        batch = self.governor.call(send) if self.governor else send()
+        return "ended" if batch.processing_status == "ended" else "in_progress"
+
+    def batch_results(self, batch_id: str):
+        """Yields (custom_id, ExtractedInvoice or the exception that stopped it)."""
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                yield entry.custom_id, RuntimeError(f"batch request {entry.result.type}")
+                continue
+            try:
+                record_llm_tokens(self.provider, *response_token_counts(entry.result.message))
+                yield entry.custom_id, self._parse(entry.result.message)
+            except Exception as e:
+                yield entry.custom_id, e
+
+    def _request(self, image_bytes: bytes, media_type: str) -> dict:
         b64 = base64.b64encode(image_bytes).decode("utf-8")
-        
-        # Generate the JSON schema from the Pydantic model
-        # This ensures the schema is always in sync with the code
-        schema = ExtractedInvoice.model_json_schema()
-        
+
         # Define the tool for Anthropic
-        tool_name = "extract_invoice"
         tools = [
             {
-                "name": tool_name,
+                "name": TOOL_NAME,
                 "description": "Extracts structured data from an invoice image.",
-                "input_schema": schema
+                "input_schema": INPUT_SCHEMA
             }
         ]
 
-        response = self.client.messages.create(
+        return dict(
             model=self.model,
             max_tokens=4096,
             system=SYSTEM_PROMPT,
@@ -44,7 +108,7 @@ class AnthropicInvoiceExtractor:
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/png",
+                                "media_type": media_type,
                                 "data": b64,
                             },
                         },
@@ -56,12 +120,13 @@ class AnthropicInvoiceExtractor:
                 }
             ],
             tools=tools,
-            tool_choice={"type": "tool", "name": tool_name}
+            tool_choice={"type": "tool", "name": TOOL_NAME}
         )
 
+    def _parse(self, response) -> ExtractedInvoice:
         # Parse the tool use response
         for content in response.content:
-            if content.type == "tool_use" and content.name == tool_name:
+            if content.type == "tool_use" and content.name == TOOL_NAME:
                 return ExtractedInvoice.model_validate(content.input)
-        
+
         raise RuntimeError("Anthropic model did not call the extraction tool")
@@ -0,0 +1,37 @@
+"""SDK client plumbing shared by the OpenAI and Anthropic extractors."""
+from __future__ import annotations
+import asyncio
+import threading
+import weakref
+from typing import Callable, Generic, TypeVar
+
+from .ratelimit import RateGovernor
+
+T = TypeVar("T")
+
+def sdk_max_retries(governor: RateGovernor | None) -> int:
+    # With a governor, retries are its job; the SDK's own retries would hide 429s from it
+    return 0 if governor else 2
+
+class PerLoopClient(Generic[T]):
+    """
+    One async SDK client per running event loop. An AsyncOpenAI / AsyncAnthropic client's
+    connection pool belongs to the loop it first ran on and fails on any other (a second
+    asyncio.run(), a loop in another thread). Clients of loops that have since been closed
+    are dropped; their connections went with the loop.
+    """
+
+    def __init__(self, build: Callable[[], T]):
+        self._build = build
+        self._clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                for closed in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[closed]
+                client = self._clients[loop] = self._build()
+        return client
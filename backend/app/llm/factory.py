@@ -1,18 +1,95 @@
+import threading
+import httpx
+
 from ..config import Settings
 from .openai_provider import OpenAIInvoiceExtractor
 from .anthropic_provider import AnthropicInvoiceExtractor
+from .fake_provider import FakeInvoiceExtractor
+from .ratelimit import RateGovernor
+
+# Extractors are long-lived: one per (provider, credentials, model, endpoint) per process,
+# so every document reuses the same keep-alive connection pool instead of a new TLS handshake
+_extractors: dict[tuple, object] = {}
+_extractors_lock = threading.Lock()
+
+# One governor per provider per process: the quota belongs to the account, not the model
+_governors: dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
 
 def get_extractor(settings: Settings):
     provider = settings.llm_provider.lower()
-    
+
     if provider == "openai":
         if not settings.openai_api_key:
             raise RuntimeError("OPENAI_API_KEY is not set")
-        return OpenAIInvoiceExtractor(api_key=settings.openai_api_key, model=settings.openai_model)
-    
+        key = (provider, settings.openai_api_key, settings.openai_model, settings.openai_base_url)
+        return _get_or_create(key, lambda: OpenAIInvoiceExtractor(
+            api_key=settings.openai_api_key, model=settings.openai_model,
+            base_url=settings.openai_base_url, governor=get_governor(settings, provider),
+            **_pool_kwargs(settings),
+        ))
+
     if provider == "anthropic":
         if not settings.anthropic_api_key:
             raise RuntimeError("ANTHROPIC_API_KEY is not set")
-        return AnthropicInvoiceExtractor(api_key=settings.anthropic_api_key, model=settings.anthropic_model)
-        
+        key = (provider, settings.anthropic_api_key, settings.anthropic_model, settings.anthropic_base_url)
+        return _get_or_create(key, lambda: AnthropicInvoiceExtractor(
+            api_key=settings.anthropic_api_key, model=settings.anthropic_model,
+            base_url=settings.anthropic_base_url, governor=get_governor(settings, provider),
+            **_pool_kwargs(settings),
+        ))
+
+    if provider == "fake":
+        key = (provider, settings.fake_llm_latency_ms, settings.fake_llm_jitter_ms,
+               settings.fake_llm_error_rate, settings.fake_llm_failure_rate)
+        return _get_or_create(key, lambda: FakeInvoiceExtractor(
+            latency_ms=settings.fake_llm_latency_ms, jitter_ms=settings.fake_llm_jitter_ms,
+            error_rate=settings.fake_llm_error_rate, failure_rate=settings.fake_llm_failure_rate,
+            governor=get_governor(settings, provider),
+        ))
+
     raise RuntimeError(f"Unsupported LLM_PROVIDER: {settings.llm_provider}")
+
+def _get_or_create(key: tuple, build):
+    extractor = _extractors.get(key)
+    if extractor is None:
+        with _extractors_lock:
+            extractor = _extractors.get(key)
+            if extractor is None:
+                extractor = _extractors[key] = build()
+    return extractor
+
+def get_governor(settings: Settings, provider: str) -> RateGovernor:
+    governor = _governors.get(provider)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(provider)
+            if governor is None:
+                rpm, tpm = {
+                    "openai": (settings.openai_rpm, settings.openai_tpm),
+                    "anthropic": (settings.anthropic_rpm, settings.anthropic_tpm),
+                    "fake": (0, 0),
+                }[provider]
+                governor = _governors[provider] = RateGovernor(
+                    provider, rpm=rpm, tpm=tpm,
+                    max_retries=settings.llm_max_retries,
+                    backoff_base_s=settings.llm_backoff_base_s,
+                    backoff_max_s=settings.llm_backoff_max_s,
+                    breaker_threshold=settings.llm_breaker_threshold,
+                    breaker_cooldown_s=settings.llm_breaker_cooldown_s,
+                )
+    return governor
+
+def governor_stats() -> dict:
+    return {provider: governor.stats() for provider, governor in _governors.items()}
+
+def _pool_kwargs(settings: Settings) -> dict:
+    limits = httpx.Limits(
+        max_connections=settings.llm_max_connections,
+        max_keepalive_connections=settings.llm_max_connections,
+    )
+    return {
+        "http_client": httpx.Client(limits=limits, timeout=settings.llm_timeout_s),
+        "async_limits": limits,
+        "timeout": settings.llm_timeout_s,
+    }
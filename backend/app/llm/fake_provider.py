@@ -0,0 +1,128 @@
+"""
+In-process stand-in for an LLM provider (LLM_PROVIDER=fake), for load tests and
+benchmarks that must not call a vendor API.
+
+Results are deterministic: the same page bytes always give the same invoice. Each
+call sleeps FAKE_LLM_LATENCY_MS (+/- FAKE_LLM_JITTER_MS). A FAKE_LLM_ERROR_RATE
+fraction of calls fail with a 529 "overloaded" error, which the rate governor
+retries like a real one; a FAKE_LLM_FAILURE_RATE fraction fail for good.
+
+For exercising the real SDK clients over HTTP, use scripts/fake_llm_server.py instead.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import random
+import threading
+import time
+import uuid
+
+from ..metrics import atimed_request, record_llm_tokens, timed_request
+from ..schemas import ExtractedInvoice, LineItem
+from .ratelimit import RateGovernor, estimate_tokens
+
+class FakeProviderError(RuntimeError):
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class FakeInvoiceExtractor:
+    accepted_media_types = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp"})
+    provider = "fake"
+    model = "fake"
+
+    def __init__(self, latency_ms: float = 500.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 failure_rate: float = 0.0, governor: RateGovernor | None = None, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.failure_rate = failure_rate
+        self.governor = governor
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._batches: dict[str, tuple[float, list]] = {}
+        self._batches_lock = threading.Lock()
+
+    def extract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        def send():
+            delay, error = self._draw()
+            time.sleep(delay)
+            if error:
+                raise error
+            return fake_invoice(image_bytes)
+        send = timed_request(self.provider, send)
+        invoice = self.governor.call(send, estimate_tokens(image_bytes)) if self.governor else send()
+        self._record_usage(image_bytes, invoice)
+        return invoice
+
+    async def aextract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        async def send():
+            delay, error = self._draw()
+            await asyncio.sleep(delay)
+            if error:
+                raise error
+            return fake_invoice(image_bytes)
+        send = atimed_request(self.provider, send)
+        invoice = await (self.governor.acall(send, estimate_tokens(image_bytes)) if self.governor else send())
+        self._record_usage(image_bytes, invoice)
+        return invoice
+
+    def submit_batch(self, pages: list[tuple[str, bytes, str]]) -> str:
+        """Answers every page at once; the batch reports ended after one call's latency."""
+        batch_id = f"fakebatch_{uuid.uuid4().hex[:12]}"
+        results = []
+        for custom_id, image_bytes, _media_type in pages:
+            _, error = self._draw()
+            results.append((custom_id, error or fake_invoice(image_bytes)))
+        with self._batches_lock:
+            self._batches[batch_id] = (time.monotonic() + self.latency_ms / 1000, results)
+        return batch_id
+
+    def batch_status(self, batch_id: str) -> str:
+        with self._batches_lock:
+            ready_at, _ = self._batches[batch_id]
+        return "ended" if time.monotonic() >= ready_at else "in_progress"
+
+    def batch_results(self, batch_id: str):
+        with self._batches_lock:
+            _, results = self._batches.pop(batch_id)
+        yield from results
+
+    def _record_usage(self, image_bytes: bytes, invoice: ExtractedInvoice):
+        # what a real provider would bill: the usual pre-call estimate in, ~4 bytes of JSON per token out
+        record_llm_tokens(self.provider, estimate_tokens(image_bytes), len(invoice.model_dump_json()) // 4)
+
+    def _draw(self) -> tuple[float, Exception | None]:
+        with self._rng_lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            roll = self._rng.random()
+        delay = max(0.0, self.latency_ms + jitter) / 1000
+        if roll < self.failure_rate:
+            return delay, FakeProviderError("fake provider: invalid request")
+        if roll < self.failure_rate + self.error_rate:
+            return delay, FakeProviderError("fake provider: overloaded", status_code=529)
+        return delay, None
+
+def fake_invoice(image_bytes: bytes) -> ExtractedInvoice:
+    """A plausible invoice derived only from the page bytes."""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    rng = random.Random(digest)
+    items = []
+    for i in range(rng.randint(1, 5)):
+        qty = float(rng.randint(1, 20))
+        unit_price = round(rng.uniform(5, 500), 2)
+        items.append(LineItem(item_number=f"P-{rng.randint(100, 999)}", description=f"Fake product {i + 1}",
+                              qty=qty, unit_price=unit_price, line_total=round(qty * unit_price, 2)))
+    subtotal = round(sum(it.line_total for it in items), 2)
+    tax_rate = rng.choice([0.0, 0.06, 0.0725, 0.0825])
+    tax_amt = round(subtotal * tax_rate, 2)
+    freight = round(rng.uniform(0, 40), 2)
+    return ExtractedInvoice(
+        invoice_number=f"SO-FAKE-{digest[:8].upper()}", purchase_order_number=f"PO-{digest[8:14].upper()}",
+        order_date=f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        salesperson="Fake Rep", ship_via="UPS Ground", terms="Net 30",
+        subtotal=subtotal, tax_rate=tax_rate, tax_amt=tax_amt, freight=freight,
+        total_due=round(subtotal + tax_amt + freight, 2), currency="USD",
+        bill_to_name="Fake Customer LLC", ship_to_name="Fake Customer LLC",
+        items=items, confidence=0.99,
+    )
@@ -1,32 +1,147 @@
 import base64
-from openai import OpenAI
+import io
+import json
+import httpx
+from openai import OpenAI, AsyncOpenAI
 
 from ..schemas import ExtractedInvoice
+from ..metrics import atimed_request, record_llm_tokens, timed_request
+from .clients import PerLoopClient, sdk_max_retries
+from .ratelimit import RateGovernor, estimate_tokens, response_token_counts
 
 SYSTEM_PROMPT = """You extract structured data from sales invoices.
 Return ONLY valid JSON matching the schema. Do not include markdown or explanations.
 If a field is missing, use null. Do not guess values that are not present."""
 
+def json_schema_response_format(model) -> dict:
+    """
+    The strict `response_format` for a Pydantic model, as the batch API needs it spelled out
+    (chat.completions.parse() builds the same from the class itself): every object closed
+    to extra keys and listing all its properties as required, optional ones being nullable.
+    """
+    schema = model.model_json_schema()
+    _make_strict(schema)
+    return {"type": "json_schema", "json_schema": {"name": model.__name__, "schema": schema, "strict": True}}
+
+def _make_strict(node):
+    if isinstance(node, list):
+        for item in node:
+            _make_strict(item)
+        return
+    if not isinstance(node, dict):
+        return
+    if node.get("type") == "object" and "properties" in node:
+        node["additionalProperties"] = False
+        node["required"] = list(node["properties"])
+    for key in ("$defs", "properties"):
+        for child in node.get(key, {}).values():
+            _make_strict(child)
+    for key in ("items", "anyOf", "allOf"):
+        if key in node:
+            _make_strict(node[key])
+
 class OpenAIInvoiceExtractor:
-    def __init__(self, api_key: str, model: str):
-        self.client = OpenAI(api_key=api_key)
+    # Image formats the API accepts as-is; anything else is converted before upload
+    accepted_media_types = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp"})
+    provider = "openai"
+
+    def __init__(self, api_key: str, model: str, base_url: str | None = None,
+                 http_client: httpx.Client | None = None,
+                 async_limits: httpx.Limits | None = None, timeout: float = 120.0,
+                 governor: RateGovernor | None = None):
+        self.max_retries = sdk_max_retries(governor)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                             timeout=timeout, max_retries=self.max_retries)
         self.model = model
+        self._async_clients = PerLoopClient(lambda: AsyncOpenAI(
+            api_key=api_key, base_url=base_url, timeout=timeout, max_retries=self.max_retries,
+            http_client=httpx.AsyncClient(limits=async_limits or httpx.Limits(), timeout=timeout),
+        ))
+        self.governor = governor
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        # the one for the event loop calling aextract()
+        return self._async_clients.get()
+
+    def extract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        request = self._request(image_bytes, media_type)
+        send = timed_request(self.provider, lambda: self.client.beta.chat.completions.parse(**request))
+        completion = self.governor.call(send, estimate_tokens(image_bytes)) if self.governor else send()
+        record_llm_tokens(self.provider, *response_token_counts(completion))
+        return self._parse(completion)
+
+    async def aextract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        request = self._request(image_bytes, media_type)
+        send = atimed_request(self.provider, lambda: self.async_client.beta.chat.completions.parse(**request))
+        completion = await (self.governor.acall(send, estimate_tokens(image_bytes)) if self.governor else send())
+        record_llm_tokens(self.provider, *response_token_counts(completion))
+        return self._parse(completion)
 
-    def extract(self, image_bytes: bytes) -> ExtractedInvoice:
+    def submit_batch(self, pages: list[tuple[str, bytes, str]]) -> str:
+        """Submits (custom_id, image_bytes, media_type) pages through the Batch API; returns its id."""
+        lines = []
+        for custom_id, image_bytes, media_type in pages:
+            body = self._request(image_bytes, media_type)
+            body["response_format"] = json_schema_response_format(ExtractedInvoice)
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST",
+                                     "url": "/v1/chat/completions", "body": body}))
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+
+        def send():
+            upload = self.client.files.create(file=("batch.jsonl", io.BytesIO(payload)), purpose="batch")
+            return self.client.batches.create(input_file_id=upload.id, endpoint="/v1/chat/completions",
+                                              completion_window="24h")
+        batch = self.governor.call(send) if self.governor else send()
+        return batch.id
+
+    def batch_status(self, batch_id: str) -> str:
+        """in_progress | ended | failed"""
+        send = lambda: self.client.batches.retrieve(batch_id)  # noqa: E731
+        batch = self.governor.call(send) if self.governor else send()
+        if batch.status in ("completed", "expired", "cancelled"):
+            # expired/cancelled batches still report whatever finished in the output file
+            return "ended"
+        return "failed" if batch.status == "failed" else "in_progress"
+
+    def batch_results(self, batch_id: str):
+        """Yields (custom_id, ExtractedInvoice or the exception that stopped it)."""
+        batch = self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return
+        for line in self.client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                yield entry["custom_id"], RuntimeError(f"batch request failed: {entry.get('error') or response}")
+                continue
+            try:
+                usage = response["body"].get("usage") or {}
+                record_llm_tokens(self.provider, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+                message = response["body"]["choices"][0]["message"]
+                if message.get("refusal"):
+                    raise RuntimeError(f"Model refused to extract: {message['refusal']}")
+                yield entry["custom_id"], ExtractedInvoice.model_validate_json(message["content"])
+            except Exception as e:
+                yield entry["custom_id"], e
+
+    def _request(self, image_bytes: bytes, media_type: str) -> dict:
         b64 = base64.b64encode(image_bytes).decode("utf-8")
-        
-        completion = self.client.beta.chat.completions.parse(
+        return dict(
             model=self.model,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": [
                     {"type": "text", "text": "Extract the invoice fields."},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}}
+                    {"type": "image_url", "image_url": {"url": f"data:{media_type};base64,{b64}"}}
                 ]}
             ],
             response_format=ExtractedInvoice,
         )
-        
+
+    def _parse(self, completion) -> ExtractedInvoice:
         message = completion.choices[0].message
         if message.parsed:
             return message.parsed
@@ -0,0 +1,305 @@
+"""
+Per-provider rate governor for LLM calls.
+
+- Token buckets for requests/minute and tokens/minute (0 = unlimited) pace calls
+  to stay under the account quota instead of bursting into 429s.
+- 429 / overloaded / 5xx / connection errors are retried with jittered exponential
+  backoff, honouring retry-after headers. A 429 also pauses the provider's buckets,
+  so every caller in the process backs off, not just the one that was rejected.
+- A circuit breaker stops hammering a provider that keeps failing: after
+  LLM_BREAKER_THRESHOLD consecutive failures, calls wait LLM_BREAKER_COOLDOWN_S
+  and then let a single probe through.
+
+When retries run out the call raises TransientLLMError, which the job runners
+treat as "try again later" rather than failing the document.
+"""
+from __future__ import annotations
+import asyncio
+import email.utils
+import io
+import random
+import threading
+import time
+
+import anthropic
+import openai
+
+from .. import tracing
+
+class TransientLLMError(RuntimeError):
+    """The provider is rate limiting or unavailable; the call should be retried later."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+_TRANSIENT_TYPES = (
+    anthropic.RateLimitError, anthropic.InternalServerError,
+    anthropic.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError, openai.InternalServerError,
+    openai.APIConnectionError,
+)
+_TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+def is_transient(e: BaseException) -> bool:
+    if isinstance(e, (TransientLLMError, *_TRANSIENT_TYPES)):
+        return True
+    return getattr(e, "status_code", None) in _TRANSIENT_STATUS
+
+def is_rate_limited(e: BaseException) -> bool:
+    return getattr(e, "status_code", None) == 429
+
+def retry_after_seconds(e: BaseException) -> float | None:
+    """Reads retry-after-ms / retry-after (seconds or HTTP date) from an SDK error's response."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+    except Exception:
+        return None
+
+class TokenBucket:
+    """
+    Reservation-style token bucket: reserve() always succeeds and returns how long
+    the caller must wait before proceeding, so it works for threads and asyncio alike.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if not self.enabled:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def refund(self, amount: float):
+        # Give back (or, if negative, take) the difference between estimated and actual usage
+        if not self.enabled or amount == 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown_s: float):
+        self.threshold = max(1, threshold)
+        self.cooldown_s = cooldown_s
+        self.state = "closed"  # closed|open|half_open
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """0 when the caller may proceed, otherwise seconds to wait before asking again."""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            now = time.monotonic()
+            if self.state == "open":
+                remaining = self._opened_at + self.cooldown_s - now
+                if remaining > 0:
+                    return remaining
+                self.state = "half_open"
+            if not self._probe_in_flight:
+                self._probe_in_flight = True
+                return 0.0
+            return min(1.0, self.cooldown_s)
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self._failures >= self.threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+class RateGovernor:
+    def __init__(self, provider: str, rpm: int = 0, tpm: int = 0, max_retries: int = 6,
+                 backoff_base_s: float = 1.0, backoff_max_s: float = 60.0,
+                 breaker_threshold: int = 5, breaker_cooldown_s: float = 30.0):
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown_s)
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "gave_up": 0, "throttled_s": 0.0}
+
+    def call(self, fn, estimated_tokens: int = 0):
+        """Runs fn() (one SDK request) under the rate limits, retrying transient failures."""
+        attempt = 0
+        while True:
+            wait, admitted = self._admit(estimated_tokens, attempt)
+            time.sleep(wait)
+            self._trace_wait("llm.throttled", wait)
+            if not admitted:
+                attempt += 1
+                continue
+            try:
+                response = fn()
+            except Exception as e:
+                delay = self._on_error(e, attempt, estimated_tokens)
+                attempt += 1
+                time.sleep(delay)
+                self._trace_wait("llm.backoff", delay)
+                continue
+            self._on_success(response, estimated_tokens)
+            return response
+
+    async def acall(self, fn, estimated_tokens: int = 0):
+        """Async variant of call(); fn() must return an awaitable."""
+        attempt = 0
+        while True:
+            wait, admitted = self._admit(estimated_tokens, attempt)
+            await asyncio.sleep(wait)
+            self._trace_wait("llm.throttled", wait)
+            if not admitted:
+                attempt += 1
+                continue
+            try:
+                response = await fn()
+            except Exception as e:
+                delay = self._on_error(e, attempt, estimated_tokens)
+                attempt += 1
+                await asyncio.sleep(delay)
+                self._trace_wait("llm.backoff", delay)
+                continue
+            self._on_success(response, estimated_tokens)
+            return response
+
+    def _admit(self, estimated_tokens: int, attempt: int) -> tuple[float, bool]:
+        """Returns (seconds to wait, whether the request may go out after waiting)."""
+        wait = self.breaker.wait_time()
+        if wait > 0:
+            # Breaker is open: waiting it out counts as an attempt, so callers cannot block forever
+            if attempt >= self.max_retries:
+                with self._lock:
+                    self._stats["gave_up"] += 1
+                raise TransientLLMError(f"{self.provider} circuit breaker is open", retry_after=wait)
+            return wait, False
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["throttled_s"] += wait
+        return wait, True
+
+    def _on_error(self, e: Exception, attempt: int, estimated_tokens: int) -> float:
+        """Returns how long to wait before retrying, or re-raises."""
+        self.tokens.refund(estimated_tokens)
+        if not is_transient(e):
+            self.breaker.record_success()  # the provider answered; the request itself was bad
+            raise e
+        hint = retry_after_seconds(e)
+        if is_rate_limited(e):
+            # Quota is shared by every caller in the process: pause them all
+            pause = hint if hint is not None else self._backoff(attempt)
+            self.requests.pause(pause)
+            self.tokens.pause(pause)
+            with self._lock:
+                self._stats["rate_limited"] += 1
+        else:
+            self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            with self._lock:
+                self._stats["gave_up"] += 1
+            raise TransientLLMError(
+                f"{self.provider} still unavailable after {attempt + 1} attempts: {e}",
+                retry_after=hint,
+            ) from e
+        with self._lock:
+            self._stats["retries"] += 1
+        return hint if hint is not None else self._backoff(attempt)
+
+    def _on_success(self, response, estimated_tokens: int):
+        self.breaker.record_success()
+        used = response_token_usage(response)
+        if used is not None:
+            self.tokens.refund(estimated_tokens - used)
+
+    def _trace_wait(self, name: str, seconds: float):
+        # quota pauses and retry backoff are where LLM tail latency usually hides
+        if seconds > 0:
+            tracing.record_span(name, seconds, **{"gen_ai.system": self.provider})
+
+    def _backoff(self, attempt: int) -> float:
+        ceiling = min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "throttled_s": round(self._stats["throttled_s"], 2),
+                    "breaker": self.breaker.state}
+
+def response_token_usage(response) -> int | None:
+    """Total tokens from an Anthropic message or OpenAI completion, if reported."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    if getattr(usage, "total_tokens", None) is not None:
+        return usage.total_tokens
+    inp, out = getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None)
+    if inp is None and out is None:
+        return None
+    return (inp or 0) + (out or 0)
+
+def response_token_counts(response) -> tuple[int | None, int | None]:
+    """(input, output) tokens from an Anthropic message or OpenAI completion, where reported."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None, None
+    if getattr(usage, "input_tokens", None) is not None or getattr(usage, "output_tokens", None) is not None:
+        return usage.input_tokens, usage.output_tokens
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+def estimate_tokens(image_bytes: bytes, prompt_tokens: int = 1500) -> int:
+    """Rough pre-call estimate: vision tokens ~ pixels / 750, plus prompt, schema and output."""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            w, h = img.size
+        return int(w * h / 750) + prompt_tokens
+    except Exception:
+        return prompt_tokens + len(image_bytes) // 100
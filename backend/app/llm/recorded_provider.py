@@ -0,0 +1,117 @@
+"""
+Recorded provider responses, so extraction can be re-run offline and reproducibly
+(scripts/eval_extraction.py).
+
+RecordingExtractor wraps any extractor from the factory and appends every answer, with
+its latency and token usage, to a JSON-lines file. ReplayExtractor answers from that
+file without touching the network: a page is looked up by the hash of its bytes and
+media type, so a change to the image pipeline that alters what would be sent (scale,
+format, quality) misses and has to be recorded once against the live provider.
+
+Replayed calls report their recorded latency and tokens through record_llm_request() /
+record_llm_tokens(), like a live call, but return immediately.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import threading
+import time
+
+from ..metrics import PipelineTimings, current_timings, record_llm_request, record_llm_tokens, track
+from ..schemas import ExtractedInvoice
+
+class ReplayMiss(RuntimeError):
+    """The page was never recorded (or was recorded with different bytes)."""
+
+class ReplayedError(RuntimeError):
+    """A failure that was recorded instead of an answer."""
+
+def response_key(image_bytes: bytes, media_type: str) -> str:
+    return hashlib.sha256(media_type.encode() + b"\0" + bytes(image_bytes)).hexdigest()
+
+class RecordingExtractor:
+    """Passes pages to `inner` and appends each outcome to `path`."""
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.provider = inner.provider
+        self.model = getattr(inner, "model", None)
+        self.accepted_media_types = getattr(inner, "accepted_media_types", None)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def extract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        # The inner call reports into its own collector, which is copied to the caller's after
+        outer, probe = current_timings(), PipelineTimings()
+        try:
+            with track(probe):
+                invoice = self.inner.extract(image_bytes, media_type)
+        except Exception as e:
+            self._append(image_bytes, media_type, probe, error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            if outer is not None:
+                outer.llm_requests += probe.llm_requests
+                outer.llm_request_ms += probe.llm_request_ms
+                outer.input_tokens += probe.input_tokens
+                outer.output_tokens += probe.output_tokens
+        self._append(image_bytes, media_type, probe, result=invoice.model_dump())
+        return invoice
+
+    def _append(self, image_bytes: bytes, media_type: str, probe: PipelineTimings, **outcome):
+        entry = {
+            "key": response_key(image_bytes, media_type),
+            "provider": self.provider, "model": self.model,
+            "media_type": media_type, "bytes": len(image_bytes),
+            "latency_ms": round(probe.llm_request_ms, 1), "requests": probe.llm_requests,
+            "input_tokens": probe.input_tokens, "output_tokens": probe.output_tokens,
+            "recorded_at": time.time(), **outcome,
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+class ReplayExtractor:
+    """Answers pages from a file written by RecordingExtractor; raises ReplayMiss for pages not in it."""
+    accepted_media_types = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp"})
+
+    def __init__(self, path: str, provider: str | None = None, model: str | None = None):
+        """
+        Only responses from `provider` / `model` are replayed when given (one file can hold
+        several); otherwise both are taken from the file, which must then hold just one of each.
+        """
+        self.path = path
+        self._entries: dict[str, dict] = {}
+        sources = set()
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if (provider and entry.get("provider") != provider) or (model and entry.get("model") != model):
+                    continue
+                self._entries[entry["key"]] = entry  # a later recording of the same page wins
+                sources.add((entry.get("provider"), entry.get("model")))
+        if not self._entries:
+            wanted = "/".join(filter(None, (provider, model)))
+            raise ValueError(f"{path} holds no recorded responses" + (f" from {wanted}" if wanted else ""))
+        if len(sources) > 1:
+            found = ", ".join(f"{p}/{m}" for p, m in sorted(sources, key=str))
+            raise ValueError(f"{path} holds responses from {found}; choose one provider and model")
+        (self.provider, self.model), = sources
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def extract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        entry = self._entries.get(response_key(image_bytes, media_type))
+        if entry is None:
+            raise ReplayMiss(f"no recorded response for this {media_type} page ({len(image_bytes)} bytes)")
+        record_llm_request(self.provider, entry.get("latency_ms", 0.0) / 1000, "error" if "error" in entry else "ok")
+        if "error" in entry:
+            raise ReplayedError(entry["error"])
+        record_llm_tokens(self.provider, entry.get("input_tokens"), entry.get("output_tokens"))
+        return ExtractedInvoice.model_validate(entry["result"])
+
+    async def aextract(self, image_bytes: bytes, media_type: str) -> ExtractedInvoice:
+        return self.extract(image_bytes, media_type)
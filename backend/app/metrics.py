@@ -0,0 +1,237 @@
+"""
+Pipeline timing and LLM usage metrics, served at GET /metrics in the Prometheus text
+format (no client library needed).
+
+Metrics live in the process that records them: every gunicorn worker and every
+`python -m app.worker` keeps its own, so scrape each one (the worker serves them on
+WORKER_METRICS_PORT). Counters and histograms only ever grow until the process restarts,
+which is what Prometheus' rate()/histogram_quantile() expect.
+
+Per-document numbers are collected in a PipelineTimings while a document is extracted;
+it observes the histograms as it goes and ends up on the Document row and in its SSE
+events. The providers add their requests and token usage to the active one through
+record_llm_request() / record_llm_tokens().
+"""
+from __future__ import annotations
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import tracing
+
+# seconds; from a cache hit to a slow multi-page LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: list = []
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (not cumulative)..., +Inf count, sum]
+        self._series: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        i = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, n in zip((*self.buckets, math.inf), series):
+                    cumulative += n
+                    le = "+Inf" if bound == math.inf else _number(bound)
+                    lines.append(f"{self.name}_bucket{_labels((*self.labels, 'le'), (*key, le))} {_number(cumulative)}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(series[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {_number(cumulative)}")
+        return lines
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+STAGE_SECONDS = Histogram(
+    "invoice_stage_seconds",
+    "Time per pipeline stage: queue, db, load, cache, render/encode/pdfium_wait (per page), "
+    "llm_wait/llm (per page), save",
+    ("stage",))
+DOCUMENT_SECONDS = Histogram(
+    "invoice_document_seconds", "Queue to stored result, per extraction attempt", ("outcome",))
+DOCUMENTS = Counter("invoice_documents_total", "Extraction attempts by outcome", ("outcome",))
+LLM_REQUEST_SECONDS = Histogram(
+    "invoice_llm_request_seconds", "Latency of single provider requests, retries counted separately",
+    ("provider", "outcome"))
+LLM_TOKENS = Counter("invoice_llm_tokens_total", "Tokens reported by the provider", ("provider", "kind"))
+PAGE_BYTES = Counter("invoice_page_bytes_total", "Image bytes sent to the LLM", ("media_type",))
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves GET /metrics from a daemon thread, for processes without the API (app.worker)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+class PipelineTimings:
+    """Stage durations (ms) and LLM usage for one extraction attempt of one document."""
+
+    def __init__(self):
+        self.stages_ms: dict[str, float] = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.llm_requests = 0
+        self.llm_request_ms = 0.0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the block as stage `name`, in a trace span of the same name."""
+        t0 = time.perf_counter()
+        try:
+            with tracing.span(f"extract.{name}"):
+                yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name: str, seconds: float):
+        """Adds `seconds` to stage `name` (stages seen more than once, e.g. per page, accumulate)."""
+        self.stages_ms[name] = self.stages_ms.get(name, 0.0) + seconds * 1000
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def finish(self, outcome: str) -> dict:
+        """Records the attempt as a whole (extracted | cached | failed | retrying); returns as_dict()."""
+        seconds = self._elapsed_ms() / 1000
+        DOCUMENT_SECONDS.observe(seconds, outcome=outcome)
+        DOCUMENTS.inc(outcome=outcome)
+        return self.as_dict()
+
+    def as_dict(self) -> dict:
+        return {
+            "stages_ms": {name: round(ms, 1) for name, ms in self.stages_ms.items()},
+            "total_ms": round(self._elapsed_ms(), 1),
+            "llm_requests": self.llm_requests,
+            "llm_request_ms": round(self.llm_request_ms, 1),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+    def _elapsed_ms(self) -> float:
+        # queue time passed before this object existed
+        return (time.perf_counter() - self._started) * 1000 + self.stages_ms.get("queue", 0.0)
+
+_current: contextvars.ContextVar[PipelineTimings | None] = contextvars.ContextVar("pipeline_timings", default=None)
+
+@contextmanager
+def track(timings: PipelineTimings):
+    """Makes `timings` the current_timings() for the block (this thread / task only)."""
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+def current_timings() -> PipelineTimings | None:
+    return _current.get()
+
+def timed_request(provider: str, fn):
+    """Wraps `fn` (one SDK request) so every attempt is recorded with record_llm_request()."""
+    def send():
+        t0, outcome = time.perf_counter(), "error"
+        try:
+            with tracing.span("llm.request", "client", **{"gen_ai.system": provider}):
+                response = fn()
+            outcome = "ok"
+            return response
+        finally:
+            record_llm_request(provider, time.perf_counter() - t0, outcome)
+    return send
+
+def atimed_request(provider: str, fn):
+    """Async variant of timed_request(); fn() must return an awaitable."""
+    async def send():
+        t0, outcome = time.perf_counter(), "error"
+        try:
+            with tracing.span("llm.request", "client", **{"gen_ai.system": provider}):
+                response = await fn()
+            outcome = "ok"
+            return response
+        finally:
+            record_llm_request(provider, time.perf_counter() - t0, outcome)
+    return send
+
+def record_llm_request(provider: str, seconds: float, outcome: str):
+    """One provider request attempt (ok | error); a retried call records each attempt."""
+    LLM_REQUEST_SECONDS.observe(seconds, provider=provider, outcome=outcome)
+    timings = _current.get()
+    if timings is not None:
+        timings.llm_requests += 1
+        timings.llm_request_ms += seconds * 1000
+
+def record_llm_tokens(provider: str, input_tokens: int | None, output_tokens: int | None):
+    """Token usage of one response, added to the counters, the current document and its trace span."""
+    tracing.set_attributes(**{"gen_ai.usage.input_tokens": input_tokens, "gen_ai.usage.output_tokens": output_tokens})
+    timings = _current.get()
+    if input_tokens:
+        LLM_TOKENS.inc(input_tokens, provider=provider, kind="input")
+        if timings is not None:
+            timings.input_tokens += input_tokens
+    if output_tokens:
+        LLM_TOKENS.inc(output_tokens, provider=provider, kind="output")
+        if timings is not None:
+            timings.output_tokens += output_tokens
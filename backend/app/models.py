@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .db import Base
@@ -9,13 +10,20 @@ class Document(Base):
     filename = Column(String(255), nullable=False)
     content_type = Column(String(100), nullable=False)
     storage_path = Column(String(500), nullable=False)
-    status = Column(String(50), nullable=False, default="uploaded")  # uploaded|processing|extracted|saved|failed
+    size_bytes = Column(Integer, nullable=True)
+    content_sha256 = Column(String(64), nullable=True)  # hashed while the upload streamed to disk
+    status = Column(String(50), nullable=False, default="uploaded", index=True)  # uploaded|queued|batched|processing|retrying|extracted|saved|failed
     error = Column(Text, nullable=True)
     extracted_json = Column(Text, nullable=True)
+    page_count = Column(Integer, nullable=True)
+    timings_json = Column(Text, nullable=True)  # stage timings and token usage of the last extraction attempt
+    priority = Column(String(20), nullable=True)  # interactive (default) | bulk
+    batch_id = Column(Integer, ForeignKey("extraction_batches.id"), nullable=True, index=True)
+    upload_batch_id = Column(Integer, ForeignKey("upload_batches.id"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    sales_order_id = Column(Integer, ForeignKey("sales_order_header.SalesOrderID"), nullable=True)
+    sales_order_id = Column(Integer, ForeignKey("sales_order_header.SalesOrderID"), nullable=True, index=True)
     sales_order = relationship("SalesOrderHeader", back_populates="documents")
 
 class SalesOrderHeader(Base):
@@ -44,13 +52,24 @@ class SalesOrderHeader(Base):
     Freight = Column(Float, nullable=True)
     TotalDue = Column(Float, nullable=True)
 
-    details = relationship("SalesOrderDetail", back_populates="header", cascade="all, delete-orphan")
+    details = relationship("SalesOrderDetail", back_populates="header", cascade="all, delete-orphan",
+                           order_by="SalesOrderDetail.SalesOrderDetailID")
     documents = relationship("Document", back_populates="sales_order")
 
+    __table_args__ = (
+        # /api/orders filters; each ends in the primary key, so matches come back in page order
+        Index("ix_sales_order_header_order_date", "OrderDate", "SalesOrderID"),
+        Index("ix_sales_order_header_po_number", "PurchaseOrderNumber", "SalesOrderID"),
+        Index("ix_sales_order_header_so_number", "SalesOrderNumber", "SalesOrderID"),
+        # covers the list columns, so a page is read from this index and not the wide rows
+        Index("ix_sales_order_header_list", "SalesOrderID", "SalesOrderNumber", "OrderDate",
+              "SubTotal", "TaxAmt", "Freight", "TotalDue"),
+    )
+
 class SalesOrderDetail(Base):
     __tablename__ = "sales_order_detail"
     SalesOrderDetailID = Column(Integer, primary_key=True)
-    SalesOrderID = Column(Integer, ForeignKey("sales_order_header.SalesOrderID"), nullable=False)
+    SalesOrderID = Column(Integer, ForeignKey("sales_order_header.SalesOrderID"), nullable=False, index=True)
     CarrierTrackingNumber = Column(String(50), nullable=True)
     OrderQty = Column(Integer, nullable=False)
     ProductID = Column(Integer, nullable=True)
@@ -60,3 +79,79 @@ class SalesOrderDetail(Base):
     LineTotal = Column(Float, nullable=False)
 
     header = relationship("SalesOrderHeader", back_populates="details")
+
+class Job(Base):
+    """Durable extraction job, claimed by `python -m app.worker` under a time-limited lease."""
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    kind = Column(String(50), nullable=False, default="extract")
+    status = Column(String(20), nullable=False, default="queued")  # queued|running|done|failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False)
+    lease_owner = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    traceparent = Column(String(55), nullable=True)  # W3C trace context of the request that enqueued it
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_status_lease", "status", "lease_expires_at"),
+    )
+
+class ExtractionCacheEntry(Base):
+    """Persistent tier of the extraction cache (see cache.py), keyed on file hash + extractor version."""
+    __tablename__ = "extraction_cache"
+    cache_key = Column(String(64), primary_key=True)
+    content_hash = Column(String(64), nullable=False, index=True)
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=False)
+    version = Column(String(32), nullable=False)
+    extracted_json = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class StoredBlob(Base):
+    """One content-addressed upload file (see storage.py), shared by every document with the same bytes."""
+    __tablename__ = "stored_blobs"
+    sha256 = Column(String(64), primary_key=True)
+    size_bytes = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class UploadBatch(Base):
+    """Documents uploaded together through POST /api/documents/bulk."""
+    __tablename__ = "upload_batches"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String(255), nullable=True)  # ZIP name, if uploaded as an archive
+    priority = Column(String(20), nullable=False, default="interactive")
+    total = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ExtractionBatch(Base):
+    """A provider-side batch of page requests for priority=bulk documents (see batch.py)."""
+    __tablename__ = "extraction_batches"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider = Column(String(50), nullable=False)
+    provider_batch_id = Column(String(255), nullable=True)
+    status = Column(String(20), nullable=False, default="preparing")  # preparing|submitted|ended|failed
+    request_count = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    ended_at = Column(DateTime, nullable=True)
+
+class DocumentEvent(Base):
+    """Progress event for the SSE stream when EVENT_BUS=db (see events.py); the id is the SSE event id."""
+    __tablename__ = "document_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, nullable=False)
+    type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("ix_document_events_document_id_id", "document_id", "id"),
+    )
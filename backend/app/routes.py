@@ -1,15 +1,32 @@
 from __future__ import annotations
+import contextlib
+import functools
+import itertools
 import json
+import mimetypes
 import os
+import queue
+import tempfile
 import time
+import zipfile
+from datetime import datetime, timedelta
 from flask import Blueprint, current_app, request, Response
 
 from .schemas import DocumentStatus, ExtractedInvoice
+from .doc_utils import sniff_image_type
 from .services import (
-    create_document, get_document, update_sales_order_from_payload,
-    list_orders, get_order
+    create_document, create_documents, delete_document, get_document,
+    update_sales_order_from_payload, list_orders, get_order, get_orders, upload_batch_progress, list_upload_batch_documents,
+    store_upload, discard_upload, UploadTooLarge, TERMINAL_STATUSES,
 )
-from .events import subscribe, unsubscribe
+from .events import subscribe, unsubscribe, StreamLimitReached
+from .scheduler import SchedulerBusy, scheduler_stats
+from .jobs import queue_stats
+from .db import write_queue_stats
+from .jsonio import json_response, records
+from .llm.factory import governor_stats
+from .tracing import tracing_stats
+from . import batch, cache, events
 
 api = Blueprint("api", __name__)
 
@@ -20,9 +37,20 @@ SUPPORTED_MIME_TYPES = {
     "image/webp", "image/tiff", "image/bmp"
 }
 
+ZIP_MIME_TYPES = {"application/zip", "application/x-zip-compressed"}
+# Allowance for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+MAX_ORDERS_PAGE = 500
+# Least time between two reads of an upload batch's counts by its progress stream
+UPLOAD_PROGRESS_INTERVAL_S = 1.0
+
 @api.post("/documents")
 def upload_document():
     settings = current_app.config["SETTINGS"]
+    # Refuse oversized requests from the headers, before any of the body is read
+    max_request = settings.max_upload_mb * 1024 * 1024 + MULTIPART_OVERHEAD
+    if request.content_length and request.content_length > max_request:
+        return {"error": f"file too large (>{settings.max_upload_mb}MB)"}, 413
     if "file" not in request.files:
         return {"error": "missing file"}, 400
 
@@ -30,24 +58,212 @@ def upload_document():
     if not f.filename:
         return {"error": "missing filename"}, 400
 
-    file_bytes = f.read()
-    max_bytes = settings.max_upload_mb * 1024 * 1024
-    if len(file_bytes) > max_bytes:
-        return {"error": f"file too large (>{settings.max_upload_mb}MB)"}, 413
+    # priority=bulk: extracted through the provider batch API (cheaper, minutes to hours)
+    priority = request.form.get("priority", "interactive")
+    if priority not in ("interactive", "bulk"):
+        return {"error": "priority must be 'interactive' or 'bulk'"}, 400
 
+    # Streamed to disk in chunks (and hashed on the way), never read into memory whole
     content_type = f.mimetype or "application/octet-stream"
-    
+    try:
+        upload = store_upload(settings, f.stream)
+    except UploadTooLarge as e:
+        return {"error": str(e)}, 413
+    problem = _check_upload_type(upload.header, content_type)
+    if problem:
+        discard_upload(upload.path)
+        return {"error": problem}, 415
+
+    try:
+        doc_id = create_document(settings, f.filename, content_type, upload, priority)
+    except SchedulerBusy as e:
+        return {"error": str(e)}, 503, {"Retry-After": "5"}
+    except BaseException:
+        # failed before storage took the upload over; already gone if it did
+        discard_upload(upload.path)
+        raise
+    return {"document_id": doc_id}, 201
+
+@api.post("/documents/bulk")
+def upload_documents_bulk():
+    """
+    Many documents in one request: multipart `files` (any of them may be a ZIP), or a raw
+    ZIP body (Content-Type: application/zip, name in ?filename=). All rows are inserted in
+    one transaction and grouped under an upload batch.
+    """
+    settings = current_app.config["SETTINGS"]
+    max_total = settings.bulk_max_mb * 1024 * 1024
+    if request.content_length and request.content_length > max_total:
+        return {"error": f"request too large (>{settings.bulk_max_mb}MB)"}, 413
+
+    priority = request.args.get("priority") or request.form.get("priority", "interactive")
+    if priority not in ("interactive", "bulk"):
+        return {"error": "priority must be 'interactive' or 'bulk'"}, 400
+
+    entries = []  # (filename, content_type, open)
+    source = None
+    if request.mimetype in ZIP_MIME_TYPES:
+        source = request.args.get("filename") or "upload.zip"
+        archive = _spool(request.stream, max_total)
+        if archive is None:
+            return {"error": f"request too large (>{settings.bulk_max_mb}MB)"}, 413
+        archives = [(source, archive)]
+    else:
+        archives = []
+        for f in request.files.getlist("files") + request.files.getlist("file"):
+            if not f.filename:
+                continue
+            if f.mimetype in ZIP_MIME_TYPES or f.filename.lower().endswith(".zip"):
+                archives.append((f.filename, f.stream))
+                source = source or f.filename
+            else:
+                entries.append((f.filename, f.mimetype or "application/octet-stream",
+                                functools.partial(contextlib.nullcontext, f.stream)))
+
+    rejected = []
+    for name, stream in archives:
+        try:
+            entries.extend(_zip_entries(settings, stream))
+        except zipfile.BadZipFile:
+            rejected.append({"filename": name, "error": "not a valid ZIP archive"})
+
+    if len(entries) > settings.bulk_max_files:
+        return {"error": f"too many files ({len(entries)} > {settings.bulk_max_files})"}, 413
+
+    staged = []  # every upload staged by accepted(), for cleanup if create_documents fails
+
+    def accepted():
+        for filename, content_type, open_entry in entries:
+            try:
+                with open_entry() as stream:
+                    upload = store_upload(settings, stream)
+            except UploadTooLarge as e:
+                rejected.append({"filename": filename, "error": str(e)})
+                continue
+            problem = _check_upload_type(upload.header, content_type)
+            if problem:
+                discard_upload(upload.path)
+                rejected.append({"filename": filename, "error": problem})
+                continue
+            staged.append(upload.path)
+            yield filename, content_type, upload
+
+    files = accepted()
+    try:
+        first = next(files, None)
+        if first is None:
+            return {"error": "no supported files in request", "rejected": rejected}, 400
+        upload_id, doc_ids = create_documents(settings, itertools.chain([first], files), priority, source)
+    except BaseException:
+        # the ones storage took over are already gone
+        for path in staged:
+            discard_upload(path)
+        raise
+    return {"upload_batch_id": upload_id, "document_ids": doc_ids, "rejected": rejected}, 201
+
+@api.get("/upload-batches/<int:upload_id>")
+def get_upload_batch(upload_id: int):
+    settings = current_app.config["SETTINGS"]
+    progress = upload_batch_progress(settings, upload_id)
+    if progress is None:
+        return {"error": "not found"}, 404
+    progress["documents"] = records(list_upload_batch_documents(settings, upload_id))
+    return json_response(progress)
+
+@api.get("/upload-batches/<int:upload_id>/events")
+def upload_batch_events(upload_id: int):
+    # Aggregate progress as SSE: a `progress` event whenever the status counts change,
+    # then `done` once every document has finished. The stream sleeps on the event bus
+    # until a document of the batch changes status (services._nudge_upload_batch), then
+    # re-reads the counts from the database, at most every UPLOAD_PROGRESS_INTERVAL_S.
+    # Like a document stream it holds a gthread worker thread while open (see gunicorn.conf.py).
+    settings = current_app.config["SETTINGS"]
+    if upload_batch_progress(settings, upload_id) is None:
+        return {"error": "not found"}, 404
+    channel = events.upload_batch_channel(upload_id)
+    try:
+        # no history: the counts are read after subscribing, so no change is missed
+        sub = subscribe(channel, max_streams=settings.sse_max_streams_per_doc, replay=False)
+    except StreamLimitReached as e:
+        return {"error": str(e)}, 429, {"Retry-After": "5"}
+
+    def gen():
+        try:
+            last = None
+            while True:
+                current = upload_batch_progress(settings, upload_id)
+                read_at = time.monotonic()
+                if current != last:
+                    yield _sse("progress", current)
+                    last = current
+                if current["done"]:
+                    yield _sse("done", current)
+                    return
+                try:
+                    sub.get(timeout=settings.sse_heartbeat_s)
+                except queue.Empty:
+                    # also catches changes nobody announced (e.g. documents handed to a provider batch)
+                    yield ": keep-alive\n\n"
+                    continue
+                # coalesce the nudges of a busy batch into one read per interval
+                while True:
+                    try:
+                        sub.get(timeout=max(0.0, read_at + UPLOAD_PROGRESS_INTERVAL_S - time.monotonic()))
+                    except queue.Empty:
+                        break
+        except GeneratorExit:
+            pass
+        finally:
+            unsubscribe(channel, sub)
+
+    return Response(gen(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"
+    })
+
+def _check_upload_type(header: bytes, content_type: str) -> str | None:
+    """Returns an error message if the file is neither a PDF nor an image."""
+    if not header:
+        return "file is empty"
     # Check for PDF by magic bytes (more reliable than MIME type)
-    is_pdf = file_bytes[:4] == b"%PDF" or content_type == "application/pdf"
-    is_image = content_type.startswith("image/")
-    
+    is_pdf = header[:4] == b"%PDF" or content_type == "application/pdf"
+    is_image = content_type.startswith("image/") or sniff_image_type(header[:12]) is not None
+
     if not is_pdf and not is_image:
-        return {
-            "error": f"Unsupported file type: {content_type}. Please upload a PDF or image file (PNG, JPEG, GIF, WEBP, TIFF, BMP)."
-        }, 415
+        return (f"Unsupported file type: {content_type}. Please upload a PDF or image file "
+                f"(PNG, JPEG, GIF, WEBP, TIFF, BMP).")
+    return None
 
-    doc_id = create_document(settings, f.filename, content_type, file_bytes)
-    return {"document_id": doc_id}, 201
+def _zip_entries(settings, stream):
+    """(filename, content_type, open) for each file in the archive."""
+    limit = settings.max_upload_mb * 1024 * 1024
+    zf = zipfile.ZipFile(stream)
+    for info in zf.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        yield name, content_type, functools.partial(_open_zip_entry, zf, info, limit, settings.max_upload_mb)
+
+def _open_zip_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo, limit: int, limit_mb: int):
+    # The header's size can lie (zip bombs): store_upload also counts what actually decompresses
+    if info.file_size > limit:
+        raise UploadTooLarge(f"file too large (>{limit_mb}MB)")
+    return zf.open(info)
+
+def _spool(stream, limit: int):
+    """Copies a request body to a temp file in chunks; None if it exceeds `limit` bytes."""
+    spool = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    size = 0
+    while chunk := stream.read(1024 * 1024):
+        size += len(chunk)
+        if size > limit:
+            spool.close()
+            return None
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
 
 @api.get("/documents/<int:doc_id>")
 def get_document_status(doc_id: int):
@@ -66,26 +282,66 @@ def get_document_status(doc_id: int):
         status=doc.status,
         error=doc.error,
         extracted=extracted,
-        sales_order_id=doc.sales_order_id
+        sales_order_id=doc.sales_order_id,
+        page_count=doc.page_count,
+        timings=json.loads(doc.timings_json) if doc.timings_json else None,
     ).model_dump()
     return payload
 
+@api.delete("/documents/<int:doc_id>")
+def remove_document(doc_id: int):
+    settings = current_app.config["SETTINGS"]
+    try:
+        if not delete_document(settings, doc_id):
+            return {"error": "not found"}, 404
+    except ValueError as e:
+        return {"error": str(e)}, 409
+    return "", 204
+
 @api.get("/documents/<int:doc_id>/events")
 def document_events(doc_id: int):
-    # Server-Sent Events stream for live UI updates
-    q = subscribe(doc_id)
+    # Server-Sent Events stream for live UI updates. Browsers resend the last `id:`
+    # they saw as Last-Event-ID when they reconnect; only newer events are replayed.
+    # The loop never blocks for longer than SSE_HEARTBEAT_S, so under gevent workers
+    # (gunicorn.conf.py) thousands of idle streams cost a greenlet each, not a thread.
+    settings = current_app.config["SETTINGS"]
+    doc = get_document(settings, doc_id)
+    if not doc:
+        return {"error": "not found"}, 404
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    try:
+        sub = subscribe(doc_id, last_event_id, max_streams=settings.sse_max_streams_per_doc)
+    except StreamLimitReached as e:
+        return {"error": str(e)}, 429, {"Retry-After": "5"}
 
     def gen():
         try:
-            yield "event: status\ndata: " + json.dumps({"status": "connected"}) + "\n\n"
+            yield _sse("status", {"status": "connected"})
+            current = doc
             while True:
-                event = q.get()
-                yield f"event: {event.get('type','message')}\n"
-                yield "data: " + json.dumps(event) + "\n\n"
+                try:
+                    event_id, event = sub.get(timeout=0 if current.status in TERMINAL_STATUSES
+                                              else settings.sse_heartbeat_s)
+                except queue.Empty:
+                    if current.status in TERMINAL_STATUSES:
+                        # finished before (or while) we subscribed and its events are gone
+                        yield from _final_events(current)
+                        final_status = current.status
+                        break
+                    yield ": keep-alive\n\n"
+                    current = get_document(settings, doc_id) or current
+                    continue
+                yield _sse(event.get("type", "message"), event, event_id)
+                if event.get("type") == "error" or event.get("status") in TERMINAL_STATUSES:
+                    final_status = "failed" if event.get("type") == "error" else event["status"]
+                    break
+            yield _sse("done", {"status": final_status})
         except GeneratorExit:
             pass
         finally:
-            unsubscribe(doc_id, q)
+            unsubscribe(doc_id, sub)
 
     return Response(gen(), mimetype="text/event-stream", headers={
         "Cache-Control": "no-cache",
@@ -93,6 +349,19 @@ def document_events(doc_id: int):
         "X-Accel-Buffering": "no"
     })
 
+def _sse(event_type: str, data: dict, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return head + f"event: {event_type}\ndata: " + json.dumps(data) + "\n\n"
+
+def _final_events(doc):
+    # Rebuilds the closing events from the document row
+    if doc.status == "failed":
+        yield _sse("error", {"type": "error", "message": doc.error or "Processing failed"})
+        return
+    if doc.extracted_json:
+        yield _sse("extracted", {"type": "extracted", "data": json.loads(doc.extracted_json)})
+    yield _sse("status", {"type": "status", "status": doc.status})
+
 @api.put("/documents/<int:doc_id>/save")
 def save_extracted(doc_id: int):
     settings = current_app.config["SETTINGS"]
@@ -105,22 +374,34 @@ def save_extracted(doc_id: int):
 
 @api.get("/orders")
 def orders():
+    # ?cursor=<next_cursor from the previous page>&date_from=&date_to=&po=&so=
+    # or ?ids=1,2,3: those orders with their details (as /orders/<id>), in two queries
     settings = current_app.config["SETTINGS"]
-    limit = int(request.args.get("limit", "50"))
-    rows = list_orders(settings, limit=limit)
-    return {
-        "orders": [
-            {
-                "SalesOrderID": r.SalesOrderID,
-                "SalesOrderNumber": r.SalesOrderNumber,
-                "OrderDate": r.OrderDate.isoformat() if r.OrderDate else None,
-                "SubTotal": r.SubTotal,
-                "TaxAmt": r.TaxAmt,
-                "Freight": r.Freight,
-                "TotalDue": r.TotalDue,
-            } for r in rows
-        ]
-    }
+    if "ids" in request.args:
+        return _orders_by_id(settings)
+    try:
+        limit = min(max(int(request.args.get("limit", "50")), 1), MAX_ORDERS_PAGE)
+        rows, next_cursor = list_orders(
+            settings, limit=limit, cursor=request.args.get("cursor"),
+            date_from=_parse_date_arg("date_from"), date_to=_parse_date_arg("date_to", end_of_day=True),
+            purchase_order_number=request.args.get("po"), sales_order_number=request.args.get("so"),
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return json_response({"next_cursor": next_cursor, "orders": records(rows)})
+
+def _parse_date_arg(name: str, end_of_day: bool = False) -> datetime | None:
+    # YYYY-MM-DD or ISO datetime; a bare date_to includes that whole day
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", ""))
+    except ValueError:
+        raise ValueError(f"{name} must be YYYY-MM-DD or an ISO datetime")
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
 
 @api.get("/orders/<int:sales_order_id>")
 def order_detail(sales_order_id: int):
@@ -128,14 +409,31 @@ def order_detail(sales_order_id: int):
     header = get_order(settings, sales_order_id)
     if not header:
         return {"error": "not found"}, 404
+    return json_response(_order_payload(header))
+
+def _orders_by_id(settings):
+    try:
+        ids = list(dict.fromkeys(int(i) for arg in request.args.getlist("ids") for i in arg.split(",") if i.strip()))
+    except ValueError:
+        return {"error": "ids must be comma-separated integers"}, 400
+    if len(ids) > MAX_ORDERS_PAGE:
+        return {"error": f"at most {MAX_ORDERS_PAGE} ids per request"}, 400
+    found = get_orders(settings, ids)
+    found_ids = {h.SalesOrderID for h in found}
+    return json_response({
+        "orders": [_order_payload(h) for h in found],
+        "not_found": [i for i in ids if i not in found_ids],
+    })
+
+def _order_payload(header) -> dict:
     return {
         "header": {
             "SalesOrderID": header.SalesOrderID,
             "SalesOrderNumber": header.SalesOrderNumber,
             "PurchaseOrderNumber": header.PurchaseOrderNumber,
-            "OrderDate": header.OrderDate.isoformat() if header.OrderDate else None,
-            "DueDate": header.DueDate.isoformat() if header.DueDate else None,
-            "ShipDate": header.ShipDate.isoformat() if header.ShipDate else None,
+            "OrderDate": header.OrderDate,
+            "DueDate": header.DueDate,
+            "ShipDate": header.ShipDate,
             "SubTotal": header.SubTotal,
             "TaxAmt": header.TaxAmt,
             "Freight": header.Freight,
@@ -150,3 +448,23 @@ def order_detail(sales_order_id: int):
             } for d in header.details
         ]
     }
+
+@api.errorhandler(413)
+def request_too_large(e):
+    # MAX_CONTENT_LENGTH (see create_app) tripped while the body was being parsed
+    return {"error": "request too large"}, 413
+
+@api.get("/stats")
+def stats():
+    settings = current_app.config["SETTINGS"]
+    payload = {"scheduler": scheduler_stats(), "cache": cache.stats(), "rate_limits": governor_stats(),
+               "bulk": batch.stats(settings), "events": events.stats()}
+    write_queue = write_queue_stats(settings)
+    if write_queue is not None:
+        payload["sqlite_write_queue"] = write_queue
+    if settings.job_queue == "db":
+        payload["jobs"] = queue_stats(settings)
+    traces = tracing_stats()
+    if traces is not None:
+        payload["tracing"] = traces
+    return payload
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from . import tracing
+
+log = logging.getLogger(__name__)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+# backlog wait of the task running on each worker thread, see queue_wait_s()
+_task = threading.local()
+
+class SchedulerBusy(RuntimeError):
+    """Raised when the backlog queue is full (or draining) and a task cannot be accepted."""
+
+class ExtractionScheduler:
+    """
+    Bounded worker pool for background extraction.
+
+    - A fixed number of worker threads pull tasks from a bounded backlog queue,
+      so a burst of uploads queues up instead of spawning one thread per upload.
+    - Per-provider semaphores cap how many LLM calls run at once (see provider_slot).
+    - Tracks queue depth, in-flight counts and queue wait time for /api/stats.
+    - shutdown(drain=True) stops accepting work and lets queued tasks finish.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, provider_limits: dict[str, int] | None = None):
+        self.max_workers = max(1, max_workers)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._provider_limits = {k: max(1, v) for k, v in (provider_limits or {}).items()}
+        self._provider_sems = {k: threading.BoundedSemaphore(v) for k, v in self._provider_limits.items()}
+        self._threads: list[threading.Thread] = []
+        self._accepting = True
+        self._lock = threading.Lock()
+
+        # metrics
+        self._in_flight = 0
+        self._provider_in_flight: dict[str, int] = {k: 0 for k in self._provider_limits}
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._provider_wait_total = 0.0
+
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker, name=f"extract-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args) -> None:
+        if not self._accepting:
+            with self._lock:
+                self._rejected += 1
+            raise SchedulerBusy("scheduler is shutting down")
+        try:
+            # the task continues the submitter's trace (e.g. the upload request) on the worker thread
+            self._queue.put_nowait((time.monotonic(), tracing.bind(fn), args))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise SchedulerBusy(f"extraction backlog is full ({self._queue.maxsize} queued)")
+        with self._lock:
+            self._submitted += 1
+
+    @contextmanager
+    def provider_slot(self, provider: str):
+        """Hold one of the provider's concurrency slots for the duration of the block."""
+        sem = self._provider_sems.get(provider)
+        if sem is None:
+            yield
+            return
+        t0 = time.monotonic()
+        sem.acquire()
+        with self._lock:
+            self._provider_wait_total += time.monotonic() - t0
+            self._provider_in_flight[provider] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._provider_in_flight[provider] -= 1
+            sem.release()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            enqueued_at, fn, args = item
+            waited = time.monotonic() - enqueued_at
+            with self._lock:
+                self._in_flight += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            _task.waited = waited
+            ok = False
+            try:
+                fn(*args)
+                ok = True
+            except Exception:
+                log.exception("background task %s failed", getattr(fn, "__name__", fn))
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    if ok:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+                _task.waited = 0.0
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self._completed + self._failed + self._in_flight
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "in_flight": self._in_flight,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(1000 * self._wait_total / started, 2) if started else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 2),
+                "provider_limits": dict(self._provider_limits),
+                "provider_in_flight": dict(self._provider_in_flight),
+                "provider_wait_ms_total": round(1000 * self._provider_wait_total, 2),
+                "accepting": self._accepting,
+            }
+
+    def shutdown(self, drain: bool = True, timeout: float | None = None):
+        """Stop accepting work. With drain=True, queued tasks run to completion first."""
+        if not self._accepting:
+            return
+        self._accepting = False
+        if not drain:
+            # Drop whatever is still waiting in the backlog
+            try:
+                while True:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+            except queue.Empty:
+                pass
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            t.join(remaining)
+        alive = sum(t.is_alive() for t in self._threads)
+        if alive:
+            log.warning("scheduler shutdown timed out with %d worker(s) still busy", alive)
+
+def get_scheduler(settings) -> ExtractionScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = ExtractionScheduler(
+                    max_workers=settings.worker_concurrency,
+                    max_queue=settings.worker_queue_size,
+                    provider_limits={
+                        "anthropic": settings.anthropic_max_concurrency,
+                        "openai": settings.openai_max_concurrency,
+                    },
+                )
+                atexit.register(_scheduler.shutdown, True, settings.worker_drain_timeout_s)
+    return _scheduler
+
+def scheduler_stats() -> dict | None:
+    return _scheduler.stats() if _scheduler is not None else None
+
+def queue_wait_s() -> float:
+    """Seconds the task running on this worker thread waited in the backlog (0.0 off the pool)."""
+    return getattr(_task, "waited", 0.0)
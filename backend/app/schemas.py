@@ -39,3 +39,5 @@ class DocumentStatus(BaseModel):
     error: Optional[str] = None
     extracted: Optional[ExtractedInvoice] = None
     sales_order_id: Optional[int] = None
+    page_count: Optional[int] = None
+    timings: Optional[dict] = None   # stage timings (ms) and token usage of the last extraction attempt
@@ -1,9 +1,11 @@
 from __future__ import annotations
+import importlib.util
+import logging
 import os
 import pandas as pd
-from sqlalchemy import select, func
+from sqlalchemy import Boolean, DateTime, Float, Integer, insert, select, func
 
-from .db import get_session_factory
+from .db import get_session_factory, is_postgres, is_sqlite
 from .models import SalesOrderHeader, SalesOrderDetail
 
 DEFAULT_XLSX_CANDIDATES = [
@@ -11,6 +13,13 @@ DEFAULT_XLSX_CANDIDATES = [
     "../Case Study Data.xlsx",
 ]
 
+SHEETS = {"SalesOrderHeader": SalesOrderHeader, "SalesOrderDetail": SalesOrderDetail}
+INSERT_CHUNK_ROWS = 5000
+TRUE_STRINGS = {"1", "true", "t", "yes", "y"}
+SEED_MODES = {"empty", "sync"}
+
+log = logging.getLogger("app.seed")
+
 def maybe_seed_from_excel(app):
     settings = app.config["SETTINGS"]
     xlsx = settings.case_study_xlsx_path
@@ -23,6 +32,13 @@ def maybe_seed_from_excel(app):
 
     if not xlsx or not os.path.exists(xlsx):
         return
+    if settings.seed_mode not in SEED_MODES:
+        raise RuntimeError(f"Unsupported SEED_MODE: {settings.seed_mode}")
+    if settings.seed_mode == "sync":
+        for table, counts in sync_source(xlsx, settings).items():
+            log.info("seed sync %s: %d inserted, %d updated, %d unchanged", table,
+                     counts["inserted"], counts["updated"], counts["unchanged"])
+        return
 
     sess_factory = get_session_factory(settings)
     with sess_factory() as db:
@@ -32,92 +48,143 @@ def maybe_seed_from_excel(app):
 
     _seed(xlsx, settings)
 
-def _seed(xlsx_path: str, settings):
+def _seed(source: str, settings):
+    """
+    Loads both tables from `source`: the .xlsx workbook, or a directory holding
+    SalesOrderHeader and SalesOrderDetail as .csv or .parquet files (much faster to
+    read than the workbook). Types are coerced a column at a time and rows inserted
+    with executemany in INSERT_CHUNK_ROWS chunks.
+    """
+    frames = load_source(source)
     sess_factory = get_session_factory(settings)
-
-    hdr = pd.read_excel(xlsx_path, sheet_name="SalesOrderHeader")
-    dtl = pd.read_excel(xlsx_path, sheet_name="SalesOrderDetail")
-
-    # Normalize datetimes
-    for col in ["OrderDate", "DueDate", "ShipDate"]:
-        hdr[col] = pd.to_datetime(hdr[col], errors="coerce")
-
     with sess_factory() as db:
-        # Insert headers
-        headers = []
-        for _, r in hdr.iterrows():
-            headers.append(SalesOrderHeader(
-                SalesOrderID=int(r["SalesOrderID"]),
-                RevisionNumber=_int_or_none(r.get("RevisionNumber")),
-                OrderDate=_dt_or_none(r.get("OrderDate")),
-                DueDate=_dt_or_none(r.get("DueDate")),
-                ShipDate=_dt_or_none(r.get("ShipDate")),
-                Status=_int_or_none(r.get("Status")),
-                OnlineOrderFlag=bool(r.get("OnlineOrderFlag")) if r.get("OnlineOrderFlag") is not None else None,
-                SalesOrderNumber=_str_or_none(r.get("SalesOrderNumber")),
-                PurchaseOrderNumber=_str_or_none(r.get("PurchaseOrderNumber")),
-                AccountNumber=_str_or_none(r.get("AccountNumber")),
-                CustomerID=_int_or_none(r.get("CustomerID")),
-                SalesPersonID=_int_or_none(r.get("SalesPersonID")),
-                TerritoryID=_int_or_none(r.get("TerritoryID")),
-                BillToAddressID=_int_or_none(r.get("BillToAddressID")),
-                ShipToAddressID=_int_or_none(r.get("ShipToAddressID")),
-                ShipMethodID=_int_or_none(r.get("ShipMethodID")),
-                CreditCardID=_int_or_none(r.get("CreditCardID")),
-                CreditCardApprovalCode=_str_or_none(r.get("CreditCardApprovalCode")),
-                CurrencyRateID=_int_or_none(r.get("CurrencyRateID")),
-                SubTotal=_float_or_none(r.get("SubTotal")),
-                TaxAmt=_float_or_none(r.get("TaxAmt")),
-                Freight=_float_or_none(r.get("Freight")),
-                TotalDue=_float_or_none(r.get("TotalDue")),
-            ))
-        db.bulk_save_objects(headers)
-
-        # Insert details
-        details = []
-        for _, r in dtl.iterrows():
-            details.append(SalesOrderDetail(
-                SalesOrderDetailID=int(r["SalesOrderDetailID"]),
-                SalesOrderID=int(r["SalesOrderID"]),
-                CarrierTrackingNumber=_str_or_none(r.get("CarrierTrackingNumber")),
-                OrderQty=int(r.get("OrderQty")) if not pd.isna(r.get("OrderQty")) else 0,
-                ProductID=_int_or_none(r.get("ProductID")),
-                SpecialOfferID=_int_or_none(r.get("SpecialOfferID")),
-                UnitPrice=float(r.get("UnitPrice")) if not pd.isna(r.get("UnitPrice")) else 0.0,
-                UnitPriceDiscount=_float_or_none(r.get("UnitPriceDiscount")),
-                LineTotal=float(r.get("LineTotal")) if not pd.isna(r.get("LineTotal")) else 0.0,
-            ))
-        db.bulk_save_objects(details)
-
+        for name, model in SHEETS.items():
+            for chunk in _chunks(to_records(frames[name], model), INSERT_CHUNK_ROWS):
+                db.execute(insert(model.__table__), chunk)
         db.commit()
 
-def _str_or_none(v):
-    import pandas as pd
-    if v is None or (isinstance(v, float) and pd.isna(v)):
-        return None
-    s = str(v).strip()
-    return s if s else None
-
-def _int_or_none(v):
-    import pandas as pd
-    if v is None or (isinstance(v, float) and pd.isna(v)):
-        return None
-    try:
-        return int(v)
-    except Exception:
-        return None
-
-def _float_or_none(v):
-    import pandas as pd
-    if v is None or (isinstance(v, float) and pd.isna(v)):
-        return None
-    try:
-        return float(v)
-    except Exception:
-        return None
-
-def _dt_or_none(v):
-    import pandas as pd
-    if v is None or pd.isna(v):
-        return None
-    return v.to_pydatetime() if hasattr(v, "to_pydatetime") else v
+def sync_source(source: str, settings) -> dict[str, dict[str, int]]:
+    """
+    Brings the tables in line with `source` without wiping them (SEED_MODE=sync).
+    Rows are matched on primary key a chunk at a time and compared column by column;
+    only new or changed ones are written, with INSERT ... ON CONFLICT DO UPDATE. Rows
+    that are no longer in the source are left alone, since documents may point at them.
+    Returns {table: {"inserted": n, "updated": n, "unchanged": n}}.
+    """
+    frames = load_source(source)
+    report = {}
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        for name, model in SHEETS.items():
+            table = model.__table__
+            (pk,) = table.primary_key.columns
+            upsert = _upsert_statement(settings, table)
+            counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+            for chunk in _chunks(to_records(frames[name], model), INSERT_CHUNK_ROWS):
+                existing = {
+                    row[pk.name]: dict(row) for row in
+                    db.execute(select(table).where(pk.in_([r[pk.name] for r in chunk]))).mappings()
+                }
+                changed = []
+                for record in chunk:
+                    current = existing.get(record[pk.name])
+                    if current is None:
+                        counts["inserted"] += 1
+                    elif current == record:
+                        counts["unchanged"] += 1
+                        continue
+                    else:
+                        counts["updated"] += 1
+                    changed.append(record)
+                if changed:
+                    db.execute(upsert, changed)
+            report[table.name] = counts
+        db.commit()
+    return report
+
+def _upsert_statement(settings, table):
+    if is_sqlite(settings):
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif is_postgres(settings):
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise RuntimeError("SEED_MODE=sync needs SQLite or Postgres (INSERT ... ON CONFLICT)")
+    stmt = dialect_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[c.name for c in table.primary_key.columns],
+        set_={c.name: stmt.excluded[c.name] for c in table.columns if not c.primary_key},
+    )
+
+def load_source(source: str) -> dict[str, pd.DataFrame]:
+    """{sheet name: DataFrame} for an .xlsx workbook or a directory of .csv/.parquet files."""
+    if not os.path.isdir(source):
+        # calamine (pip install python-calamine) parses workbooks several times faster than openpyxl
+        engine = "calamine" if importlib.util.find_spec("python_calamine") else None
+        with pd.ExcelFile(source, engine=engine) as book:
+            return {name: pd.read_excel(book, sheet_name=name) for name in SHEETS}
+    frames = {}
+    for name, model in SHEETS.items():
+        base = os.path.join(source, name)
+        if os.path.exists(base + ".parquet"):
+            try:
+                frames[name] = pd.read_parquet(base + ".parquet")
+            except ImportError as e:
+                raise RuntimeError("Parquet seed files require pyarrow (pip install pyarrow)") from e
+        elif os.path.exists(base + ".csv"):
+            # text columns stay text: "0123" or an all-numeric PO number must not become a float
+            text_cols = {c.name: str for c in model.__table__.columns if _kind(c) == "str"}
+            frames[name] = pd.read_csv(base + ".csv", dtype=text_cols, keep_default_na=False,
+                                       na_values=[""])
+        else:
+            raise FileNotFoundError(f"{base}.csv or {base}.parquet not found")
+    return frames
+
+def to_records(df: pd.DataFrame, model) -> list[dict]:
+    """Rows of `df` as insert parameters for `model`, coerced to the column types (NaN/NaT -> None)."""
+    table = model.__table__
+    pk = [c.name for c in table.primary_key.columns]
+    df = df.dropna(subset=pk)
+    out = {}
+    for col in table.columns:
+        values = df[col.name] if col.name in df else pd.Series(None, index=df.index, dtype=object)
+        kind = _kind(col)
+        if kind == "int":
+            values = pd.to_numeric(values, errors="coerce").round().astype("Int64")
+        elif kind == "float":
+            values = pd.to_numeric(values, errors="coerce").astype("float64")
+        elif kind == "datetime":
+            values = pd.to_datetime(values, errors="coerce")
+        elif kind == "bool":
+            values = _to_bool(values)
+        else:
+            values = values.astype("string").str.strip().replace("", pd.NA)
+        if not col.nullable and not col.primary_key:
+            values = values.fillna(0)
+        out[col.name] = values
+    coerced = pd.DataFrame(out)
+    records = coerced.astype(object).where(coerced.notna(), None)
+    names = list(coerced.columns)
+    return [dict(zip(names, row)) for row in records.itertuples(index=False, name=None)]
+
+def _kind(col) -> str:
+    if isinstance(col.type, Boolean):
+        return "bool"
+    if isinstance(col.type, Integer):
+        return "int"
+    if isinstance(col.type, Float):
+        return "float"
+    if isinstance(col.type, DateTime):
+        return "datetime"
+    return "str"
+
+def _to_bool(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(values):
+        return values.astype("boolean")
+    if pd.api.types.is_numeric_dtype(values):
+        return (values != 0).astype("boolean").mask(values.isna())
+    text = values.astype("string").str.strip().str.lower()
+    return text.isin(TRUE_STRINGS).astype("boolean").mask(text.isna() | (text == ""))
+
+def _chunks(rows: list, size: int):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
@@ -1,54 +1,222 @@
 from __future__ import annotations
+import contextlib
+import hashlib
 import json
+import mmap
 import os
 import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from sqlalchemy import select, func
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select, func, tuple_, update
+from sqlalchemy.orm import Session, selectinload
 
 from .config import Settings
 from .db import get_session_factory
-from .events import publish
-from .models import Document, SalesOrderHeader, SalesOrderDetail
+from .events import publish, upload_batch_channel
+from .models import Document, DocumentEvent, Job, SalesOrderHeader, SalesOrderDetail, UploadBatch
 from .schemas import ExtractedInvoice
-from .doc_utils import normalize_to_png_bytes
+from .doc_utils import iter_rendered_pages
+from .image_budget import ImageBudget
 from .llm.factory import get_extractor
+from .llm.ratelimit import TransientLLMError
+from .metrics import PAGE_BYTES, PipelineTimings, track
+from .scheduler import get_scheduler, queue_wait_s, SchedulerBusy
+from . import cache, jobs, storage, tracing
 
-_executor_lock = threading.Lock()
-_executor_started = False
+# Statuses a document does not leave without user action
+TERMINAL_STATUSES = {"extracted", "saved", "failed"}
 
-def _start_background_once():
-    global _executor_started
-    with _executor_lock:
-        if not _executor_started:
-            _executor_started = True
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
-def create_document(settings: Settings, filename: str, content_type: str, file_bytes: bytes) -> int:
-    _start_background_once()
+class UploadTooLarge(ValueError):
+    """An upload went over MAX_UPLOAD_MB while it was being stored."""
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    header: bytes   # first bytes of the file, for type sniffing
+
+def store_upload(settings: Settings, stream) -> StoredUpload:
+    """
+    Stages `stream` on local disk in chunks, counting and hashing as it goes, so the file
+    is never held in memory whole. Raises UploadTooLarge (and removes the partial file)
+    as soon as it exceeds MAX_UPLOAD_MB. create_document(s) commits it to storage.
+    """
+    limit = settings.max_upload_mb * 1024 * 1024
+    staged_path = storage.new_staging_path(settings)
+    digest, size, header = hashlib.sha256(), 0, b""
+    with tracing.span("upload.store") as span:
+        try:
+            with open(staged_path, "wb") as f:
+                while chunk := stream.read(UPLOAD_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > limit:
+                        raise UploadTooLarge(f"file too large (>{settings.max_upload_mb}MB)")
+                    if len(header) < 16:
+                        header += chunk[:16 - len(header)]
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            discard_upload(staged_path)
+            raise
+        span.set(**{"upload.size": size})
+    return StoredUpload(staged_path, size, digest.hexdigest(), header)
+
+def discard_upload(path: str):
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+@contextlib.contextmanager
+def open_upload(settings: Settings, storage_path: str):
+    """
+    (read-only memory-mapped view, local path) of a stored upload; pages are read on
+    demand instead of copied. With STORAGE_BACKEND=s3 the file is downloaded first.
+    """
+    with storage.local_path(settings, storage_path) as path, open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("uploaded file is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view, path
+
+def document_hash(doc: Document, raw) -> str:
+    # computed while the upload streamed in; older rows predate the column
+    return doc.content_sha256 or cache.content_hash(raw)
+
+def create_document(settings: Settings, filename: str, content_type: str, upload: StoredUpload,
+                    priority: str = "interactive") -> int:
     sess_factory = get_session_factory(settings)
 
-    storage_path = os.path.join(settings.upload_dir, f"{int(datetime.utcnow().timestamp())}_{filename}")
-    os.makedirs(settings.upload_dir, exist_ok=True)
-    with open(storage_path, "wb") as f:
-        f.write(file_bytes)
+    with storage.storing(settings, [(upload.path, upload.sha256)]) as blobs, sess_factory() as db:
+        doc = _new_document(db, blobs, filename, content_type, upload, priority)
+        db.add(doc)
+        # job row commits with the document; `python -m app.worker` picks it up
+        _enqueue_new(db, settings, [doc], priority)
+        db.commit()
+        doc_id = doc.id
+
+    if settings.job_queue == "db" or priority == "bulk":
+        # bulk documents wait for the batch runner (batch.py)
+        return doc_id
 
+    # queue for async processing on the bounded worker pool
+    try:
+        get_scheduler(settings).submit(_process_document, settings, doc_id)
+    except SchedulerBusy as e:
+        mark_failed(settings, doc_id, str(e))
+        raise
+    return doc_id
+
+def delete_document(settings: Settings, doc_id: int) -> bool:
+    """Deletes a document with its jobs and events; its file goes once no other document shares it."""
+    sess_factory = get_session_factory(settings)
     with sess_factory() as db:
-        doc = Document(filename=filename, content_type=content_type, storage_path=storage_path, status="uploaded")
-        db.add(doc)
+        doc = db.get(Document, doc_id)
+        if not doc:
+            return False
+        if doc.status in ("processing", "batched"):
+            raise ValueError(f"document {doc_id} is being extracted")
+        storage_path, upload_batch_id = doc.storage_path, doc.upload_batch_id
+        db.execute(delete(Job).where(Job.document_id == doc_id))
+        db.execute(delete(DocumentEvent).where(DocumentEvent.document_id == doc_id))
+        if upload_batch_id is not None:
+            # the batch's progress counts documents against its total
+            db.execute(update(UploadBatch).where(UploadBatch.id == upload_batch_id)
+                       .values(total=UploadBatch.total - 1))
+        db.delete(doc)
+        db.commit()
+    _nudge_upload_batch(upload_batch_id)
+    storage.release(settings, storage_path)
+    return True
+
+def create_documents(settings: Settings, files, priority: str = "interactive",
+                     source: str | None = None) -> tuple[int, list[int]]:
+    """
+    Registers many stored uploads as one upload batch. `files` yields (filename, content_type,
+    StoredUpload); all Document (and job) rows go in one transaction.
+    Returns (upload batch id, document ids).
+    """
+    sess_factory = get_session_factory(settings)
+    stored = list(files)
+
+    uploads = [(stored_upload.path, stored_upload.sha256) for _, _, stored_upload in stored]
+    with storage.storing(settings, uploads) as blobs, sess_factory() as db:
+        upload = UploadBatch(source=source, total=len(stored), priority=priority)
+        db.add(upload)
+        db.flush()
+        docs = [_new_document(db, blobs, filename, content_type, stored_upload, priority, upload.id)
+                for filename, content_type, stored_upload in stored]
+        db.add_all(docs)
+        _enqueue_new(db, settings, docs, priority)
         db.commit()
-        db.refresh(doc)
+        upload_id, doc_ids = upload.id, [d.id for d in docs]
+
+    if settings.job_queue != "db" and priority != "bulk":
+        scheduler = get_scheduler(settings)
+        for doc_id in doc_ids:
+            try:
+                scheduler.submit(_process_document, settings, doc_id)
+            except SchedulerBusy:
+                # the whole batch is accepted; overflow waits for room instead of failing
+                _resubmit_later(settings, doc_id, settings.job_backoff_base_s)
+    return upload_id, doc_ids
+
+def upload_batch_progress(settings: Settings, upload_id: int) -> dict | None:
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        upload = db.get(UploadBatch, upload_id)
+        if not upload:
+            return None
+        counts = dict(db.execute(
+            select(Document.status, func.count()).where(Document.upload_batch_id == upload_id)
+            .group_by(Document.status)
+        ).all())
+    finished = sum(n for status, n in counts.items() if status in TERMINAL_STATUSES)
+    return {
+        "id": upload.id,
+        "source": upload.source,
+        "priority": upload.priority,
+        "total": upload.total,
+        "counts": counts,
+        "finished": finished,
+        "failed": counts.get("failed", 0),
+        "progress": round(finished / upload.total, 4) if upload.total else 1.0,
+        "done": finished >= upload.total,
+    }
+
+def list_upload_batch_documents(settings: Settings, upload_id: int) -> list:
+    # (id, filename, status, error) rows; a batch can hold thousands of documents
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        return db.execute(
+            select(Document.id, Document.filename, Document.status, Document.error)
+            .where(Document.upload_batch_id == upload_id).order_by(Document.id)
+        ).all()
+
+def _new_document(db: Session, blobs: storage.PendingBlobs, filename: str, content_type: str,
+                  upload: StoredUpload, priority: str, upload_batch_id: int | None = None) -> Document:
+    storage_path = blobs.commit(db, upload.sha256, upload.size)
+    return Document(filename=filename, content_type=content_type, storage_path=storage_path,
+                    size_bytes=upload.size, content_sha256=upload.sha256,
+                    status="queued" if priority == "bulk" else "uploaded", priority=priority,
+                    upload_batch_id=upload_batch_id)
 
-    # start async processing
-    t = threading.Thread(target=_process_document, args=(settings, doc.id), daemon=True)
-    t.start()
-    return doc.id
+def _enqueue_new(db: Session, settings: Settings, docs: list[Document], priority: str):
+    if settings.job_queue != "db" or priority == "bulk":
+        return
+    db.flush()
+    for doc in docs:
+        jobs.enqueue(db, settings, doc.id)
 
 def get_document(settings: Settings, doc_id: int) -> Document | None:
     sess_factory = get_session_factory(settings)
     with sess_factory() as db:
         return db.get(Document, doc_id)
 
-def update_document_extracted(settings: Settings, doc_id: int, extracted: ExtractedInvoice):
+def update_document_extracted(settings: Settings, doc_id: int, extracted: ExtractedInvoice,
+                              timings: dict | None = None):
     sess_factory = get_session_factory(settings)
     with sess_factory() as db:
         doc = db.get(Document, doc_id)
@@ -56,7 +224,12 @@ def update_document_extracted(settings: Settings, doc_id: int, extracted: Extrac
             return
         doc.extracted_json = extracted.model_dump_json()
         doc.status = "extracted"
+        doc.error = None
+        if timings is not None:
+            doc.timings_json = json.dumps(timings)
+        upload_batch_id = doc.upload_batch_id
         db.commit()
+    _nudge_upload_batch(upload_batch_id)
 
 def save_to_sales_orders(settings: Settings, doc_id: int, extracted: ExtractedInvoice) -> int:
     sess_factory = get_session_factory(settings)
@@ -104,53 +277,336 @@ def update_sales_order_from_payload(settings: Settings, doc_id: int, payload: di
     update_document_extracted(settings, doc_id, extracted)
     return save_to_sales_orders(settings, doc_id, extracted)
 
-def list_orders(settings: Settings, limit: int = 50):
+# what the order list shows; ix_sales_order_header_list covers exactly these
+ORDER_LIST_COLUMNS = (
+    SalesOrderHeader.SalesOrderID, SalesOrderHeader.SalesOrderNumber, SalesOrderHeader.OrderDate,
+    SalesOrderHeader.SubTotal, SalesOrderHeader.TaxAmt, SalesOrderHeader.Freight, SalesOrderHeader.TotalDue,
+)
+
+def list_orders(settings: Settings, limit: int = 50, cursor: str | None = None,
+                date_from: datetime | None = None, date_to: datetime | None = None,
+                purchase_order_number: str | None = None, sales_order_number: str | None = None):
+    """
+    One page of orders, newest first, as ORDER_LIST_COLUMNS row tuples, and the cursor
+    for the next page (None on the last).
+
+    Keyset pagination: the cursor holds the sort key of the last row, so every page is an
+    index range scan however deep it is. Without a date filter pages follow SalesOrderID;
+    with one they follow (OrderDate, SalesOrderID), the order of the date index, so a
+    narrow range never has to be sorted. `date_to` is exclusive. Raises ValueError for a
+    malformed cursor.
+    """
+    by_date = date_from is not None or date_to is not None
+    sort_key = (SalesOrderHeader.OrderDate, SalesOrderHeader.SalesOrderID) if by_date else (SalesOrderHeader.SalesOrderID,)
+    q = select(*ORDER_LIST_COLUMNS)
+    if cursor:
+        q = q.where(tuple_(*sort_key) < tuple_(*_decode_order_cursor(cursor, by_date)))
+    if date_from is not None:
+        q = q.where(SalesOrderHeader.OrderDate >= date_from)
+    if date_to is not None:
+        q = q.where(SalesOrderHeader.OrderDate < date_to)
+    if purchase_order_number:
+        q = q.where(SalesOrderHeader.PurchaseOrderNumber == purchase_order_number)
+    if sales_order_number:
+        q = q.where(SalesOrderHeader.SalesOrderNumber == sales_order_number)
+
     sess_factory = get_session_factory(settings)
     with sess_factory() as db:
-        rows = db.execute(select(SalesOrderHeader).order_by(SalesOrderHeader.SalesOrderID.desc()).limit(limit)).scalars().all()
-        return rows
+        # one extra row tells whether another page follows
+        rows = db.execute(q.order_by(*(c.desc() for c in sort_key)).limit(limit + 1)).all()
+    next_cursor = _encode_order_cursor(rows[limit - 1], by_date) if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
-def get_order(settings: Settings, sales_order_id: int):
+def _encode_order_cursor(row, by_date: bool) -> str:
+    if by_date:
+        return f"{row.OrderDate.isoformat()}_{row.SalesOrderID}"
+    return str(row.SalesOrderID)
+
+def _decode_order_cursor(cursor: str, by_date: bool) -> tuple:
+    try:
+        if by_date:
+            order_date, _, order_id = cursor.rpartition("_")
+            return datetime.fromisoformat(order_date), int(order_id)
+        return (int(cursor),)
+    except ValueError:
+        raise ValueError("invalid cursor (cursors only work with the filters they came from)")
+
+def get_order(settings: Settings, sales_order_id: int) -> SalesOrderHeader | None:
+    orders = get_orders(settings, [sales_order_id])
+    return orders[0] if orders else None
+
+def get_orders(settings: Settings, sales_order_ids: list[int]) -> list[SalesOrderHeader]:
+    """
+    Orders with their details loaded, in the order asked for; unknown ids are skipped.
+    Two queries however many ids (up to 500, selectinload's IN batch): the headers,
+    then every order's details in one IN query, so nothing lazy-loads after the
+    session closes.
+    """
+    if not sales_order_ids:
+        return []
     sess_factory = get_session_factory(settings)
     with sess_factory() as db:
-        header = db.get(SalesOrderHeader, sales_order_id)
-        if not header:
-            return None
-        # load details
-        _ = header.details
-        return header
+        headers = db.execute(
+            select(SalesOrderHeader).where(SalesOrderHeader.SalesOrderID.in_(sales_order_ids))
+            .options(selectinload(SalesOrderHeader.details))
+        ).scalars().all()
+    by_id = {h.SalesOrderID: h for h in headers}
+    return [by_id[i] for i in sales_order_ids if i in by_id]
 
 def _process_document(settings: Settings, doc_id: int):
+    # In-process path (JOB_QUEUE=memory): a rate-limited or unavailable provider
+    # reschedules the document; any other error fails it
+    with tracing.span("extract.document", **{"document.id": doc_id}) as span:
+        timings = PipelineTimings()
+        timings.add("queue", queue_wait_s())
+        try:
+            with track(timings):
+                _run_extraction(settings, doc_id, timings)
+        except TransientLLMError as e:
+            span.record_error(e)
+            delay = _transient_delay(settings, e)
+            _mark_retrying(settings, doc_id, str(e))
+            publish(doc_id, {"type": "status", "status": "retrying", "retry_in_s": round(delay, 1),
+                             "message": str(e), "timings": timings.finish("retrying")})
+            _resubmit_later(settings, doc_id, delay)
+        except Exception as e:
+            span.record_error(e)
+            summary = timings.finish("failed")
+            mark_failed(settings, doc_id, str(e), summary)
+            publish(doc_id, {"type": "error", "message": str(e), "timings": summary})
+
+def _resubmit_later(settings: Settings, doc_id: int, delay: float):
+    def resubmit():
+        try:
+            get_scheduler(settings).submit(_process_document, settings, doc_id)
+        except SchedulerBusy:
+            _resubmit_later(settings, doc_id, delay)
+    timer = threading.Timer(delay, tracing.bind(resubmit))
+    timer.daemon = True
+    timer.start()
+
+def _transient_delay(settings: Settings, e: TransientLLMError) -> float:
+    # The governor already retried with backoff; wait at least its ceiling before going again
+    return min(max(e.retry_after or 0.0, settings.llm_backoff_max_s), settings.job_backoff_max_s)
+
+def process_job(settings: Settings, job):
+    # Durable path (JOB_QUEUE=db): failures are retried with backoff until attempts run out.
+    # ValueError means the file itself is unusable, so retrying cannot help; a rate-limited
+    # or unavailable provider does not use up an attempt.
+    # the job carries the trace of the request that enqueued it across to this process
+    with tracing.attach(job.traceparent), tracing.span(
+            "extract.document", **{"document.id": job.document_id, "job.id": job.id, "job.attempt": job.attempts}
+    ) as span:
+        timings = PipelineTimings()
+        # run_after is when the job became runnable; this covers the database queue and the local backlog
+        timings.add("queue", max(0.0, (datetime.utcnow() - job.run_after).total_seconds()))
+        try:
+            with track(timings):
+                _run_extraction(settings, job.document_id, timings)
+        except Exception as e:
+            span.record_error(e)
+            transient_delay = _transient_delay(settings, e) if isinstance(e, TransientLLMError) else None
+            delay = jobs.fail(settings, job.id, str(e), retryable=not isinstance(e, ValueError),
+                              transient_delay=transient_delay)
+            if delay is None:
+                summary = timings.finish("failed")
+                mark_failed(settings, job.document_id, str(e), summary)
+                publish(job.document_id, {"type": "error", "message": str(e), "timings": summary})
+            else:
+                _mark_retrying(settings, job.document_id, str(e))
+                publish(job.document_id, {"type": "status", "status": "retrying",
+                                          "attempt": job.attempts, "retry_in_s": round(delay, 1),
+                                          "message": str(e), "timings": timings.finish("retrying")})
+            return
+        jobs.complete(settings, job.id)
+
+def recover_expired_jobs(settings: Settings) -> int:
+    """jobs.recover_expired(), failing the documents of jobs out of attempts the way process_job does."""
+    def fail_document(doc_id: int, error: str):
+        mark_failed(settings, doc_id, error)
+        publish(doc_id, {"type": "error", "message": error})
+    return jobs.recover_expired(settings, on_exhausted=fail_document)
+
+def _run_extraction(settings: Settings, doc_id: int, timings: PipelineTimings):
     sess_factory = get_session_factory(settings)
     publish(doc_id, {"type": "status", "status": "processing"})
-    with sess_factory() as db:
+    with timings.stage("db"), sess_factory() as db:
         doc = db.get(Document, doc_id)
-        if not doc:
-            return
-        doc.status = "processing"
-        db.commit()
+        if doc:
+            doc.status = "processing"
+            upload_batch_id = doc.upload_batch_id
+            db.commit()
+    if not doc:
+        return
+    _nudge_upload_batch(upload_batch_id)
 
-    try:
-        with open(doc.storage_path, "rb") as f:
-            raw = f.read()
-        png = normalize_to_png_bytes(raw, doc.content_type)
+    with contextlib.ExitStack() as stack:
+        with timings.stage("load"):
+            raw, path = stack.enter_context(open_upload(settings, doc.storage_path))
+            file_hash = document_hash(doc, raw)
+        if extract_from_cache(settings, doc_id, file_hash, timings):
+            return
 
-        publish(doc_id, {"type": "status", "status": "calling_llm"})
+        # Pages stream in as they finish rendering; each goes to the LLM right away
         extractor = get_extractor(settings)
-        extracted = extractor.extract(png)
+        provider = settings.llm_provider.lower()
+        slot = get_scheduler(settings).provider_slot
+        page_results: dict[int, ExtractedInvoice] = {}
+        page_count = 0
+        for page in render_pages(settings, extractor, doc_id, raw, doc.content_type, path):
+            page_count = page.page_count
+            _record_page(timings, page)
+            event = {"type": "status", "status": "calling_llm", "page": page.index + 1,
+                     "pages": min(page.page_count, settings.max_pdf_pages),
+                     "render_ms": round(page.render_ms, 1), "encode_ms": round(page.encode_ms, 1),
+                     "image_bytes": len(page.data), "media_type": page.media_type}
+            if page.source_bytes is not None:
+                event["bytes_saved"] = page.source_bytes - len(page.data)
+            publish(doc_id, event)
+            waiting = time.perf_counter()
+            with slot(provider):
+                timings.add("llm_wait", time.perf_counter() - waiting)
+                with timings.stage("llm"):
+                    tracing.set_attributes(**{"page.index": page.index, "page.bytes": len(page.data)})
+                    page_results[page.index] = extractor.extract(page.data, page.media_type)
+
+        if not page_results:
+            raise ValueError("document has no pages")
 
-        update_document_extracted(settings, doc_id, extracted)
-        publish(doc_id, {"type": "extracted", "data": extracted.model_dump()})
-        publish(doc_id, {"type": "status", "status": "extracted"})
+    finish_extraction(settings, doc_id, file_hash, page_results, page_count, timings)
 
-    except Exception as e:
+def _record_page(timings: PipelineTimings, page):
+    timings.add("render", page.render_ms / 1000)
+    timings.add("encode", page.encode_ms / 1000)
+    if page.wait_ms:
+        timings.add("pdfium_wait", page.wait_ms / 1000)
+    PAGE_BYTES.inc(len(page.data), media_type=page.media_type)
+    # rendered in the pool (or behind the pdfium lock) before it got here
+    tracing.record_span("extract.render_page", (page.wait_ms + page.render_ms + page.encode_ms) / 1000, **{
+        "page.index": page.index, "page.media_type": page.media_type, "page.bytes": len(page.data),
+        "page.render_ms": round(page.render_ms, 1), "page.encode_ms": round(page.encode_ms, 1),
+        "page.pdfium_wait_ms": round(page.wait_ms, 1),
+    })
+
+def render_pages(settings: Settings, extractor, doc_id: int, raw, content_type: str,
+                 source_path: str | None = None):
+    """Yields the document's pages prepared for `extractor`, recording the page count on the first one."""
+    budget = ImageBudget.from_settings(settings) if settings.image_budget_enabled else None
+    passthrough = getattr(extractor, "accepted_media_types", None)
+    first = True
+    for page in iter_rendered_pages(raw, content_type, settings.max_pdf_pages,
+                                    settings.render_processes, budget, passthrough, source_path):
+        if first:
+            _set_page_count(settings, doc_id, page.page_count)
+            first = False
+        yield page
+
+def extract_from_cache(settings: Settings, doc_id: int, file_hash: str,
+                       timings: PipelineTimings | None = None) -> bool:
+    timings = timings or PipelineTimings()
+    with timings.stage("cache"):
+        extracted = cache.get(settings, file_hash)
+    if extracted is None:
+        return False
+    _store_extracted(settings, doc_id, extracted, timings, "cached", cached=True)
+    return True
+
+def finish_extraction(settings: Settings, doc_id: int, file_hash: str,
+                      page_results: dict[int, ExtractedInvoice], page_count: int,
+                      timings: PipelineTimings | None = None):
+    """Merges per-page results (keyed by page index), caches and stores them, and notifies listeners."""
+    extracted = merge_page_extractions([page_results[i] for i in sorted(page_results)])
+    if page_count > settings.max_pdf_pages:
+        extracted.warnings.append(
+            f"Only the first {settings.max_pdf_pages} of {page_count} pages were extracted"
+        )
+    cache.put(settings, file_hash, extracted)
+    _store_extracted(settings, doc_id, extracted, timings or PipelineTimings(), "extracted")
+
+def _store_extracted(settings: Settings, doc_id: int, extracted: ExtractedInvoice,
+                     timings: PipelineTimings, outcome: str, **event):
+    # The timings are frozen before the write that stores them, so the row and the events
+    # agree; that write itself only shows up in the "save" histogram
+    summary = timings.finish(outcome)
+    with timings.stage("save"):
+        update_document_extracted(settings, doc_id, extracted, summary)
+    publish(doc_id, {"type": "extracted", "data": extracted.model_dump(), **event, "timings": summary})
+    publish(doc_id, {"type": "status", "status": "extracted"})
+
+def requeue_interactive(settings: Settings, doc_id: int, reason: str):
+    """Hands a document back to the regular one-request-per-page path (e.g. after its batch failed)."""
+    _mark_retrying(settings, doc_id, reason)
+    publish(doc_id, {"type": "status", "status": "retrying", "message": reason})
+    if settings.job_queue == "db":
+        sess_factory = get_session_factory(settings)
         with sess_factory() as db:
-            doc = db.get(Document, doc_id)
-            if doc:
-                doc.status = "failed"
-                doc.error = str(e)
-                db.commit()
-        publish(doc_id, {"type": "error", "message": str(e)})
+            jobs.enqueue(db, settings, doc_id)
+            db.commit()
+        return
+    try:
+        get_scheduler(settings).submit(_process_document, settings, doc_id)
+    except SchedulerBusy:
+        _resubmit_later(settings, doc_id, settings.job_backoff_base_s)
+
+_TOTAL_FIELDS = {"subtotal", "tax_rate", "tax_amt", "freight", "total_due"}
+
+def merge_page_extractions(pages: list[ExtractedInvoice]) -> ExtractedInvoice:
+    """
+    Combines per-page results (in page order) into one invoice.
+    Header fields come from the first page that has them, totals from the last page
+    that has them (they normally sit at the end), and line items are concatenated.
+    """
+    if len(pages) == 1:
+        return pages[0]
+    merged = {}
+    for name in ExtractedInvoice.model_fields:
+        if name in ("items", "warnings", "confidence"):
+            continue
+        values = [getattr(p, name) for p in pages if getattr(p, name) is not None]
+        if values:
+            merged[name] = values[-1] if name in _TOTAL_FIELDS else values[0]
+    merged["items"] = [li for p in pages for li in p.items]
+    confidences = [p.confidence for p in pages if p.confidence is not None]
+    merged["confidence"] = min(confidences) if confidences else None
+    merged["warnings"] = [f"page {i}: {w}" for i, p in enumerate(pages, 1) for w in p.warnings]
+    return ExtractedInvoice(**merged)
+
+def _set_page_count(settings: Settings, doc_id: int, page_count: int):
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        doc = db.get(Document, doc_id)
+        if doc:
+            doc.page_count = page_count
+            db.commit()
+
+def mark_failed(settings: Settings, doc_id: int, error: str, timings: dict | None = None):
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        doc = db.get(Document, doc_id)
+        if doc:
+            doc.status = "failed"
+            doc.error = error
+            if timings is not None:
+                doc.timings_json = json.dumps(timings)
+            upload_batch_id = doc.upload_batch_id
+            db.commit()
+            _nudge_upload_batch(upload_batch_id)
+
+def _mark_retrying(settings: Settings, doc_id: int, error: str):
+    sess_factory = get_session_factory(settings)
+    with sess_factory() as db:
+        doc = db.get(Document, doc_id)
+        if doc:
+            doc.status = "retrying"
+            doc.error = error
+            upload_batch_id = doc.upload_batch_id
+            db.commit()
+            _nudge_upload_batch(upload_batch_id)
+
+def _nudge_upload_batch(upload_batch_id: int | None):
+    # wakes the batch's progress streams (routes.upload_batch_events) to re-read its counts
+    if upload_batch_id is not None:
+        publish(upload_batch_channel(upload_batch_id), {"type": "progress"})
 
 def _parse_dt(s: str | None):
     if not s:
@@ -0,0 +1,266 @@
+"""
+Upload storage.
+
+Files are content-addressed: each is stored once, under its sha256 fanned out as
+`sha256/ab/cd/abcd...`, and every document with the same bytes points at that key.
+The stored_blobs table counts the references; the file goes away with the last one.
+
+STORAGE_BACKEND=local keeps files under UPLOAD_DIR. STORAGE_BACKEND=s3 puts them in
+an S3-compatible bucket (AWS, MinIO, scripts/fake_s3_server.py), so several API
+nodes and workers can share one store without a shared disk.
+
+Uploads are always staged on local disk first (services.store_upload hashes them
+while they stream in) and only stored here once they have been accepted (storing()).
+"""
+from __future__ import annotations
+import contextlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import Settings
+from .db import get_session_factory
+from .models import StoredBlob
+
+log = logging.getLogger("app.storage")
+
+KEY_PREFIX = "sha256/"
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+def blob_key(sha256: str) -> str:
+    return f"{KEY_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def is_blob_key(storage_path: str) -> bool:
+    # documents stored before content addressing keep their plain file path
+    return storage_path.startswith(KEY_PREFIX)
+
+def staging_dir(settings: Settings) -> str:
+    return os.path.join(settings.upload_dir, ".staging")
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, key: str, src_path: str):
+        # staging lives under the same root, so this is a hard link, not a copy; the link
+        # goes in under a temporary name and is renamed over the key, so readers never
+        # see a partial file
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(src_path, tmp)
+        except OSError:
+            shutil.copyfile(src_path, tmp)  # no hard links on this filesystem
+        os.replace(tmp, dest)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    @contextlib.contextmanager
+    def local_path(self, key: str):
+        yield self._path(key)
+
+    def delete(self, key: str):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+class S3Storage:
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None,
+                 region: str | None = None, scratch_dir: str | None = None):
+        try:
+            import boto3
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.scratch_dir = scratch_dir
+        self._client_error = ClientError
+        # Credentials come from the usual AWS_* environment variables / instance role.
+        # Custom endpoints (MinIO and friends) get path-style URLs and checksums only where
+        # S3 requires them, since many S3-compatible stores reject the streaming ones.
+        config = Config(s3={"addressing_style": "path"}, request_checksum_calculation="when_required",
+                        response_checksum_validation="when_required") if endpoint_url else None
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region, config=config)
+
+    def put(self, key: str, src_path: str):
+        with open(src_path, "rb") as f:
+            self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=f)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    @contextlib.contextmanager
+    def local_path(self, key: str):
+        """Downloads the object to a scratch file (in chunks) for as long as the block runs."""
+        if self.scratch_dir:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.scratch_dir, prefix="s3-")
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"]
+            with os.fdopen(fd, "wb") as f:
+                for chunk in body.iter_chunks(DOWNLOAD_CHUNK_BYTES):
+                    f.write(chunk)
+            yield path
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+_backend: LocalStorage | S3Storage | None = None
+_backend_lock = threading.Lock()
+
+def get_storage(settings: Settings) -> LocalStorage | S3Storage:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.storage_backend == "s3":
+                    _backend = S3Storage(settings.s3_bucket, settings.s3_prefix, settings.s3_endpoint_url,
+                                         settings.s3_region, staging_dir(settings))
+                elif settings.storage_backend == "local":
+                    _backend = LocalStorage(settings.upload_dir)
+                else:
+                    raise RuntimeError(f"Unsupported STORAGE_BACKEND: {settings.storage_backend}")
+    return _backend
+
+def new_staging_path(settings: Settings) -> str:
+    os.makedirs(staging_dir(settings), exist_ok=True)
+    return os.path.join(staging_dir(settings), uuid.uuid4().hex)
+
+class PendingBlobs:
+    """The uploads of one transaction, between storing() and its end."""
+
+    def __init__(self):
+        self.first: set[str] = set()
+
+    def commit(self, db: Session, sha256: str, size: int) -> str:
+        """
+        Counts a reference to an upload put by storing() in the caller's transaction and
+        returns its storage key; it only counts if the document row commits with it.
+
+        The stored_blobs row is the lock that orders this against release(): its UPDATE
+        (or, for new bytes, its INSERT) is held until the caller's transaction ends (on
+        SQLite, by the write queue / database write lock).
+        """
+        refcount = _add_reference(db, sha256)
+        while refcount is None:
+            try:
+                with db.begin_nested():
+                    db.add(StoredBlob(sha256=sha256, size_bytes=size, refcount=1))
+                refcount = 1
+            except IntegrityError:
+                # the same bytes were committed concurrently; count this one as a reference
+                refcount = _add_reference(db, sha256)
+        if refcount == 1:
+            # new bytes, or a row left at refcount 0: a purge may have removed the file since it was put
+            self.first.add(sha256)
+        return blob_key(sha256)
+
+@contextlib.contextmanager
+def storing(settings: Settings, uploads: list[tuple[str, str]]):
+    """
+    Takes ownership of staged uploads, given as (staged_path, sha256), for a transaction
+    run inside the block that counts their references with PendingBlobs.commit().
+
+    The files are stored before the block, so an S3 PUT never runs while the transaction
+    holds the database write lock (keys are content hashes: storing twice is harmless).
+    Once the block is done, a file whose row it created or revived is stored again if a
+    concurrent release() purged it meanwhile; the committed row now keeps it. If the
+    block raises, files no document references are purged. The staged copies go either way.
+    """
+    backend = get_storage(settings)
+    pending = PendingBlobs()
+    try:
+        for staged_path, sha256 in uploads:
+            backend.put(blob_key(sha256), staged_path)
+        yield pending
+        for staged_path, sha256 in uploads:
+            if sha256 in pending.first and not backend.exists(blob_key(sha256)):
+                backend.put(blob_key(sha256), staged_path)
+    except BaseException:
+        for sha256 in {sha256 for _, sha256 in uploads}:
+            try:
+                _purge(settings, sha256)
+            except Exception:
+                log.exception("could not remove blob %s of a failed upload", sha256)
+        raise
+    finally:
+        for staged_path, _ in uploads:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(staged_path)
+
+def release(settings: Settings, storage_path: str):
+    """Drops one reference; the file is deleted along with the last."""
+    if not is_blob_key(storage_path):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(storage_path)
+        return
+    sha256 = storage_path.rsplit("/", 1)[-1]
+    with get_session_factory(settings)() as db:
+        db.execute(
+            update(StoredBlob).where(StoredBlob.sha256 == sha256, StoredBlob.refcount > 0)
+            .values(refcount=StoredBlob.refcount - 1)
+        )
+        db.commit()
+    _purge(settings, sha256)
+
+@contextlib.contextmanager
+def local_path(settings: Settings, storage_path: str):
+    """A local file path for a stored upload, valid inside the block."""
+    if not is_blob_key(storage_path):
+        yield storage_path
+        return
+    with get_storage(settings).local_path(storage_path) as path:
+        yield path
+
+def _add_reference(db: Session, sha256: str) -> int | None:
+    """Counts one more reference; returns the new refcount, or None if the blob has no row."""
+    if not db.execute(
+        update(StoredBlob).where(StoredBlob.sha256 == sha256).values(refcount=StoredBlob.refcount + 1)
+    ).rowcount:
+        return None
+    # the UPDATE holds the row until this transaction ends, so the count can't move under us
+    return db.scalar(select(StoredBlob.refcount).where(StoredBlob.sha256 == sha256))
+
+def _purge(settings: Settings, sha256: str):
+    """
+    Deletes the blob's file if no reference to it is left. The row is re-checked and the
+    file unlinked under the row's lock, so a commit() of the same bytes either sees the row
+    gone and stores the file again, or revives the row first and keeps the file. A missing
+    row is claimed with a refcount-0 one, so that a concurrent first commit() waits for it.
+    If this transaction fails after the unlink, the row stays at refcount 0, which commit()
+    treats as "file may be gone".
+    """
+    with get_session_factory(settings)() as db:
+        try:
+            with db.begin_nested():
+                db.add(StoredBlob(sha256=sha256, size_bytes=0, refcount=0))
+        except IntegrityError:
+            pass
+        if db.execute(
+            delete(StoredBlob).where(StoredBlob.sha256 == sha256, StoredBlob.refcount <= 0)
+        ).rowcount:
+            get_storage(settings).delete(blob_key(sha256))
+        db.commit()
@@ -0,0 +1,391 @@
+"""
+Distributed tracing of the extraction pipeline in the OpenTelemetry data model:
+upload request -> queue -> background extraction -> provider calls -> SQL queries.
+
+TRACING=off (default) | file | otlp. Finished spans are batched on a background
+thread and exported as OTLP/JSON (ExportTraceServiceRequest): one request per line
+appended to TRACE_FILE, or POSTed to an OTLP/HTTP collector at TRACE_OTLP_ENDPOINT
+(scripts/fake_otlp_collector.py is a local stub). Either loads into Jaeger, Tempo or an
+OpenTelemetry Collector; scripts/trace_report.py finds the slow spans in a file.
+Exporting never blocks the pipeline: when the buffer is full, spans are dropped and counted.
+
+Context propagation:
+- The current span lives in a ContextVar, so it follows the code within a thread.
+- Incoming requests continue a W3C `traceparent` header; responses carry their own.
+- Thread handoffs carry it explicitly: the scheduler and retry timers run their task
+  under the submitter's context (bind()), and durable jobs store the traceparent of
+  the request that enqueued them (Job.traceparent), so `python -m app.worker`
+  continues the same trace.
+
+TRACE_SAMPLE_RATIO decides at the root of each trace; children follow that decision.
+The opentelemetry SDK is not needed; with tracing off, span() costs one global lookup.
+"""
+from __future__ import annotations
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager, suppress
+
+log = logging.getLogger(__name__)
+
+TRACING_MODES = {"off", "file", "otlp"}
+KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+# scrape and health-check noise
+UNTRACED_PATHS = {"/health", "/metrics"}
+MAX_STATEMENT_CHARS = 1000
+EXPORT_BATCH_SPANS = 512
+EXPORT_INTERVAL_S = 1.0
+EXPORT_QUEUE_SPANS = 20000
+
+_exporter: SpanExporter | None = None
+_sample_ratio = 1.0
+_current: contextvars.ContextVar = contextvars.ContextVar("trace_span", default=None)
+
+class SpanContext:
+    """A span's identity, e.g. a remote parent parsed from a traceparent."""
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id, self.span_id, self.sampled = trace_id, span_id, sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+class Span(SpanContext):
+    __slots__ = ("parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent: SpanContext | None, attributes: dict,
+                 start_ns: int | None = None):
+        if parent is None:
+            super().__init__(_new_id(16), _new_id(8), random.random() < _sample_ratio)
+            self.parent_id = None
+        else:
+            super().__init__(parent.trace_id, _new_id(8), parent.sampled)
+            self.parent_id = parent.span_id
+        self.name, self.kind, self.attributes = name, kind, attributes
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, e: BaseException):
+        self.error = f"{type(e).__name__}: {e}"
+
+    def end(self, end_ns: int | None = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if self.sampled and _exporter is not None:
+            _exporter.add(self)
+
+    def to_otlp(self) -> dict:
+        out = {
+            "traceId": self.trace_id, "spanId": self.span_id, "name": self.name,
+            "kind": KINDS[self.kind], "startTimeUnixNano": str(self.start_ns), "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        return out
+
+class _NoopSpan:
+    sampled = False
+
+    def set(self, **attributes):
+        pass
+
+    def record_error(self, e: BaseException):
+        pass
+
+    def end(self, end_ns: int | None = None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def _new_id(n_bytes: int) -> str:
+    return f"{random.getrandbits(n_bytes * 8) or 1:0{n_bytes * 2}x}"
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+# ---- span API ----
+
+def enabled() -> bool:
+    return _exporter is not None
+
+def start_span(name: str, kind: str = "internal", parent: SpanContext | None = None, **attributes):
+    """A started span under `parent` (default: the current span); end() it yourself."""
+    if _exporter is None:
+        return NOOP_SPAN
+    return Span(name, kind, parent if parent is not None else _current.get(), attributes)
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Runs the block in a child of the current span (a new trace if there is none)."""
+    if _exporter is None:
+        yield NOOP_SPAN
+        return
+    s = Span(name, kind, _current.get(), attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+def record_span(name: str, seconds: float, kind: str = "internal", **attributes):
+    """A child of the current span that ended just now after `seconds`, for work timed elsewhere."""
+    parent = _current.get()
+    if _exporter is None or (parent is not None and not parent.sampled):
+        return
+    now = time.time_ns()
+    Span(name, kind, parent, attributes, start_ns=now - int(seconds * 1e9)).end(now)
+
+def set_attributes(**attributes):
+    """Adds attributes to the current span, if it is recorded here."""
+    s = _current.get()
+    if isinstance(s, Span):
+        s.set(**attributes)
+
+def current_context() -> SpanContext | None:
+    return _current.get()
+
+def current_traceparent() -> str | None:
+    ctx = _current.get()
+    return ctx.traceparent if ctx is not None else None
+
+def parse_traceparent(value: str | None) -> SpanContext | None:
+    """SpanContext from a W3C traceparent (00-<32 hex>-<16 hex>-<flags>), None if malformed."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[0] == "ff" or set(parts[1]) == {"0"} or set(parts[2]) == {"0"}:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+@contextmanager
+def attach(parent: SpanContext | str | None):
+    """Makes `parent` (a SpanContext or traceparent string) the current context for the block."""
+    if isinstance(parent, str):
+        parent = parse_traceparent(parent)
+    if parent is None:
+        yield
+        return
+    token = _current.set(parent)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+def bind(fn):
+    """`fn`, made to run under the trace context current now; for handing work to another thread."""
+    parent = _current.get()
+    if parent is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with attach(parent):
+            return fn(*args, **kwargs)
+    return run
+
+# ---- instrumentation ----
+
+def instrument_app(app):
+    """A server span per Flask request, continuing an incoming traceparent header."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_span():
+        if _exporter is None or request.path in UNTRACED_PATHS or request.method == "OPTIONS":
+            return
+        route = request.url_rule.rule if request.url_rule else request.path
+        s = start_span(f"{request.method} {route}", "server",
+                       parse_traceparent(request.headers.get("traceparent")),
+                       **{"http.request.method": request.method, "http.route": route,
+                          "url.path": request.path, "http.request.body.size": request.content_length})
+        g.trace_span, g.trace_token = s, _current.set(s)
+
+    @app.after_request
+    def _tag_response(response):
+        s = g.get("trace_span")
+        if s is not None:
+            s.set(**{"http.response.status_code": response.status_code})
+            if response.status_code >= 500:
+                s.error = f"HTTP {response.status_code}"
+            response.headers["traceparent"] = s.traceparent
+        return response
+
+    @app.teardown_request
+    def _end_request_span(exc):
+        s = g.pop("trace_span", None)
+        if s is None:
+            return
+        if exc is not None:
+            s.record_error(exc)
+        with suppress(ValueError):
+            _current.reset(g.pop("trace_token"))
+        s.end()
+
+def instrument_engine(engine):
+    """A client span per SQL statement run inside a trace (queries outside one are not recorded)."""
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query_span(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if _exporter is None or parent is None or not parent.sampled or context is None:
+            return
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        context._trace_span = Span(f"db {verb}", "client", parent, {
+            "db.system": system, "db.statement": statement[:MAX_STATEMENT_CHARS],
+            "db.executemany": executemany or None,
+        })
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end_query_span(conn, cursor, statement, parameters, context, executemany):
+        s = getattr(context, "_trace_span", None)
+        if s is not None:
+            context._trace_span = None
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                s.set(**{"db.rows": cursor.rowcount})
+            s.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _fail_query_span(exception_context):
+        s = getattr(exception_context.execution_context, "_trace_span", None)
+        if s is not None:
+            exception_context.execution_context._trace_span = None
+            s.record_error(exception_context.original_exception)
+            s.end()
+
+# ---- export ----
+
+class SpanExporter:
+    """Buffers finished spans and ships them in batches from a daemon thread."""
+
+    def __init__(self, write, resource: dict):
+        self._write = write
+        self._resource = [_otlp_attribute(k, v) for k, v in resource.items()]
+        self._queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SPANS)
+        self._lock = threading.Lock()
+        self._stats = {"exported": 0, "dropped": 0, "failed": 0}
+        self._last_error_log = 0.0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def add(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "buffered": self._queue.qsize()}
+
+    def flush(self):
+        self._export(self._drain())
+
+    def _run(self):
+        while True:
+            time.sleep(EXPORT_INTERVAL_S)
+            while True:
+                batch = self._drain()
+                self._export(batch)
+                if len(batch) < EXPORT_BATCH_SPANS:
+                    break
+
+    def _drain(self) -> list:
+        batch = []
+        with suppress(queue.Empty):
+            while len(batch) < EXPORT_BATCH_SPANS:
+                batch.append(self._queue.get_nowait())
+        return batch
+
+    def _export(self, batch: list):
+        if not batch:
+            return
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": self._resource},
+            "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [s.to_otlp() for s in batch]}],
+        }]}
+        try:
+            self._write(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        except Exception as e:
+            with self._lock:
+                self._stats["failed"] += len(batch)
+            if time.monotonic() - self._last_error_log > 60:
+                self._last_error_log = time.monotonic()
+                log.warning("trace export failed (%d span(s) lost): %s", len(batch), e)
+            return
+        with self._lock:
+            self._stats["exported"] += len(batch)
+
+def _file_writer(path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(body: bytes):
+        # one O_APPEND write per batch, so processes sharing the file do not interleave lines
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, body + b"\n")
+        finally:
+            os.close(fd)
+    return write
+
+def _otlp_writer(endpoint: str):
+    import httpx
+    client = httpx.Client(timeout=10.0)
+
+    def write(body: bytes):
+        client.post(endpoint, content=body, headers={"Content-Type": "application/json"}).raise_for_status()
+    return write
+
+def configure(settings, role: str):
+    """Starts exporting per TRACING; `role` (api | worker) tags this process's spans. Idempotent."""
+    global _exporter, _sample_ratio
+    if _exporter is not None:
+        return
+    if settings.tracing not in TRACING_MODES:
+        raise RuntimeError(f"Unsupported TRACING: {settings.tracing}")
+    if settings.tracing == "off":
+        return
+    write = _file_writer(settings.trace_file) if settings.tracing == "file" else _otlp_writer(settings.trace_otlp_endpoint)
+    _sample_ratio = settings.trace_sample_ratio
+    _exporter = SpanExporter(write, {
+        "service.name": settings.trace_service_name, "service.instance.id": f"{role}-{os.getpid()}",
+        "process.pid": os.getpid(), "app.role": role,
+    })
+    atexit.register(_exporter.flush)
+
+def tracing_stats() -> dict | None:
+    return _exporter.stats() if _exporter is not None else None
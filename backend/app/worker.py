@@ -0,0 +1,84 @@
+"""
+Standalone extraction worker: `python -m app.worker`.
+
+Claims durable jobs (JOB_QUEUE=db) from the database under a lease and runs them
+on the bounded worker pool, and submits/collects provider batches for
+priority=bulk uploads. Run as many of these as needed, independently of the
+API processes. Expired leases from crashed or recycled workers are recovered at
+startup and periodically while running.
+"""
+from __future__ import annotations
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from .config import Settings  # noqa: E402
+from .db import init_db  # noqa: E402
+from .events import configure as configure_events  # noqa: E402
+from .scheduler import get_scheduler  # noqa: E402
+from .batch import start_batch_runner  # noqa: E402
+from . import metrics, tracing  # noqa: E402
+from .services import process_job, recover_expired_jobs  # noqa: E402
+from . import jobs  # noqa: E402
+
+log = logging.getLogger("app.worker")
+
+def run(settings: Settings, stop: threading.Event):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    scheduler = get_scheduler(settings)
+    batch_runner = start_batch_runner(settings)
+
+    recovered = recover_expired_jobs(settings)
+    log.info("worker %s started (concurrency=%d, recovered %d expired lease(s))",
+             worker_id, scheduler.max_workers, recovered)
+
+    maintenance_every = max(1.0, settings.job_lease_s / 3)
+    last_maintenance = time.monotonic()
+    while not stop.is_set():
+        if time.monotonic() - last_maintenance >= maintenance_every:
+            jobs.renew_leases(settings, worker_id)
+            n = recover_expired_jobs(settings)
+            if n:
+                log.info("recovered %d expired lease(s)", n)
+            last_maintenance = time.monotonic()
+
+        st = scheduler.stats()
+        free = st["workers"] - st["in_flight"] - st["queue_depth"]
+        claimed = jobs.claim(settings, worker_id, free)
+        for job in claimed:
+            scheduler.submit(process_job, settings, job)
+        if not claimed:
+            stop.wait(settings.job_poll_interval_s)
+
+    log.info("worker %s draining", worker_id)
+    batch_runner.stop(timeout=settings.worker_drain_timeout_s)
+    scheduler.shutdown(drain=True, timeout=settings.worker_drain_timeout_s)
+    # anything still running past the drain timeout dies with the process; hand it back now
+    released = jobs.release_leases(settings, worker_id)
+    if released:
+        log.warning("released %d unfinished job(s)", released)
+    log.info("worker %s stopped", worker_id)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    settings = Settings.from_env()
+    tracing.configure(settings, "worker")
+    init_db(settings)
+    configure_events(settings)
+    if settings.worker_metrics_port:
+        metrics.serve(settings.worker_metrics_port)
+        log.info("metrics on :%d/metrics", settings.worker_metrics_port)
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    run(settings, stop)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+gunicorn settings for the API: `gunicorn -c gunicorn.conf.py "app:create_app()"`.
+
+GUNICORN_WORKER_CLASS=gthread (default) serves one request per thread, and every open
+SSE stream (/api/documents/<id>/events, /api/upload-batches/<id>/events) holds its
+thread until it closes: a worker serves at most GUNICORN_THREADS requests at once,
+streams included, so WEB_CONCURRENCY x GUNICORN_THREADS open streams leave no thread
+for uploads. With GUNICORN_WORKER_CLASS=gevent each connection is a greenlet, and a
+worker can hold GUNICORN_WORKER_CONNECTIONS idle streams while uploads keep flowing
+(docker-compose runs it that way). Use gevent together with JOB_QUEUE=db, so that
+CPU-heavy extraction runs in `python -m app.worker` and not on the API's event loop;
+that is why it is not the default.
+"""
+import os
+
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "2000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
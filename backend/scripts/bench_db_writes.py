@@ -0,0 +1,168 @@
+"""
+SQLite write-concurrency benchmark for the database profile (DB_* / SQLITE_* settings).
+
+    python scripts/bench_db_writes.py --processes 2 --threads 8 -n 100
+
+Each thread runs the write pattern of one extraction, -n times: insert a document,
+mark it processing, append two progress events, read it back, store the result.
+--processes mimics the API and `python -m app.worker` writing to one file.
+
+Profiles (each gets a fresh database):
+  legacy  rollback journal, synchronous=FULL, 5 s timeout, no mmap, no write queue
+          (what a bare create_engine() gives you)
+  wal     WAL, synchronous=NORMAL, busy_timeout, mmap, sized pool
+  tuned   wal + the in-process write queue (the default)
+
+Reports write transactions/s, latency percentiles and "database is locked" errors.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+PROFILES = {
+    "legacy": {"SQLITE_JOURNAL_MODE": "delete", "SQLITE_SYNCHRONOUS": "full", "SQLITE_BUSY_TIMEOUT_MS": "5000",
+               "SQLITE_MMAP_SIZE_MB": "0", "SQLITE_WRITE_QUEUE": "off", "DB_POOL_SIZE": "5", "DB_MAX_OVERFLOW": "10"},
+    "wal": {"SQLITE_JOURNAL_MODE": "wal", "SQLITE_SYNCHRONOUS": "normal", "SQLITE_BUSY_TIMEOUT_MS": "10000",
+            "SQLITE_MMAP_SIZE_MB": "256", "SQLITE_WRITE_QUEUE": "off"},
+    "tuned": {"SQLITE_JOURNAL_MODE": "wal", "SQLITE_SYNCHRONOUS": "normal", "SQLITE_BUSY_TIMEOUT_MS": "10000",
+              "SQLITE_MMAP_SIZE_MB": "256", "SQLITE_WRITE_QUEUE": "on"},
+}
+
+RESULT = {"vendor": "Bench Supplies", "invoice_number": "SO-BENCH", "items": [{"description": "x" * 40}] * 20}
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def run_child(threads: int, n: int, start_at: float):
+    """One process: `threads` threads each running `n` extraction write patterns."""
+    from app.config import Settings
+    from app.db import get_session_factory
+    from app.models import Document, DocumentEvent
+
+    settings = Settings.from_env()
+    sess_factory = get_session_factory(settings)
+    latencies: list[float] = []
+    errors: list[str] = []
+    lock = threading.Lock()
+
+    def timed_write(fn):
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__ + ": " + str(e).splitlines()[0][:80])
+            return None
+        with lock:
+            latencies.append(time.perf_counter() - t0)
+        return result
+
+    def one_document(i: int):
+        def create():
+            with sess_factory() as db:
+                doc = Document(filename=f"bench-{i}.pdf", content_type="application/pdf",
+                               storage_path="bench", status="uploaded")
+                db.add(doc)
+                db.commit()
+                return doc.id
+
+        doc_id = timed_write(create)
+        if doc_id is None:
+            return
+
+        def set_status(status, **values):
+            def write():
+                with sess_factory() as db:
+                    doc = db.get(Document, doc_id)
+                    doc.status = status
+                    for name, value in values.items():
+                        setattr(doc, name, value)
+                    db.commit()
+            return write
+
+        def add_event(payload):
+            def write():
+                with sess_factory() as db:
+                    db.add(DocumentEvent(document_id=doc_id, type="status", payload=json.dumps(payload)))
+                    db.commit()
+            return write
+
+        timed_write(set_status("processing"))
+        timed_write(add_event({"status": "processing"}))
+        timed_write(add_event({"status": "calling_llm", "page": 1}))
+        with sess_factory() as db:
+            db.get(Document, doc_id)
+        timed_write(set_status("extracted", extracted_json=json.dumps(RESULT), page_count=1))
+
+    def worker(t: int):
+        for i in range(n):
+            one_document(t * n + i)
+
+    time.sleep(max(0.0, start_at - time.time()))
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    print(json.dumps({"elapsed": time.perf_counter() - t0, "latencies": latencies, "errors": errors}))
+
+def run_profile(name: str, processes: int, threads: int, n: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench-db-{name}-")
+    env = {**os.environ, **PROFILES[name], "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+           "UPLOAD_DIR": os.path.join(workdir, "uploads")}
+    subprocess.run([sys.executable, __file__, "--init"], env=env, check=True)
+
+    start_at = time.time() + 1.0   # let every process import and connect first
+    children = [
+        subprocess.Popen([sys.executable, __file__, "--child", "--threads", str(threads), "-n", str(n),
+                          "--start-at", str(start_at)], env=env, stdout=subprocess.PIPE, text=True)
+        for _ in range(processes)
+    ]
+    results = [json.loads(c.communicate()[0].strip().splitlines()[-1]) for c in children]
+    latencies = [lat for r in results for lat in r["latencies"]]
+    errors = [e for r in results for e in r["errors"]]
+    elapsed = max(r["elapsed"] for r in results)
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--processes", type=int, default=2, help="Writer processes (API + worker)")
+    ap.add_argument("--threads", type=int, default=8, help="Writer threads per process")
+    ap.add_argument("-n", type=int, default=100, help="Documents per thread")
+    ap.add_argument("--profiles", default="legacy,wal,tuned")
+    ap.add_argument("--init", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.init:
+        from app.config import Settings
+        from app.db import init_db
+        init_db(Settings.from_env())
+        return
+    if args.child:
+        run_child(args.threads, args.n, args.start_at)
+        return
+
+    print(f"processes={args.processes} threads={args.threads} documents={args.processes * args.threads * args.n}")
+    for name in args.profiles.split(","):
+        r = run_profile(name, args.processes, args.threads, args.n)
+        lat = r["latencies"] or [0.0]
+        print(f"{name:7} {len(r['latencies']) / r['elapsed']:8.1f} writes/s   "
+              f"p50 {1000 * statistics.median(lat):7.1f} ms   p95 {1000 * pct(lat, 95):7.1f} ms   "
+              f"p99 {1000 * pct(lat, 99):7.1f} ms   errors {len(r['errors'])}")
+        for message in sorted(set(r["errors"]))[:3]:
+            print(f"        {message}")
+
+if __name__ == "__main__":
+    main()
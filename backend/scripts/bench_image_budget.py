@@ -0,0 +1,69 @@
+"""
+Compares the legacy page image (scale 2.0, lossless PNG) with the image-budget
+output for each file in samples/: payload bytes, base64 bytes, pixels and time.
+
+    python scripts/bench_image_budget.py [--samples ../samples] [--out /tmp/budget]
+
+Use --out to write the budgeted images so legibility can be checked by eye.
+"""
+import argparse
+import base64
+import glob
+import mimetypes
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.doc_utils import iter_rendered_pages  # noqa: E402
+from app.image_budget import ImageBudget  # noqa: E402
+
+def run(path: str, budget: ImageBudget | None, out_dir: str | None = None):
+    with open(path, "rb") as f:
+        raw = f.read()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    t0 = time.perf_counter()
+    pages = list(iter_rendered_pages(raw, content_type, processes=1, budget=budget))
+    total_ms = (time.perf_counter() - t0) * 1000
+    size = sum(len(p.data) for p in pages)
+    b64 = sum(len(base64.b64encode(p.data)) for p in pages)
+    if out_dir:
+        for p in pages:
+            ext = p.media_type.split("/")[1]
+            name = f"{os.path.splitext(os.path.basename(path))[0]}_p{p.index + 1}.{ext}"
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(p.data)
+    return size, b64, total_ms, sum(p.encode_ms for p in pages)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--samples", default=os.path.join(os.path.dirname(__file__), "..", "..", "samples"))
+    ap.add_argument("--format", default="auto", choices=["auto", "jpeg", "webp", "png"])
+    ap.add_argument("--max-edge", type=int, default=1568)
+    ap.add_argument("--no-grayscale", action="store_true")
+    ap.add_argument("--out", default=None, help="Write budgeted images here")
+    args = ap.parse_args()
+
+    budget = ImageBudget(max_edge=args.max_edge, fmt=args.format, grayscale=not args.no_grayscale)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    files = sorted(glob.glob(os.path.join(args.samples, "*.pdf")) + glob.glob(os.path.join(args.samples, "*.png")))
+    print(f"{'file':40} {'legacy KB':>10} {'budget KB':>10} {'b64 saved KB':>13} {'saved %':>8} "
+          f"{'legacy ms':>10} {'budget ms':>10} {'encode ms':>10}")
+    tot_legacy = tot_budget = 0
+    for path in files:
+        l_size, l_b64, l_ms, _ = run(path, None)
+        b_size, b_b64, b_ms, enc_ms = run(path, budget, args.out)
+        tot_legacy += l_size
+        tot_budget += b_size
+        print(f"{os.path.basename(path)[:40]:40} {l_size / 1024:10.1f} {b_size / 1024:10.1f} "
+              f"{(l_b64 - b_b64) / 1024:13.1f} {100 * (1 - b_size / l_size):7.1f}% "
+              f"{l_ms:10.1f} {b_ms:10.1f} {enc_ms:10.1f}")
+    if tot_legacy:
+        print(f"total: {tot_legacy / 1024:.1f} KB -> {tot_budget / 1024:.1f} KB "
+              f"({100 * (1 - tot_budget / tot_legacy):.1f}% smaller)")
+
+if __name__ == "__main__":
+    main()
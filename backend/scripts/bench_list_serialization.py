@@ -0,0 +1,123 @@
+"""
+Order-list serialization benchmark: full ORM entities vs column-projected rows.
+
+    python scripts/bench_list_serialization.py [--pages 1000,10000] [--repeat 20]
+
+Fills a scratch SQLite database with fully populated orders, then times one list
+page (query + JSON encoding) three ways:
+  orm        select(SalesOrderHeader), all 23 columns hydrated into ORM objects,
+             dicts built by hand, stdlib json (the old /api/orders path)
+  rows+json  select(*ORDER_LIST_COLUMNS) row tuples, stdlib json
+  rows+orjson the same rows through app.jsonio (what the list endpoints use)
+
+Reports milliseconds per page, rows/s, and peak Python memory per page.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def orm_page(sess_factory, n):
+    from sqlalchemy import select
+    from app.models import SalesOrderHeader
+    with sess_factory() as db:
+        rows = db.execute(select(SalesOrderHeader).order_by(SalesOrderHeader.SalesOrderID.desc()).limit(n)).scalars().all()
+    return json.dumps({"orders": [
+        {
+            "SalesOrderID": r.SalesOrderID,
+            "SalesOrderNumber": r.SalesOrderNumber,
+            "OrderDate": r.OrderDate.isoformat() if r.OrderDate else None,
+            "SubTotal": r.SubTotal,
+            "TaxAmt": r.TaxAmt,
+            "Freight": r.Freight,
+            "TotalDue": r.TotalDue,
+        } for r in rows
+    ]}, separators=(",", ":")).encode()
+
+def projected_rows(sess_factory, n):
+    from sqlalchemy import select
+    from app.models import SalesOrderHeader
+    from app.services import ORDER_LIST_COLUMNS
+    with sess_factory() as db:
+        return db.execute(select(*ORDER_LIST_COLUMNS).order_by(SalesOrderHeader.SalesOrderID.desc()).limit(n)).all()
+
+def rows_json_page(sess_factory, n):
+    from app import jsonio
+    return json.dumps({"orders": jsonio.records(projected_rows(sess_factory, n))},
+                      default=jsonio._default, separators=(",", ":")).encode()
+
+def rows_orjson_page(sess_factory, n):
+    from app import jsonio
+    return jsonio.dumps({"orders": jsonio.records(projected_rows(sess_factory, n))})
+
+VARIANTS = {"orm": orm_page, "rows+json": rows_json_page, "rows+orjson": rows_orjson_page}
+
+def seed(sess_factory, n):
+    from sqlalchemy import insert
+    from app.models import SalesOrderHeader
+    base = datetime(2020, 1, 1)
+    rows = [{
+        "SalesOrderID": i, "RevisionNumber": 1, "OrderDate": base + timedelta(hours=i),
+        "DueDate": base + timedelta(hours=i, days=12), "ShipDate": base + timedelta(hours=i, days=7),
+        "Status": 5, "OnlineOrderFlag": i % 2 == 0, "SalesOrderNumber": f"SO{43659 + i}",
+        "PurchaseOrderNumber": f"PO{i:010d}", "AccountNumber": f"10-4020-{i:06d}", "CustomerID": i % 700,
+        "SalesPersonID": 279, "TerritoryID": 5, "BillToAddressID": 985, "ShipToAddressID": 985,
+        "ShipMethodID": 5, "CreditCardID": 16281, "CreditCardApprovalCode": f"{i}Vi84182",
+        "CurrencyRateID": None, "SubTotal": 20565.6206 + i, "TaxAmt": 1971.5149, "Freight": 616.0984,
+        "TotalDue": 23153.2339 + i,
+    } for i in range(1, n + 1)]
+    with sess_factory() as db:
+        db.execute(insert(SalesOrderHeader), rows)
+        db.commit()
+
+def measure(fn, sess_factory, n, repeat):
+    fn(sess_factory, n)  # warm up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn(sess_factory, n)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(sess_factory, n)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak, len(body)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", default="1000,10000", help="Page sizes (rows) to compare")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    sizes = [int(s) for s in args.pages.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="bench-list-")
+    os.environ.update(DATABASE_URL=f"sqlite:///{workdir}/bench.db", UPLOAD_DIR=os.path.join(workdir, "uploads"))
+    from app.config import Settings
+    from app.db import get_session_factory, init_db
+    from app.jsonio import orjson
+
+    settings = Settings.from_env()
+    init_db(settings)
+    sess_factory = get_session_factory(settings)
+    seed(sess_factory, max(sizes))
+    if orjson is None:
+        print("orjson is not installed; rows+orjson falls back to the standard library")
+
+    print(f"{'rows':>6} {'variant':12} {'ms/page':>9} {'rows/s':>11} {'peak MB':>8} {'body KB':>8} {'speedup':>8}")
+    for n in sizes:
+        baseline = None
+        for name, fn in VARIANTS.items():
+            secs, peak, size = measure(fn, sess_factory, n, args.repeat)
+            baseline = baseline or secs
+            print(f"{n:6} {name:12} {secs * 1000:9.2f} {n / secs:11,.0f} {peak / 2**20:8.2f} "
+                  f"{size / 1024:8.0f} {baseline / secs:7.1f}x")
+
+if __name__ == "__main__":
+    main()
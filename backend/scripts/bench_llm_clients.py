@@ -0,0 +1,104 @@
+"""
+Offline benchmark of extractor client strategies against scripts/fake_llm_server.py.
+
+    python scripts/bench_llm_clients.py --provider anthropic -n 300 --concurrency 100
+
+Modes:
+  per-doc  a new extractor (and HTTP pool) per document, one thread per in-flight call
+           (what get_extractor() used to do)
+  shared   the long-lived extractor from get_extractor(), one thread per in-flight call
+  async    the shared extractor's aextract() on a single event loop, no extra threads
+
+Reports throughput, latency percentiles and how many TCP connections the server saw.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.config import Settings  # noqa: E402
+from app.llm import factory  # noqa: E402
+from app.llm.anthropic_provider import AnthropicInvoiceExtractor  # noqa: E402
+from app.llm.openai_provider import OpenAIInvoiceExtractor  # noqa: E402
+from fake_llm_server import serve_in_background  # noqa: E402
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "..", "samples", "sample_invoice.png")
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def report(mode, latencies, elapsed, server, conns_before):
+    print(f"{mode:8} {len(latencies) / elapsed:9.1f} docs/s   p50 {1000 * statistics.median(latencies):7.1f} ms   "
+          f"p95 {1000 * pct(latencies, 95):7.1f} ms   connections {server.connections - conns_before}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--provider", default="anthropic", choices=["anthropic", "openai"])
+    ap.add_argument("-n", type=int, default=200, help="Documents per mode")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="Fake server latency")
+    ap.add_argument("--modes", default="per-doc,shared,async")
+    args = ap.parse_args()
+
+    server = serve_in_background(latency_ms=args.latency_ms)
+    base = f"http://127.0.0.1:{server.server_port}"
+    settings = replace(
+        Settings.from_env(), llm_provider=args.provider,
+        anthropic_api_key="fake", anthropic_base_url=base,
+        openai_api_key="fake", openai_base_url=f"{base}/v1",
+        llm_max_connections=args.concurrency,
+    )
+    with open(SAMPLE, "rb") as f:
+        image = f.read()
+
+    def per_doc_extract():
+        if args.provider == "anthropic":
+            ex = AnthropicInvoiceExtractor(api_key="fake", model=settings.anthropic_model, base_url=base)
+        else:
+            ex = OpenAIInvoiceExtractor(api_key="fake", model=settings.openai_model, base_url=f"{base}/v1",
+                                        http_client=__import__("httpx").Client())
+        return ex.extract(image, "image/png")
+
+    def timed(fn):
+        t0 = time.perf_counter()
+        fn()
+        return time.perf_counter() - t0
+
+    print(f"provider={args.provider} n={args.n} concurrency={args.concurrency} server latency={args.latency_ms} ms")
+    for mode in args.modes.split(","):
+        conns = server.connections
+        t0 = time.perf_counter()
+        if mode == "per-doc":
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                latencies = list(pool.map(lambda _: timed(per_doc_extract), range(args.n)))
+        elif mode == "shared":
+            ex = factory.get_extractor(settings)
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                latencies = list(pool.map(lambda _: timed(lambda: ex.extract(image, "image/png")), range(args.n)))
+        elif mode == "async":
+            ex = factory.get_extractor(settings)
+
+            async def run_all():
+                sem = asyncio.Semaphore(args.concurrency)
+
+                async def one():
+                    async with sem:
+                        t = time.perf_counter()
+                        await ex.aextract(image, "image/png")
+                        return time.perf_counter() - t
+                return await asyncio.gather(*(one() for _ in range(args.n)))
+            latencies = asyncio.run(run_all())
+        else:
+            raise SystemExit(f"unknown mode {mode}")
+        report(mode, latencies, time.perf_counter() - t0, server, conns)
+
+if __name__ == "__main__":
+    main()
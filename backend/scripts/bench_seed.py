@@ -0,0 +1,199 @@
+"""
+Seeding benchmark: the old row-at-a-time path vs. the vectorized one, per source format.
+
+    python scripts/bench_seed.py [--orders 31465] [--details-per-order 4] [--skip-legacy]
+
+Writes a synthetic AdventureWorks-shaped dataset (31,465 orders / ~126k lines by
+default, the size of the real one) as .xlsx, .csv and, if pyarrow is installed,
+.parquet, then seeds a fresh SQLite database from each:
+  legacy       read_excel + iterrows() + one ORM object per row + bulk_save_objects
+  xlsx/csv/parquet  app.seed._seed: column-wise coercion + chunked executemany
+
+Reports read and insert time separately (the workbook parse dominates for xlsx).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+def make_dataset(orders: int, per_order: int, seed: int = 7) -> dict[str, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    ids = np.arange(43659, 43659 + orders)
+    order_dates = pd.Timestamp(datetime(2011, 5, 31)) + pd.to_timedelta(rng.integers(0, 1100, orders), unit="D")
+    subtotal = rng.uniform(2, 30000, orders).round(4)
+    hdr = pd.DataFrame({
+        "SalesOrderID": ids, "RevisionNumber": 8, "OrderDate": order_dates,
+        "DueDate": order_dates + timedelta(days=12), "ShipDate": order_dates + timedelta(days=7),
+        "Status": 5, "OnlineOrderFlag": rng.integers(0, 2, orders).astype(bool),
+        "SalesOrderNumber": [f"SO{i}" for i in ids],
+        "PurchaseOrderNumber": np.where(rng.random(orders) < 0.12, None,
+                                        [f"PO{n}" for n in rng.integers(10**9, 10**10, orders)]),
+        "AccountNumber": [f"10-4020-{n:06d}" for n in rng.integers(1, 30000, orders)],
+        "CustomerID": rng.integers(11000, 30118, orders),
+        "SalesPersonID": np.where(rng.random(orders) < 0.88, np.nan, rng.integers(274, 291, orders)),
+        "TerritoryID": rng.integers(1, 11, orders), "BillToAddressID": rng.integers(1, 30000, orders),
+        "ShipToAddressID": rng.integers(1, 30000, orders), "ShipMethodID": 1,
+        "CreditCardID": rng.integers(1, 19000, orders),
+        "CreditCardApprovalCode": [f"{n}Vi{n % 99999}" for n in rng.integers(10**5, 10**6, orders)],
+        "CurrencyRateID": np.where(rng.random(orders) < 0.55, np.nan, rng.integers(1, 13000, orders)),
+        "SubTotal": subtotal, "TaxAmt": (subtotal * 0.08).round(4), "Freight": (subtotal * 0.025).round(4),
+        "TotalDue": (subtotal * 1.105).round(4),
+    })
+    counts = rng.integers(1, 2 * per_order, orders)
+    n = int(counts.sum())
+    qty = rng.integers(1, 12, n)
+    price = rng.uniform(1, 3500, n).round(4)
+    dtl = pd.DataFrame({
+        "SalesOrderID": np.repeat(ids, counts), "SalesOrderDetailID": np.arange(1, n + 1),
+        "CarrierTrackingNumber": [f"{n:04X}-4D1A-{n % 97:02d}" for n in rng.integers(0, 65535, n)],
+        "OrderQty": qty, "ProductID": rng.integers(707, 1000, n), "SpecialOfferID": 1,
+        "UnitPrice": price, "UnitPriceDiscount": 0.0, "LineTotal": (qty * price).round(4),
+    })
+    return {"SalesOrderHeader": hdr, "SalesOrderDetail": dtl}
+
+def write_sources(frames: dict[str, pd.DataFrame], workdir: str) -> dict[str, str]:
+    sources = {}
+    xlsx = os.path.join(workdir, "data.xlsx")
+    with pd.ExcelWriter(xlsx, engine="openpyxl") as w:
+        for name, df in frames.items():
+            df.to_excel(w, sheet_name=name, index=False)
+    sources["xlsx"] = xlsx
+    csv_dir = os.path.join(workdir, "csv")
+    os.makedirs(csv_dir)
+    for name, df in frames.items():
+        df.to_csv(os.path.join(csv_dir, name + ".csv"), index=False)
+    sources["csv"] = csv_dir
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("pyarrow not installed: skipping parquet")
+    else:
+        pq_dir = os.path.join(workdir, "parquet")
+        os.makedirs(pq_dir)
+        for name, df in frames.items():
+            df.to_parquet(os.path.join(pq_dir, name + ".parquet"), index=False)
+        sources["parquet"] = pq_dir
+    return sources
+
+def legacy_seed(xlsx_path, settings):
+    """The row-at-a-time seeding this replaces, kept here for comparison."""
+    from app.db import get_session_factory
+    from app.models import SalesOrderHeader, SalesOrderDetail
+
+    def none_if_na(v):
+        return None if v is None or (isinstance(v, float) and pd.isna(v)) else v
+
+    def as_int(v):
+        v = none_if_na(v)
+        return int(v) if v is not None else None
+
+    def as_float(v):
+        v = none_if_na(v)
+        return float(v) if v is not None else None
+
+    def as_str(v):
+        v = none_if_na(v)
+        return (str(v).strip() or None) if v is not None else None
+
+    def as_dt(v):
+        return None if v is None or pd.isna(v) else v.to_pydatetime()
+
+    t0 = time.perf_counter()
+    hdr = pd.read_excel(xlsx_path, sheet_name="SalesOrderHeader")
+    dtl = pd.read_excel(xlsx_path, sheet_name="SalesOrderDetail")
+    for col in ["OrderDate", "DueDate", "ShipDate"]:
+        hdr[col] = pd.to_datetime(hdr[col], errors="coerce")
+    read_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with get_session_factory(settings)() as db:
+        db.bulk_save_objects([SalesOrderHeader(
+            SalesOrderID=int(r["SalesOrderID"]), RevisionNumber=as_int(r.get("RevisionNumber")),
+            OrderDate=as_dt(r.get("OrderDate")), DueDate=as_dt(r.get("DueDate")), ShipDate=as_dt(r.get("ShipDate")),
+            Status=as_int(r.get("Status")), OnlineOrderFlag=bool(r.get("OnlineOrderFlag")),
+            SalesOrderNumber=as_str(r.get("SalesOrderNumber")), PurchaseOrderNumber=as_str(r.get("PurchaseOrderNumber")),
+            AccountNumber=as_str(r.get("AccountNumber")), CustomerID=as_int(r.get("CustomerID")),
+            SalesPersonID=as_int(r.get("SalesPersonID")), TerritoryID=as_int(r.get("TerritoryID")),
+            BillToAddressID=as_int(r.get("BillToAddressID")), ShipToAddressID=as_int(r.get("ShipToAddressID")),
+            ShipMethodID=as_int(r.get("ShipMethodID")), CreditCardID=as_int(r.get("CreditCardID")),
+            CreditCardApprovalCode=as_str(r.get("CreditCardApprovalCode")), CurrencyRateID=as_int(r.get("CurrencyRateID")),
+            SubTotal=as_float(r.get("SubTotal")), TaxAmt=as_float(r.get("TaxAmt")),
+            Freight=as_float(r.get("Freight")), TotalDue=as_float(r.get("TotalDue")),
+        ) for _, r in hdr.iterrows()])
+        db.bulk_save_objects([SalesOrderDetail(
+            SalesOrderDetailID=int(r["SalesOrderDetailID"]), SalesOrderID=int(r["SalesOrderID"]),
+            CarrierTrackingNumber=as_str(r.get("CarrierTrackingNumber")), OrderQty=int(r.get("OrderQty")),
+            ProductID=as_int(r.get("ProductID")), SpecialOfferID=as_int(r.get("SpecialOfferID")),
+            UnitPrice=float(r.get("UnitPrice")), UnitPriceDiscount=as_float(r.get("UnitPriceDiscount")),
+            LineTotal=float(r.get("LineTotal")),
+        ) for _, r in dtl.iterrows()])
+        db.commit()
+    return read_s, time.perf_counter() - t0
+
+def vectorized_seed(source, settings):
+    from app.db import get_session_factory
+    from app.models import SalesOrderHeader
+    from app.seed import SHEETS, INSERT_CHUNK_ROWS, _chunks, load_source, to_records
+    from sqlalchemy import insert
+
+    t0 = time.perf_counter()
+    frames = load_source(source)
+    read_s = time.perf_counter() - t0
+    # same steps as app.seed._seed, timed separately
+    t0 = time.perf_counter()
+    with get_session_factory(settings)() as db:
+        for name, model in SHEETS.items():
+            for chunk in _chunks(to_records(frames[name], model), INSERT_CHUNK_ROWS):
+                db.execute(insert(model.__table__), chunk)
+        db.commit()
+        assert db.query(SalesOrderHeader).count() == len(frames["SalesOrderHeader"])
+    return read_s, time.perf_counter() - t0
+
+def run_child(variant: str, source: str):
+    from app.config import Settings
+    from app.db import init_db
+    settings = Settings.from_env()
+    init_db(settings)
+    fn = legacy_seed if variant == "legacy" else vectorized_seed
+    read_s, insert_s = fn(source, settings)
+    print(f"{read_s} {insert_s}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=31465)
+    ap.add_argument("--details-per-order", type=int, default=4)
+    ap.add_argument("--skip-legacy", action="store_true")
+    ap.add_argument("--child", nargs=2, metavar=("VARIANT", "SOURCE"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        run_child(*args.child)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench-seed-")
+    frames = make_dataset(args.orders, args.details_per_order)
+    print(f"orders={len(frames['SalesOrderHeader'])} details={len(frames['SalesOrderDetail'])}  ({workdir})")
+    sources = write_sources(frames, workdir)
+    runs = ([] if args.skip_legacy else [("legacy", sources["xlsx"])]) + list(sources.items())
+    rows = sum(len(df) for df in frames.values())
+
+    print(f"{'variant':9} {'read s':>8} {'insert s':>9} {'total s':>8} {'rows/s':>10}")
+    for variant, source in runs:
+        # each run in its own process against a fresh database
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{workdir}/{variant}.db",
+               "UPLOAD_DIR": os.path.join(workdir, "uploads")}
+        out = subprocess.run([sys.executable, __file__, "--child", variant, source], env=env,
+                             check=True, capture_output=True, text=True).stdout
+        read_s, insert_s = map(float, out.split()[-2:])
+        total = read_s + insert_s
+        print(f"{variant:9} {read_s:8.2f} {insert_s:9.2f} {total:8.2f} {rows / total:10,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Extraction accuracy against the ground truth of a synthetic corpus, next to what it cost:
+latency, bytes sent and tokens, per pipeline variant in one table.
+
+    python scripts/generate_sample_invoices.py --count 500 --zip corpus.zip
+    python scripts/eval_extraction.py corpus.zip [-n 200] [--concurrency 8]
+        [--variant NAME[:ENV=VALUE,...]]... [--record responses.jsonl | --replay responses.jsonl]
+        [--usd-per-mtok-in 3 --usd-per-mtok-out 15] [--by format] [--details diffs.jsonl] [--fail-under 0.95]
+
+Each document is rendered and encoded the way the worker does it (IMAGE_* settings),
+sent page by page to the extractor from app.llm.factory (LLM_PROVIDER etc.), merged,
+and compared field by field with the ground truth from <corpus>.truth.jsonl:
+  - header fields: text case/space-insensitive, invoice numbers also ignoring spaces,
+    dates as ISO dates, amounts to the cent, tax_rate to 1e-5
+  - line items, aligned on their descriptions so one dropped row does not shift the
+    rest, each of description/qty/unit_price/line_total; missing or extra items count
+    as wrong
+A variant is a name plus environment overrides applied on top of the current
+environment, e.g.
+
+    --variant baseline --variant "small:IMAGE_MAX_EDGE=1024,IMAGE_FORMAT=jpeg,IMAGE_QUALITY=60"
+    --variant "legacy:IMAGE_BUDGET=off"  --variant "mini:LLM_PROVIDER=openai,OPENAI_MODEL=gpt-4o-mini"
+
+Offline: --record appends every live answer (with its latency and tokens) to a file,
+--replay answers from it without any network, reporting the recorded latency and
+tokens, under the provider and model it was recorded with (a variant setting
+LLM_PROVIDER or *_MODEL picks among several in one file). Pages are matched by their
+bytes, so a variant that changes what is sent has to be recorded once. Replay misses
+are counted as failed documents and reported, and make the exit status 1.
+
+Table columns: field acc = header fields and item fields right / compared; item acc =
+item fields only; exact = documents with every field right; latency = render + encode +
+LLM requests per document (recorded LLM time under --replay); KB, tokens and $ per document.
+"""
+import argparse
+import difflib
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config import Settings  # noqa: E402
+from app.doc_utils import iter_rendered_pages  # noqa: E402
+from app.image_budget import ImageBudget  # noqa: E402
+from app.llm.factory import get_extractor  # noqa: E402
+from app.llm.recorded_provider import RecordingExtractor, ReplayExtractor, ReplayMiss  # noqa: E402
+from app.metrics import PipelineTimings, track  # noqa: E402
+from app.schemas import ExtractedInvoice  # noqa: E402
+from app.services import merge_page_extractions  # noqa: E402
+
+ITEM_FIELDS = ("description", "qty", "unit_price", "line_total")
+AMOUNT_FIELDS = {"subtotal", "tax_amt", "freight", "total_due", "qty", "unit_price", "line_total"}
+DATE_FIELDS = {"order_date", "due_date", "ship_date"}
+DATE_FORMATS = ("%m/%d/%Y", "%b %d, %Y", "%B %d, %Y", "%d %B %Y", "%d %b %Y")
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+# ---- comparison ----
+
+def _text(value) -> str:
+    return " ".join(str(value).casefold().split())
+
+def _date(value) -> str | None:
+    value = str(value).strip()
+    try:
+        return datetime.fromisoformat(value.replace("Z", "")).date().isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def same(field: str, expected, actual) -> bool:
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if field in AMOUNT_FIELDS or field == "tax_rate":
+        try:
+            return abs(float(actual) - float(expected)) <= (1e-5 if field == "tax_rate" else 0.005)
+        except (TypeError, ValueError):
+            return False
+    if field in DATE_FIELDS:
+        return _date(actual) == _date(expected)
+    if field == "invoice_number":
+        return _text(actual).replace(" ", "") == _text(expected).replace(" ", "")
+    return _text(actual) == _text(expected)
+
+def align_items(expected: list[dict], items: list) -> list[tuple]:
+    """(expected, extracted) pairs: equal descriptions match, rows in between pair up in order."""
+    matcher = difflib.SequenceMatcher(None, [_text(e["description"]) for e in expected],
+                                      [_text(a.description) for a in items], autojunk=False)
+    pairs = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("equal", "replace"):
+            pairs.extend(zip(expected[i1:i2], items[j1:j2]))
+    return pairs
+
+def diff(truth: dict, extracted: ExtractedInvoice) -> dict:
+    """{field: right?} for every header field in `truth`, and (right, compared) per item field."""
+    fields = {name: same(name, expected, getattr(extracted, name, None))
+              for name, expected in truth.items() if name != "items"}
+    expected_items, items = truth.get("items", []), extracted.items
+    compared = max(len(expected_items), len(items))
+    pairs = align_items(expected_items, items)
+    item_fields = {}
+    for name in ITEM_FIELDS:
+        right = sum(same(name, e[name], getattr(a, name)) for e, a in pairs)
+        item_fields[name] = (right, compared)
+    return {"fields": fields, "items": item_fields, "item_count": len(expected_items) == len(items)}
+
+# ---- running ----
+
+@contextmanager
+def patched_env(overrides: dict):
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def parse_variant(text: str) -> tuple[str, dict]:
+    name, _, spec = text.partition(":")
+    overrides = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        key, sep, value = part.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"expected ENV=VALUE, got {part!r}")
+        overrides[key.strip().upper()] = value.strip()
+    return name or "current", overrides
+
+def model_of(settings: Settings) -> str:
+    provider = settings.llm_provider.lower()
+    return {"openai": settings.openai_model, "anthropic": settings.anthropic_model}.get(provider, provider)
+
+def build_extractor(settings: Settings, overrides: dict, args):
+    if args.replay:
+        # provider and model come from the recording unless the variant picks them
+        provider = settings.llm_provider.lower() if "LLM_PROVIDER" in overrides else None
+        model = model_of(settings) if overrides.keys() & {"OPENAI_MODEL", "ANTHROPIC_MODEL"} else None
+        try:
+            return ReplayExtractor(args.replay, provider, model)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    extractor = get_extractor(settings)
+    return RecordingExtractor(extractor, args.record) if args.record else extractor
+
+def evaluate(settings: Settings, extractor, name: str, data: bytes, truth: dict) -> dict:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    budget = ImageBudget.from_settings(settings) if settings.image_budget_enabled else None
+    passthrough = getattr(extractor, "accepted_media_types", None)
+    timings = PipelineTimings()
+    pages, sent, prep_ms, error, miss = {}, 0, 0.0, None, False
+    try:
+        with track(timings):
+            for page in iter_rendered_pages(data, content_type, settings.max_pdf_pages,
+                                            settings.render_processes, budget, passthrough):
+                prep_ms += page.render_ms + page.encode_ms
+                sent += len(page.data)
+                pages[page.index] = extractor.extract(page.data, page.media_type)
+        extracted = merge_page_extractions([pages[i] for i in sorted(pages)])
+    except Exception as e:
+        error, miss = f"{type(e).__name__}: {e}", isinstance(e, ReplayMiss)
+        extracted = ExtractedInvoice()
+    return {
+        "diff": diff(truth, extracted), "error": error, "miss": miss, "pages": len(pages), "bytes": sent,
+        "prep_ms": prep_ms, "llm_ms": timings.llm_request_ms, "requests": timings.llm_requests,
+        "input_tokens": timings.input_tokens, "output_tokens": timings.output_tokens,
+    }
+
+def run_variant(variant: tuple[str, dict], corpus: zipfile.ZipFile, records: list[dict], args) -> list[dict]:
+    label, overrides = variant
+    with patched_env(overrides):
+        settings = Settings.from_env()
+    extractor = build_extractor(settings, overrides, args)
+    lock = threading.Lock()
+
+    def one(record):
+        with lock:  # ZipFile reads share one file handle
+            data = corpus.read(record["file"])
+        return {**evaluate(settings, extractor, record["file"], data, record["truth"]), "record": record}
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, records))
+    print(f"{label}: {len(results)} document(s) in {time.perf_counter() - t0:.1f}s "
+          f"({extractor.provider}/{getattr(extractor, 'model', None) or model_of(settings)}"
+          f"{' replayed' if args.replay else ''})", flush=True)
+    return results
+
+# ---- reporting ----
+
+def summarize(results: list[dict], args) -> dict:
+    right = compared = item_right = item_compared = exact = 0
+    for r in results:
+        d = r["diff"]
+        header_ok = sum(d["fields"].values())
+        items_ok = sum(ok for ok, _ in d["items"].values())
+        items_n = sum(n for _, n in d["items"].values())
+        right += header_ok + items_ok
+        compared += len(d["fields"]) + items_n
+        item_right += items_ok
+        item_compared += items_n
+        exact += header_ok == len(d["fields"]) and items_ok == items_n and d["item_count"] and not r["error"]
+    n = len(results) or 1
+    latency = [r["prep_ms"] + r["llm_ms"] for r in results] or [0.0]
+    tokens_in = sum(r["input_tokens"] for r in results)
+    tokens_out = sum(r["output_tokens"] for r in results)
+    usd = (tokens_in * args.usd_per_mtok_in + tokens_out * args.usd_per_mtok_out) / 1e6
+    return {
+        "docs": len(results), "errors": sum(1 for r in results if r["error"]),
+        "replay_misses": sum(1 for r in results if r["miss"]),
+        "field_acc": right / compared if compared else 0.0,
+        "item_acc": item_right / item_compared if item_compared else 1.0,
+        "exact": exact / n,
+        "p50_ms": pct(latency, 50), "p95_ms": pct(latency, 95),
+        "llm_ms": sum(r["llm_ms"] for r in results) / n, "prep_ms": sum(r["prep_ms"] for r in results) / n,
+        "kb": sum(r["bytes"] for r in results) / n / 1024,
+        "tokens_in": tokens_in / n, "tokens_out": tokens_out / n,
+        "usd_per_1k": usd / n * 1000 if usd else None,
+    }
+
+def field_accuracy(results: list[dict]) -> dict:
+    right, total = defaultdict(int), defaultdict(int)
+    for r in results:
+        for name, ok in r["diff"]["fields"].items():
+            right[name] += ok
+            total[name] += 1
+        for name, (ok, n) in r["diff"]["items"].items():
+            right[f"items.{name}"] += ok
+            total[f"items.{name}"] += n
+    return {name: right[name] / total[name] for name in total if total[name]}
+
+def print_tables(runs: dict, args):
+    summaries = {label: summarize(results, args) for label, results in runs.items()}
+    print(f"\n{'variant':16} {'docs':>5} {'err':>4} {'field acc':>9} {'item acc':>8} {'exact':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'prep ms':>8} {'llm ms':>8} {'KB/doc':>7} {'tok in':>7} "
+          f"{'tok out':>7} {'$/1k':>7}")
+    for label, s in summaries.items():
+        usd = f"{s['usd_per_1k']:7.2f}" if s["usd_per_1k"] is not None else f"{'-':>7}"
+        print(f"{label[:16]:16} {s['docs']:5} {s['errors']:4} {s['field_acc']:9.1%} {s['item_acc']:8.1%} "
+              f"{s['exact']:6.1%} {s['p50_ms']:8.0f} {s['p95_ms']:8.0f} {s['prep_ms']:8.0f} {s['llm_ms']:8.0f} "
+              f"{s['kb']:7.1f} {s['tokens_in']:7.0f} {s['tokens_out']:7.0f} {usd}")
+    for label, s in summaries.items():
+        if s["replay_misses"]:
+            print(f"  {label}: {s['replay_misses']} document(s) had pages missing from {args.replay}; "
+                  f"record this variant first (--record)")
+
+    labels = list(runs)
+    per_field = {label: field_accuracy(results) for label, results in runs.items()}
+    names = list(dict.fromkeys(name for label in labels for name in per_field[label]))
+    print(f"\n{'field':22} " + " ".join(f"{label[:10]:>10}" for label in labels))
+    for name in names:
+        print(f"{name[:22]:22} " + " ".join(
+            f"{per_field[label][name]:10.1%}" if name in per_field[label] else f"{'-':>10}" for label in labels))
+
+    if args.by:
+        groups = defaultdict(dict)
+        for label, results in runs.items():
+            slices = defaultdict(list)
+            for r in results:
+                slices[str(r["record"].get(args.by, "?"))].append(r)
+            for key, group in slices.items():
+                groups[key][label] = summarize(group, args)
+        print(f"\nfield acc by {args.by:10} " + " ".join(f"{label[:10]:>10}" for label in labels) + f" {'docs':>6}")
+        for key in sorted(groups):
+            row = groups[key]
+            docs = next(iter(row.values()))["docs"]
+            print(f"{key[:23]:23} " + " ".join(
+                f"{row[label]['field_acc']:10.1%}" if label in row else f"{'-':>10}" for label in labels) + f" {docs:6}")
+    return summaries
+
+def write_details(path: str, runs: dict):
+    with open(path, "w") as f:
+        for label, results in runs.items():
+            for r in results:
+                d = r["diff"]
+                wrong = [name for name, ok in d["fields"].items() if not ok]
+                wrong += [f"items.{name}" for name, (ok, n) in d["items"].items() if ok < n]
+                f.write(json.dumps({"variant": label, "file": r["record"]["file"], "error": r["error"],
+                                    "wrong": wrong, "item_count_ok": d["item_count"], "pages": r["pages"],
+                                    "bytes": r["bytes"], "llm_ms": round(r["llm_ms"], 1),
+                                    "input_tokens": r["input_tokens"], "output_tokens": r["output_tokens"]}) + "\n")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("corpus", help="ZIP written by generate_sample_invoices.py --count")
+    ap.add_argument("--truth", help="Ground truth (default: <corpus>.truth.jsonl)")
+    ap.add_argument("-n", type=int, default=0, help="Only the first n documents")
+    ap.add_argument("--variant", action="append", type=parse_variant, default=[],
+                    help="NAME[:ENV=VALUE,...]; repeat to compare (default: the current environment)")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--record", help="Append live responses to this file")
+    mode.add_argument("--replay", help="Answer from responses recorded with --record (no network)")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--usd-per-mtok-in", type=float, default=0.0, help="Input token price for the $/1k column")
+    ap.add_argument("--usd-per-mtok-out", type=float, default=0.0, help="Output token price for the $/1k column")
+    ap.add_argument("--by", choices=["format", "template", "pages", "rotation", "dpi"],
+                    help="Also break field accuracy down by this corpus attribute")
+    ap.add_argument("--details", help="Write each document's wrong fields here (JSON lines)")
+    ap.add_argument("--out", help="Write the summary table as JSON")
+    ap.add_argument("--fail-under", type=float,
+                    help="Exit 1 if any variant's field accuracy is below this (0-1); replay misses always do")
+    args = ap.parse_args()
+
+    truth_path = args.truth or os.path.splitext(args.corpus)[0] + ".truth.jsonl"
+    records = []
+    with open(truth_path) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+                if args.n and len(records) >= args.n:
+                    break
+    if not records:
+        raise SystemExit(f"no documents in {truth_path}")
+    variants = args.variant or [("current", {})]
+
+    runs = {}
+    with zipfile.ZipFile(args.corpus) as corpus:
+        for variant in variants:
+            runs[variant[0]] = run_variant(variant, corpus, records, args)
+
+    summaries = print_tables(runs, args)
+    if args.details:
+        write_details(args.details, runs)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summaries, f, indent=2)
+    status = 0
+    if any(s["replay_misses"] for s in summaries.values()):
+        # a table over documents that were never answered says nothing about accuracy
+        status = 1
+    if args.fail_under is not None:
+        failing = [label for label, s in summaries.items() if s["field_acc"] < args.fail_under]
+        if failing:
+            print(f"\nfield accuracy below {args.fail_under:.1%}: {', '.join(failing)}")
+            status = 1
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
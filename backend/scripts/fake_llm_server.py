@@ -0,0 +1,332 @@
+"""
+Local stand-in for the Anthropic and OpenAI HTTP APIs, for offline benchmarks.
+
+    python scripts/fake_llm_server.py --port 8089 --latency-ms 800
+
+Then point the app (or scripts/bench_llm_clients.py) at it:
+
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+
+Every request gets the same canned invoice back after --latency-ms (+/- jitter),
+in the shape each SDK expects (Anthropic tool_use / OpenAI structured output).
+
+Batch endpoints (Anthropic /v1/messages/batches, OpenAI /v1/files + /v1/batches) are
+served too: a batch ends --batch-delay-s after it is created, and --batch-error-ratio
+of its results come back errored.
+
+To exercise the rate governor, --rate-limit-ratio answers that fraction of requests
+with 429 + retry-after, and --overload-ratio with 529 (Anthropic) / 503 (OpenAI).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_INVOICE = {
+    "invoice_number": "SO-FAKE-0001",
+    "purchase_order_number": "PO-12345",
+    "order_date": "2026-01-30",
+    "due_date": "2026-03-01",
+    "ship_date": None,
+    "salesperson": "Demo Rep",
+    "ship_via": "UPS Ground",
+    "terms": "Net 30",
+    "subtotal": 2325.0,
+    "tax_rate": 0.06875,
+    "tax_amt": 159.84,
+    "freight": 0.0,
+    "total_due": 2484.84,
+    "currency": "USD",
+    "bill_to_name": "Acme Retail LLC",
+    "ship_to_name": "Acme Retail LLC",
+    "items": [
+        {"item_number": None, "description": "Product XYZ", "qty": 15, "unit_price": 150.0, "line_total": 2250.0},
+        {"item_number": None, "description": "Product ABC", "qty": 1, "unit_price": 75.0, "line_total": 75.0},
+    ],
+    "confidence": 0.99,
+    "warnings": [],
+}
+
+def anthropic_message(model: str, input_tokens: int) -> dict:
+    return {
+        "id": f"msg_fake_{random.getrandbits(48):x}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "tool_use", "id": "toolu_fake", "name": "extract_invoice",
+                     "input": CANNED_INVOICE}],
+        "stop_reason": "tool_use",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": 350},
+    }
+
+def openai_completion(model: str, input_tokens: int) -> dict:
+    return {
+        "id": f"chatcmpl-fake{random.getrandbits(48):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(CANNED_INVOICE), "refusal": None},
+            "finish_reason": "stop",
+            "logprobs": None,
+        }],
+        "usage": {"prompt_tokens": input_tokens, "completion_tokens": 350,
+                  "total_tokens": input_tokens + 350},
+    }
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so client connection pooling is measurable
+    server_version = "FakeLLM/1.0"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.count_request()
+        if self.path.endswith("/messages/batches"):
+            return self._anthropic_batch_create(json.loads(body or b"{}"))
+        if self.path.endswith("/files"):
+            return self._openai_file_upload(body)
+        if self.path.endswith("/batches"):
+            return self._openai_batch_create(json.loads(body or b"{}"))
+
+        self._sleep()
+        if self._inject_error():
+            return
+        input_tokens = max(1, len(body) // 4)
+        model = json.loads(body or b"{}").get("model", "fake")
+        if self.path.endswith("/messages"):
+            self._json(200, anthropic_message(model, input_tokens))
+        elif self.path.endswith("/chat/completions"):
+            self._json(200, openai_completion(model, input_tokens))
+        else:
+            self._json(404, {"error": {"type": "not_found", "message": f"no route for {self.path}"}})
+
+    def do_GET(self):
+        self.server.count_request()
+        parts = self.path.split("?")[0].rstrip("/").split("/")
+        if "batches" in parts and parts[-1] == "results":
+            return self._anthropic_batch_results(parts[-2])
+        if "messages" in parts and "batches" in parts:
+            return self._anthropic_batch_get(parts[-1])
+        if "batches" in parts:
+            return self._openai_batch_get(parts[-1])
+        if "files" in parts and parts[-1] == "content":
+            return self._openai_file_content(parts[-2])
+        self._json(404, {"error": {"type": "not_found", "message": f"no route for {self.path}"}})
+
+    # ---- Anthropic Message Batches ----
+
+    def _anthropic_batch_create(self, payload: dict):
+        batch_id = f"msgbatch_fake{random.getrandbits(48):x}"
+        self.server.batches[batch_id] = {"created": time.time(), "requests": payload.get("requests", [])}
+        self._json(200, self._anthropic_batch(batch_id))
+
+    def _anthropic_batch_get(self, batch_id: str):
+        if batch_id not in self.server.batches:
+            return self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": batch_id}})
+        self._json(200, self._anthropic_batch(batch_id))
+
+    def _anthropic_batch(self, batch_id: str) -> dict:
+        batch = self.server.batches[batch_id]
+        n = len(batch["requests"])
+        ended = self.server.batch_ended(batch)
+        created = _iso(batch["created"])
+        return {
+            "id": batch_id, "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else n, "succeeded": n if ended else 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": created, "expires_at": _iso(batch["created"] + 86400),
+            "ended_at": _iso(time.time()) if ended else None,
+            "cancel_initiated_at": None, "archived_at": None,
+            "results_url": (f"http://{self.headers.get('Host')}/v1/messages/batches/{batch_id}/results"
+                            if ended else None),
+        }
+
+    def _anthropic_batch_results(self, batch_id: str):
+        batch = self.server.batches.get(batch_id)
+        if batch is None or not self.server.batch_ended(batch):
+            return self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": batch_id}})
+        lines = []
+        for req in batch["requests"]:
+            if random.random() < self.server.batch_error_ratio:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "fake batch error"}}}
+            else:
+                result = {"type": "succeeded", "message": anthropic_message(req["params"].get("model", "fake"), 1000)}
+            lines.append(json.dumps({"custom_id": req["custom_id"], "result": result}))
+        self._raw(200, ("\n".join(lines) + "\n").encode("utf-8"), "application/binary")
+
+    # ---- OpenAI Files + Batch API ----
+
+    def _openai_file_upload(self, body: bytes):
+        # multipart/form-data: keep the "file" part's payload
+        boundary = self.headers.get("Content-Type", "").split("boundary=")[-1].encode()
+        content = b""
+        for part in body.split(b"--" + boundary):
+            if b'name="file"' in part:
+                content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+        file_id = f"file-fake{random.getrandbits(48):x}"
+        self.server.files[file_id] = content
+        self._json(200, {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                         "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+
+    def _openai_batch_create(self, payload: dict):
+        batch_id = f"batch_fake{random.getrandbits(48):x}"
+        lines = self.server.files.get(payload.get("input_file_id"), b"").decode("utf-8").splitlines()
+        self.server.batches[batch_id] = {"created": time.time(), "requests": [json.loads(x) for x in lines if x],
+                                         "payload": payload}
+        self._json(200, self._openai_batch(batch_id))
+
+    def _openai_batch_get(self, batch_id: str):
+        if batch_id not in self.server.batches:
+            return self._json(404, {"error": {"type": "not_found", "message": batch_id}})
+        self._json(200, self._openai_batch(batch_id))
+
+    def _openai_batch(self, batch_id: str) -> dict:
+        batch = self.server.batches[batch_id]
+        n = len(batch["requests"])
+        ended = self.server.batch_ended(batch)
+        if ended and "output_file_id" not in batch:
+            batch["output_file_id"] = f"file-out{random.getrandbits(48):x}"
+            lines = []
+            for req in batch["requests"]:
+                if random.random() < self.server.batch_error_ratio:
+                    response = {"status_code": 503, "request_id": "req_fake", "body": {"error": {"message": "fake"}}}
+                else:
+                    response = {"status_code": 200, "request_id": "req_fake",
+                                "body": openai_completion(req["body"].get("model", "fake"), 1000)}
+                lines.append(json.dumps({"id": f"batch_req_{random.getrandbits(32):x}",
+                                         "custom_id": req["custom_id"], "response": response, "error": None}))
+            self.server.files[batch["output_file_id"]] = ("\n".join(lines) + "\n").encode("utf-8")
+        return {
+            "id": batch_id, "object": "batch", "endpoint": batch["payload"].get("endpoint"),
+            "input_file_id": batch["payload"].get("input_file_id"),
+            "completion_window": batch["payload"].get("completion_window", "24h"),
+            "status": "completed" if ended else "in_progress",
+            "output_file_id": batch.get("output_file_id"), "error_file_id": None,
+            "created_at": int(batch["created"]),
+            "request_counts": {"total": n, "completed": n if ended else 0, "failed": 0},
+        }
+
+    def _openai_file_content(self, file_id: str):
+        if file_id not in self.server.files:
+            return self._json(404, {"error": {"type": "not_found", "message": file_id}})
+        self._raw(200, self.server.files[file_id], "application/octet-stream")
+
+    def _inject_error(self) -> bool:
+        roll = random.random()
+        server = self.server
+        if roll < server.rate_limit_ratio:
+            server.count_error("rate_limited")
+            self._json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "fake rate limit"}},
+                       {"retry-after": f"{server.retry_after_s:g}"})
+            return True
+        if roll < server.rate_limit_ratio + server.overload_ratio:
+            server.count_error("overloaded")
+            status = 529 if self.path.endswith("/messages") else 503
+            self._json(status, {"type": "error", "error": {"type": "overloaded_error", "message": "fake overload"}})
+            return True
+        return False
+
+    def _sleep(self):
+        latency = self.server.latency_ms
+        if latency > 0:
+            jitter = latency * self.server.jitter
+            time.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)) / 1000)
+
+    def _json(self, status: int, payload: dict, headers: dict | None = None):
+        self._raw(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _raw(self, status: int, data: bytes, content_type: str, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency_ms: float = 0.0, jitter: float = 0.2, verbose: bool = False,
+                 rate_limit_ratio: float = 0.0, overload_ratio: float = 0.0, retry_after_s: float = 1.0,
+                 batch_delay_s: float = 2.0, batch_error_ratio: float = 0.0):
+        super().__init__(addr, FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.verbose = verbose
+        self.rate_limit_ratio = rate_limit_ratio
+        self.overload_ratio = overload_ratio
+        self.retry_after_s = retry_after_s
+        self.batch_delay_s = batch_delay_s
+        self.batch_error_ratio = batch_error_ratio
+        self.batches: dict[str, dict] = {}
+        self.files: dict[str, bytes] = {}
+        self.requests = 0
+        self.connections = 0
+        self.errors = {"rate_limited": 0, "overloaded": 0}
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def batch_ended(self, batch: dict) -> bool:
+        return time.time() - batch["created"] >= self.batch_delay_s
+
+    def count_error(self, kind: str):
+        with self._lock:
+            self.errors[kind] += 1
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+def serve_in_background(port: int = 0, **kwargs) -> FakeLLMServer:
+    """Starts the server on a daemon thread; port 0 picks a free port (see server.server_port)."""
+    server = FakeLLMServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=800.0)
+    ap.add_argument("--jitter", type=float, default=0.2, help="Latency jitter as a fraction of --latency-ms")
+    ap.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of requests answered with 429")
+    ap.add_argument("--overload-ratio", type=float, default=0.0, help="Fraction of requests answered with 529/503")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds sent with 429s")
+    ap.add_argument("--batch-delay-s", type=float, default=2.0, help="Seconds until a submitted batch ends")
+    ap.add_argument("--batch-error-ratio", type=float, default=0.0, help="Fraction of batch results that come back errored")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    server = FakeLLMServer((args.host, args.port), latency_ms=args.latency_ms,
+                           jitter=args.jitter, verbose=args.verbose,
+                           rate_limit_ratio=args.rate_limit_ratio, overload_ratio=args.overload_ratio,
+                           retry_after_s=args.retry_after, batch_delay_s=args.batch_delay_s,
+                           batch_error_ratio=args.batch_error_ratio)
+    print(f"Fake LLM server on http://{args.host}:{args.port} (latency {args.latency_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Local stand-in for an OpenTelemetry Collector's OTLP/HTTP receiver, for trying
+TRACING=otlp offline.
+
+    python scripts/fake_otlp_collector.py --port 4318 --out traces.jsonl
+
+Then point the app (API and `python -m app.worker`) at it:
+
+    TRACING=otlp
+    TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces
+
+Accepts JSON-encoded ExportTraceServiceRequest bodies on POST /v1/traces and appends
+each, one per line, to --out: the same format TRACING=file writes, so
+scripts/trace_report.py reads either. Protobuf bodies are refused with 415.
+--fail-ratio answers that share of exports with 503, to watch the exporter cope.
+"""
+import argparse
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeCollector"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if self.path.split("?")[0] != "/v1/traces":
+            self._send(404, {"error": "not found"})
+            return
+        if not self.headers.get("Content-Type", "").startswith("application/json"):
+            self._send(415, {"error": "only OTLP/JSON is supported"})
+            return
+        if random.random() < self.server.fail_ratio:
+            self._send(503, {"error": "collector unavailable (--fail-ratio)"})
+            return
+        try:
+            request = json.loads(body)
+            spans = sum(len(scope.get("spans", [])) for rs in request.get("resourceSpans", [])
+                        for scope in rs.get("scopeSpans", []))
+        except (ValueError, AttributeError, TypeError):
+            self._send(400, {"error": "malformed ExportTraceServiceRequest"})
+            return
+        self.server.store(body, spans)
+        self._send(200, {})
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class FakeCollector(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, out: str, fail_ratio: float = 0.0, verbose: bool = False):
+        super().__init__(address, CollectorHandler)
+        self.out = out
+        self.fail_ratio = fail_ratio
+        self.verbose = verbose
+        self.requests = 0
+        self.spans = 0
+        self._lock = threading.Lock()
+
+    def store(self, body: bytes, spans: int):
+        with self._lock:
+            with open(self.out, "ab") as f:
+                f.write(body.strip() + b"\n")
+            self.requests += 1
+            self.spans += spans
+            if self.verbose or self.requests % 100 == 0:
+                print(f"{self.requests} export(s), {self.spans} span(s)", flush=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=4318)
+    ap.add_argument("--out", default="traces.jsonl", help="File the exported requests are appended to")
+    ap.add_argument("--fail-ratio", type=float, default=0.0, help="Share of exports refused with 503")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    server = FakeCollector((args.host, args.port), args.out, args.fail_ratio, args.verbose)
+    print(f"Fake OTLP collector on http://{args.host}:{args.port}/v1/traces -> {args.out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"{server.requests} export(s), {server.spans} span(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Local stand-in for an S3-compatible object store (the MinIO role), for trying
+STORAGE_BACKEND=s3 offline.
+
+    python scripts/fake_s3_server.py --port 9009
+
+Then point the app at it:
+
+    STORAGE_BACKEND=s3
+    S3_BUCKET=uploads
+    S3_ENDPOINT_URL=http://127.0.0.1:9009
+    AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake
+
+Serves path-style PUT / GET / HEAD / DELETE of objects; buckets spring into existence
+on first write. Objects live in memory, or under --data-dir if given. Signatures are
+not checked.
+"""
+import argparse
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeS3Server"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def do_PUT(self):
+        bucket, key = self._target()
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        if key:
+            self.server.put(bucket, key, body)
+        self._send(200, b"", {"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+    def do_GET(self):
+        self._get(with_body=True)
+
+    def do_HEAD(self):
+        self._get(with_body=False)
+
+    def do_DELETE(self):
+        bucket, key = self._target()
+        self.server.delete(bucket, key)
+        self._send(204, b"")
+
+    def _get(self, with_body: bool):
+        bucket, key = self._target()
+        data = self.server.get(bucket, key)
+        if data is None:
+            error = (b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>NoSuchKey</Code>'
+                     b"<Message>The specified key does not exist.</Message></Error>")
+            self._send(404, error if with_body else b"", {"Content-Type": "application/xml"},
+                       length=len(error))
+            return
+        self._send(200, data if with_body else b"", {
+            "Content-Type": "application/octet-stream",
+            "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+        }, length=len(data))
+
+    def _target(self) -> tuple[str, str]:
+        path = unquote(urlsplit(self.path).path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        return bucket, key
+
+    def _send(self, status: int, body: bytes, headers: dict | None = None, length: int | None = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+class FakeS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, data_dir: str | None = None, verbose: bool = False):
+        super().__init__(addr, FakeS3Handler)
+        self.data_dir = data_dir
+        self.verbose = verbose
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def put(self, bucket: str, key: str, data: bytes):
+        self._count()
+        if self.data_dir:
+            path = self._path(bucket, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            return
+        with self.lock:
+            self.objects[(bucket, key)] = data
+
+    def get(self, bucket: str, key: str) -> bytes | None:
+        self._count()
+        if self.data_dir:
+            try:
+                with open(self._path(bucket, key), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        with self.lock:
+            return self.objects.get((bucket, key))
+
+    def delete(self, bucket: str, key: str):
+        self._count()
+        if self.data_dir:
+            try:
+                os.remove(self._path(bucket, key))
+            except FileNotFoundError:
+                pass
+            return
+        with self.lock:
+            self.objects.pop((bucket, key), None)
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.data_dir, bucket, *key.split("/"))
+
+    def _count(self):
+        with self.lock:
+            self.requests += 1
+
+def serve_in_background(port: int = 0, **kwargs) -> FakeS3Server:
+    """Starts the server on a daemon thread; port 0 picks a free port (see server.server_port)."""
+    server = FakeS3Server(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9009)
+    ap.add_argument("--data-dir", default=None, help="Keep objects on disk here instead of in memory")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    server = FakeS3Server((args.host, args.port), data_dir=args.data_dir, verbose=args.verbose)
+    print(f"Fake S3 server on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,40 @@
+"""
+Sample invoices for the demo, and synthetic corpora for scale and accuracy testing.
+
+    python scripts/generate_sample_invoices.py [--out ../samples]
+    python scripts/generate_sample_invoices.py --count 100000 --zip corpus.zip [--workers 8] [--seed 1]
+        [--formats pdf=4,scan=2,png=1,jpeg=2,webp=1,tiff=1] [--multipage-ratio 0.1] [--max-items 60]
+        [--max-skew 2] [--rotate-ratio 0.05] [--noise 0.5] [--dpi 100,150,200]
+
+Without --count, writes the three SAMPLES as PDFs into --out.
+
+With --count, generates that many random invoices across the classic, minimal and boxed
+templates: line-item counts up to --max-items (a --multipage-ratio share long enough to
+continue over several pages), and one of --formats (weights after `=`):
+  pdf   vector PDF as drawn, sometimes with a 90/180/270 degree page rotation
+  scan  the pages rasterized at one of --dpi, skewed, noised and saved as an image PDF
+  png / jpeg / webp / tiff   a scanned single page (multi-page invoices become scans)
+Invoice i is the same for the same --seed whatever --workers is. Invoices are made in
+chunks by a process pool and written into --zip as they arrive, so memory stays flat at
+any --count. The ground truth (the ExtractedInvoice fields as printed, plus how the file
+was made) goes to <zip>.truth.jsonl, one line per file, keeping the ZIP itself
+uploadable as-is to POST /api/documents/bulk.
+"""
 import argparse
+import io
+import json
 import os
-from datetime import date
+import random
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+import pypdfium2 as pdfium
+from PIL import Image, ImageFilter
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
@@ -66,7 +100,20 @@ def calc_totals(sample):
     total = subtotal + tax + sample["freight"]
     return subtotal, tax, total
 
-def draw_classic(c, s):
+def continued(c, page, pages, x, y):
+    """Numbers the pages of a multi-page invoice; True (after a note) if more follow."""
+    if pages == 1:
+        return False
+    w, _ = letter
+    c.setFont("Helvetica", 8)
+    c.drawCentredString(w / 2, 0.5*inch, f"Page {page} of {pages}")
+    if page == pages:
+        return False
+    c.setFont("Helvetica-Oblique", 9)
+    c.drawRightString(x, y - 0.1*inch, "Continued on next page")
+    return True
+
+def draw_classic(c, s, items=None, page=1, pages=1):
     w, h = letter
     c.setFont("Helvetica-Bold", 20)
     c.drawRightString(w - 0.75*inch, h - 0.75*inch, "INVOICE")
@@ -115,13 +162,15 @@ def draw_classic(c, s):
 
     c.setFont("Helvetica", 10)
     y -= 0.35*inch
-    for it in s["items"]:
+    for it in s["items"] if items is None else items:
         line_total = it["qty"]*it["unit"]
         c.drawString(0.85*inch, y, it["desc"])
         c.drawRightString(w - 2.6*inch, y, str(it["qty"]))
         c.drawRightString(w - 1.6*inch, y, money(it["unit"]))
         c.drawRightString(w - 0.85*inch, y, money(line_total))
         y -= 0.25*inch
+    if continued(c, page, pages, w - 0.85*inch, y):
+        return
 
     subtotal, tax, total = calc_totals(s)
     y -= 0.25*inch
@@ -144,7 +193,7 @@ def draw_classic(c, s):
     c.drawRightString(w - 1.6*inch, y, "TOTAL DUE")
     c.drawRightString(w - 0.85*inch, y, money(total))
 
-def draw_minimal(c, s):
+def draw_minimal(c, s, items=None, page=1, pages=1):
     w, h = letter
     c.setFont("Helvetica-Bold", 18)
     c.drawString(0.75*inch, h - 0.9*inch, "Invoice")
@@ -165,12 +214,14 @@ def draw_minimal(c, s):
     c.line(0.75*inch, y, w - 0.75*inch, y)
     y -= 0.25*inch
     c.setFont("Helvetica", 10)
-    for it in s["items"]:
+    for it in s["items"] if items is None else items:
         c.drawString(0.75*inch, y, it["desc"])
         c.drawRightString(w - 3.0*inch, y, str(it["qty"]))
         c.drawRightString(w - 2.0*inch, y, money(it["unit"]))
         c.drawRightString(w - 0.75*inch, y, money(it["qty"]*it["unit"]))
         y -= 0.25*inch
+    if continued(c, page, pages, w - 0.75*inch, y):
+        return
 
     subtotal, tax, total = calc_totals(s)
     y -= 0.2*inch
@@ -193,7 +244,7 @@ def draw_minimal(c, s):
     c.drawRightString(w - 2.0*inch, y, "TOTAL DUE")
     c.drawRightString(w - 0.75*inch, y, money(total))
 
-def draw_boxed(c, s):
+def draw_boxed(c, s, items=None, page=1, pages=1):
     w, h = letter
     c.setFont("Helvetica-Bold", 20)
     c.drawString(0.75*inch, h - 0.85*inch, "SALES INVOICE")
@@ -220,13 +271,15 @@ def draw_boxed(c, s):
 
     y -= 0.35*inch
     c.setFont("Helvetica", 10)
-    for it in s["items"]:
+    for it in s["items"] if items is None else items:
         c.rect(0.75*inch, y, w-1.5*inch, 0.28*inch)
         c.drawString(0.85*inch, y+0.08*inch, it["desc"])
         c.drawRightString(w - 3.0*inch, y+0.08*inch, str(it["qty"]))
         c.drawRightString(w - 2.0*inch, y+0.08*inch, money(it["unit"]))
         c.drawRightString(w - 0.85*inch, y+0.08*inch, money(it["qty"]*it["unit"]))
         y -= 0.28*inch
+    if continued(c, page, pages, w - 0.85*inch, y):
+        return
 
     subtotal, tax, total = calc_totals(s)
     y -= 0.2*inch
@@ -253,25 +306,251 @@ def draw_boxed(c, s):
     c.drawRightString(w - 2.0*inch, y, "TOTAL DUE")
     c.drawRightString(w - 0.85*inch, y, money(total))
 
+DRAW = {"classic": draw_classic, "minimal": draw_minimal, "boxed": draw_boxed}
+# line items that fit on a page above the totals block
+ROWS_PER_PAGE = {"classic": 22, "minimal": 24, "boxed": 19}
+
+def draw_invoice(c, s, rotation=0):
+    """Draws s with its template, continuing long item lists on further pages; returns the page count."""
+    draw = DRAW.get(s["template"], draw_classic)
+    rows = ROWS_PER_PAGE.get(s["template"], ROWS_PER_PAGE["classic"])
+    chunks = [s["items"][i:i + rows] for i in range(0, len(s["items"]), rows)] or [[]]
+    for page, items in enumerate(chunks, 1):
+        draw(c, s, items, page, len(chunks))
+        if rotation:
+            c.setPageRotation(rotation)
+        c.showPage()
+    return len(chunks)
+
+# ---- synthetic corpus ----
+
+COMPANY_WORDS = ["Acme", "Bluebird", "Sunrise", "Northwind", "Granite", "Cedar", "Harbor", "Summit", "Redwood",
+                 "Silver Lake", "Prairie", "Atlas", "Beacon", "Copper", "Evergreen", "Lakeside", "Pioneer", "Vista"]
+COMPANY_KINDS = ["Retail", "Foods", "Hardware", "Supply", "Outfitters", "Cycles", "Distribution", "Trading",
+                 "Electric", "Office Products", "Farms", "Marine"]
+COMPANY_SUFFIXES = ["LLC", "Inc", "Co.", "Ltd", "Corp", ""]
+SHIP_TO_SUFFIXES = ["", "", " Warehouse", " - Dock 2", " - Receiving", " Store #14"]
+PRODUCT_ADJECTIVES = ["Steel", "Organic", "Heavy Duty", "Compact", "Premium", "Wireless", "Stainless", "Recycled",
+                      "Assorted", "Mountain", "Road", "Touring", "Classic", "LED", "Hybrid"]
+PRODUCT_NOUNS = ["Screws 2in (1000ct)", "Granola Bars (Case)", "Drill Bits Set", "Measuring Tape 25ft",
+                 "Snacks Pack", "Copy Paper (10 reams)", "Bulb 4-pack", "Frame - 52", "Helmet, M", "Water Bottle",
+                 "Bike Stand", "Cable Lock", "Gloves, L", "Tire Tube", "Storage Bin", "Work Light"]
+TERMS = ["Net 30", "Net 15", "Net 45", "Net 60", "Due on receipt", "2% 10 Net 30"]
+SHIP_VIA = ["UPS Ground", "FedEx", "DHL", "USPS Priority", "Freight Truck", "Will Call"]
+SALESPEOPLE = ["Demo Rep", "A. Patel", "S. Kim", "J. Rivera", "M. Chen", "L. Okafor", "R. Novak", "T. Nguyen"]
+# only rates that every template prints exactly (two decimals of a percent)
+TAX_RATES = [0.0, 0.05, 0.06, 0.0625, 0.07, 0.0725, 0.08, 0.0825, 0.0875, 0.095, 0.1]
+DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%d", "%m/%d/%Y", "%b %d, %Y", "%d %B %Y"]
+FORMAT_EXTENSIONS = {"pdf": "pdf", "scan": "pdf", "png": "png", "jpeg": "jpg", "webp": "webp", "tiff": "tif"}
+COMPRESSED_FORMATS = {"png", "jpeg", "webp", "scan"}  # stored in the ZIP as-is, deflating gains nothing
+
+@dataclass(frozen=True)
+class CorpusOptions:
+    seed: int = 1
+    formats: tuple = (("pdf", 4.0), ("scan", 2.0), ("png", 1.0), ("jpeg", 2.0), ("webp", 1.0), ("tiff", 1.0))
+    multipage_ratio: float = 0.1
+    max_items: int = 60
+    max_skew: float = 2.0
+    rotate_ratio: float = 0.05
+    noise: float = 0.5
+    dpi: tuple = (100, 150, 200)
+
+def make_sample(i: int, opts: CorpusOptions, rng: random.Random) -> dict:
+    """A random invoice in the SAMPLES format, plus the ISO `order_date` it prints as `date`."""
+    template = rng.choice(list(DRAW))
+    rows = ROWS_PER_PAGE[template]
+    if rng.random() < opts.multipage_ratio and opts.max_items > rows:
+        n_items = rng.randint(rows + 1, opts.max_items)
+    else:
+        n_items = rng.randint(1, min(rows, opts.max_items, 8 if rng.random() < 0.8 else rows))
+    customer = " ".join(filter(None, [rng.choice(COMPANY_WORDS), rng.choice(COMPANY_KINDS),
+                                      rng.choice(COMPANY_SUFFIXES)]))
+    order_date = date(2024, 1, 1) + timedelta(days=rng.randrange(3 * 365))
+    number = rng.choice(["SO-{:07d}", "INV-{:06d}", "{:08d}", "SO-SYN-{:06d}"]).format(i)
+    return {
+        "template": template,
+        "invoice_number": number,
+        "date": order_date.strftime(rng.choice(DATE_FORMATS)),
+        "order_date": order_date.isoformat(),
+        "customer": customer,
+        "ship_to": customer + rng.choice(SHIP_TO_SUFFIXES),
+        "items": [{"desc": f"{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)}",
+                   "qty": rng.choice([1, 1, 2, 3, 5, 10, 12, 24]) if rng.random() < 0.6 else rng.randint(1, 500),
+                   "unit": round(rng.choice([rng.uniform(0.5, 20), rng.uniform(20, 300), rng.uniform(300, 3500)]), 2)}
+                  for _ in range(n_items)],
+        "tax_rate": rng.choice(TAX_RATES),
+        "freight": 0.0 if rng.random() < 0.3 else round(rng.uniform(5, 250), 2),
+        "terms": rng.choice(TERMS),
+        "ship_via": rng.choice(SHIP_VIA),
+        "salesperson": rng.choice(SALESPEOPLE),
+    }
+
+def ground_truth(s: dict) -> dict:
+    """The ExtractedInvoice fields as the invoice prints them (money rounded to cents)."""
+    subtotal, tax, total = calc_totals(s)
+    return {
+        "invoice_number": s["invoice_number"],
+        "order_date": s.get("order_date", s["date"]),
+        "salesperson": s["salesperson"],
+        "ship_via": s["ship_via"],
+        "terms": s["terms"],
+        "subtotal": round(subtotal, 2),
+        "tax_rate": s["tax_rate"],
+        "tax_amt": round(tax, 2),
+        "freight": round(s["freight"], 2),
+        "total_due": round(total, 2),
+        "bill_to_name": s["customer"],
+        "ship_to_name": s["ship_to"],
+        "items": [{"description": it["desc"], "qty": it["qty"], "unit_price": it["unit"],
+                   "line_total": round(it["qty"] * it["unit"], 2)} for it in s["items"]],
+    }
+
+def degrade(img: Image.Image, rng: random.Random, noise: float, max_skew: float) -> Image.Image:
+    """Makes a clean render look scanned: greyscale or colour, skewed, blurred, speckled."""
+    if rng.random() < 0.5:
+        img = img.convert("L")
+    if max_skew:
+        img = img.rotate(rng.uniform(-max_skew, max_skew), resample=Image.BILINEAR, expand=True,
+                         fillcolor=255 if img.mode == "L" else (255, 255, 255))
+    if noise:
+        if rng.random() < noise:
+            img = img.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 1.2) * noise))
+        nprng = np.random.default_rng(rng.getrandbits(32))
+        pixels = np.asarray(img, dtype=np.float32)
+        pixels = pixels + nprng.standard_normal(pixels.shape, dtype=np.float32) * (25 * noise)
+        pixels[pixels > 225] = 255  # a scanner's white point: grain shows in the ink, the paper stays clean
+        speckle = nprng.random(pixels.shape[:2]) < 0.004 * noise
+        pixels[speckle] = 0
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), img.mode)
+    return img
+
+def render_invoice(i: int, opts: CorpusOptions) -> tuple[str, bytes, dict]:
+    """Invoice i of the corpus: (name in the ZIP, file bytes, truth record)."""
+    rng = random.Random(f"{opts.seed}:{i}")
+    s = make_sample(i, opts, rng)
+    fmt = rng.choices([f for f, _ in opts.formats], [w for _, w in opts.formats])[0]
+    rotation = rng.choice([90, 180, 270]) if rng.random() < opts.rotate_ratio else 0
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter, invariant=1)
+    pages = draw_invoice(c, s, rotation if fmt == "pdf" else 0)
+    c.save()
+    data = buf.getvalue()
+    if pages > 1 and fmt not in ("pdf", "scan"):
+        fmt = "scan"  # the API reads only the first frame of an image
+    meta = {"template": s["template"], "format": fmt, "pages": pages, "items": len(s["items"]),
+            "rotation": rotation}
+
+    if fmt != "pdf":
+        dpi = rng.choice(opts.dpi)
+        noise = rng.uniform(0, opts.noise)
+        pdf = pdfium.PdfDocument(data)
+        images = []
+        for index in range(len(pdf)):
+            img = pdf[index].render(scale=dpi / 72).to_pil()
+            if rotation:
+                img = img.rotate(rotation, expand=True)
+            images.append(degrade(img, rng, noise, opts.max_skew))
+        pdf.close()
+        out = io.BytesIO()
+        quality = rng.randint(45, 90)
+        if fmt == "scan":
+            images[0].save(out, "PDF", save_all=True, append_images=images[1:], resolution=dpi, quality=quality)
+        elif fmt in ("jpeg", "webp"):
+            images[0].save(out, fmt.upper(), quality=quality)
+        elif fmt == "tiff":
+            images[0].save(out, "TIFF", dpi=(dpi, dpi), compression="tiff_deflate")
+        else:
+            images[0].save(out, "PNG", dpi=(dpi, dpi))
+        data = out.getvalue()
+        meta.update(dpi=dpi, noise=round(noise, 3))
+        if fmt in ("scan", "jpeg", "webp"):
+            meta["quality"] = quality
+
+    name = f"invoices/{i:07d}-{s['template']}.{FORMAT_EXTENSIONS[fmt]}"
+    return name, data, {"file": name, **meta, "truth": ground_truth(s)}
+
+def render_chunk(start: int, count: int, opts: CorpusOptions) -> list[tuple[str, bytes, dict]]:
+    return [render_invoice(i, opts) for i in range(start, start + count)]
+
+def write_corpus(path: str, count: int, opts: CorpusOptions, workers: int, chunk: int):
+    truth_path = os.path.splitext(path)[0] + ".truth.jsonl"
+    kinds, total_bytes, written = Counter(), 0, 0
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(path, "w") as zf, open(truth_path, "w") as truth, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        pending, next_start = set(), 0
+        while pending or next_start < count:
+            # a few chunks per worker in flight: the pool stays busy, results never pile up
+            while next_start < count and len(pending) < workers * 4:
+                pending.add(pool.submit(render_chunk, next_start, min(chunk, count - next_start), opts))
+                next_start += chunk
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for name, data, record in future.result():
+                    info = zipfile.ZipInfo(name, date_time=(2026, 1, 1, 0, 0, 0))
+                    info.compress_type = (zipfile.ZIP_STORED if record["format"] in COMPRESSED_FORMATS
+                                          else zipfile.ZIP_DEFLATED)
+                    zf.writestr(info, data)
+                    truth.write(json.dumps(record) + "\n")
+                    kinds[(record["format"], record["pages"] > 1)] += 1
+                    total_bytes += len(data)
+                    written += 1
+            if written % max(chunk, 1000) < chunk or written == count:
+                elapsed = time.perf_counter() - t0
+                print(f"{written}/{count} invoices, {written / elapsed:.1f}/s, "
+                      f"{total_bytes / 1e6:.1f} MB", flush=True)
+
+    elapsed = time.perf_counter() - t0
+    print(f"\nWrote {path} ({os.path.getsize(path) / 1e6:.1f} MB) and {truth_path}")
+    print(f"{count} invoices in {elapsed:.1f}s: {count / elapsed:.1f} invoices/s with {workers} worker(s)")
+    print(f"{'format':8} {'1 page':>8} {'multi':>8}")
+    for fmt, _ in opts.formats:
+        print(f"{fmt:8} {kinds[(fmt, False)]:8} {kinds[(fmt, True)]:8}")
+
+def parse_formats(text: str) -> tuple:
+    formats = []
+    for part in text.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in FORMAT_EXTENSIONS:
+            raise argparse.ArgumentTypeError(f"unknown format {name!r} (one of {', '.join(FORMAT_EXTENSIONS)})")
+        formats.append((name, float(weight or 1)))
+    return tuple(formats)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--out", default="../samples", help="Output folder for sample invoices")
+    ap.add_argument("--count", type=int, help="Generate a synthetic corpus of this many invoices into --zip")
+    ap.add_argument("--zip", default="corpus.zip", help="Corpus ZIP (ground truth goes to <name>.truth.jsonl)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk", type=int, default=32, help="Invoices per pool task")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--formats", type=parse_formats, default=CorpusOptions.formats,
+                    help="Comma-separated formats with optional weights, e.g. pdf=4,scan=2,png=1,jpeg=2")
+    ap.add_argument("--multipage-ratio", type=float, default=CorpusOptions.multipage_ratio,
+                    help="Share of invoices with more line items than fit on one page")
+    ap.add_argument("--max-items", type=int, default=CorpusOptions.max_items)
+    ap.add_argument("--max-skew", type=float, default=CorpusOptions.max_skew, help="Degrees, scanned formats")
+    ap.add_argument("--rotate-ratio", type=float, default=CorpusOptions.rotate_ratio,
+                    help="Share of invoices turned 90/180/270 degrees")
+    ap.add_argument("--noise", type=float, default=CorpusOptions.noise, help="0-1, scanned formats")
+    ap.add_argument("--dpi", default=",".join(map(str, CorpusOptions.dpi)), help="Scan resolutions to pick from")
     args = ap.parse_args()
+
+    if args.count:
+        opts = CorpusOptions(seed=args.seed, formats=args.formats, multipage_ratio=args.multipage_ratio,
+                             max_items=args.max_items, max_skew=args.max_skew, rotate_ratio=args.rotate_ratio,
+                             noise=args.noise, dpi=tuple(int(d) for d in args.dpi.split(",")))
+        write_corpus(os.path.abspath(args.zip), args.count, opts, max(1, args.workers), max(1, args.chunk))
+        return
+
     out = os.path.abspath(args.out)
     os.makedirs(out, exist_ok=True)
 
     for s in SAMPLES:
         path = os.path.join(out, f"invoice_{s['template']}_{s['invoice_number']}.pdf")
         c = canvas.Canvas(path, pagesize=letter)
-        if s["template"] == "classic":
-            draw_classic(c, s)
-        elif s["template"] == "minimal":
-            draw_minimal(c, s)
-        elif s["template"] == "boxed":
-            draw_boxed(c, s)
-        else:
-            draw_classic(c, s)
-        c.showPage()
+        draw_invoice(c, s)
         c.save()
         print("Wrote", path)
 
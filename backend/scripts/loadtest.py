@@ -0,0 +1,273 @@
+"""
+Offline load test of the upload -> extraction -> SSE pipeline, using LLM_PROVIDER=fake.
+
+    python scripts/loadtest.py -n 200 --concurrency 20 --latency-ms 500
+    python scripts/loadtest.py -n 500 --concurrency 50 --error-rate 0.1 --server gunicorn
+
+Starts the API in a subprocess with a fresh SQLite database and the fake provider,
+renders -n distinct invoices with the templates from generate_sample_invoices.py,
+and has --concurrency clients each POST /api/documents and follow the document's
+SSE stream until it finishes. Every invoice is unique, so the extraction cache
+never answers. Use --url to drive a server you started yourself (RSS is then not
+measured).
+
+Stages, as seen from the client:
+  upload  POST sent -> 201
+  queue   201 -> `processing`
+  render  `processing` -> first `calling_llm` (first page rendered)
+  llm     first `calling_llm` -> `extracted` (every page answered)
+  total   POST sent -> stream finished
+
+Reports p50/p95/p99 per stage, throughput, and the peak RSS of the server
+(process tree, so render processes count too) sampled while any document was in
+that stage. Events that happened before the stream connected are replayed at
+connect time, so a very short stage can read as 0. A second table breaks the
+server's own per-document stage timings down (the `timings` of the `extracted`
+event; GET /metrics has the same as histograms).
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from generate_sample_invoices import SAMPLES, draw_boxed, draw_classic, draw_minimal  # noqa: E402
+
+STAGES = ("upload", "queue", "render", "llm", "total")
+DRAW = {"classic": draw_classic, "minimal": draw_minimal, "boxed": draw_boxed}
+PRODUCTS = ["Product XYZ", "Steel Screws 2in (1000ct)", "Organic Granola Bars (Case)", "Wood Drill Bits Set",
+            "Measuring Tape 25ft", "Assorted Snacks Pack", "Copy Paper (10 reams)", "LED Bulb 4-pack"]
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def make_invoice(i: int) -> bytes:
+    """A one-page PDF invoice, different for every i."""
+    rng = random.Random(i)
+    sample = dict(SAMPLES[i % len(SAMPLES)])
+    sample["invoice_number"] = f"SO-LOAD-{i:06d}"
+    sample["items"] = [{"desc": rng.choice(PRODUCTS), "qty": rng.randint(1, 20), "unit": round(rng.uniform(5, 300), 2)}
+                       for _ in range(rng.randint(1, 6))]
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter)
+    DRAW[sample["template"]](c, sample)
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+# ---- server under test ----
+
+def serve(port: int):
+    """--serve: the API on the threaded werkzeug server (same as `python -m app`, minus the reloader)."""
+    from werkzeug.serving import make_server
+    from app import create_app
+    server = make_server("127.0.0.1", port, create_app(), threaded=True)
+    print(f"listening {server.server_port}", flush=True)
+    server.serve_forever()
+
+def start_server(args, workdir: str) -> tuple[subprocess.Popen, str]:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/loadtest.db",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.latency_ms),
+        "FAKE_LLM_JITTER_MS": str(args.jitter_ms),
+        "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+        "FAKE_LLM_FAILURE_RATE": str(args.failure_rate),
+        "CASE_STUDY_XLSX_PATH": os.path.join(workdir, "none"),
+        "PYTHONUNBUFFERED": "1",
+    }
+    backend = os.path.join(os.path.dirname(__file__), "..")
+    if args.server == "gunicorn":
+        port = args.port or 8765
+        env.update(APP_HOST="127.0.0.1", APP_PORT=str(port), WEB_CONCURRENCY="1")
+        proc = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "app:create_app()"], cwd=backend, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        proc = subprocess.Popen([sys.executable, __file__, "--serve", "--port", str(args.port)], cwd=backend,
+                                env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        port = int(proc.stdout.readline().split()[-1])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{url}/api/stats", timeout=1).raise_for_status()
+            return proc, url
+        except (httpx.HTTPError, OSError):
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not come up")
+
+def rss_bytes(pid: int) -> int | None:
+    """Resident memory of pid and its descendants (psutil, or /proc on Linux)."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            proc = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [proc, *proc.children(recursive=True)])
+        except psutil.Error:
+            return None
+    total, todo = 0, [pid]
+    try:
+        while todo:
+            p = todo.pop()
+            with open(f"/proc/{p}/status") as f:
+                total += next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    todo.extend(int(c) for c in f.read().split())
+    except (OSError, StopIteration):
+        return total or None
+    return total
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval_s: float = 0.05):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval_s = interval_s
+        self.samples: list[tuple[float, int]] = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            rss = rss_bytes(self.pid)
+            if rss is not None:
+                self.samples.append((time.perf_counter(), rss))
+            self.stopped.wait(self.interval_s)
+
+# ---- client ----
+
+def run_document(client: httpx.Client, url: str, i: int, pdf: bytes) -> dict:
+    marks = {"start": time.perf_counter()}
+    timings = None
+    r = client.post(f"{url}/api/documents", files={"file": (f"invoice_{i:06d}.pdf", pdf, "application/pdf")})
+    marks["uploaded"] = time.perf_counter()
+    if r.status_code != 201:
+        return {"marks": marks, "status": f"http {r.status_code}"}
+    doc_id = r.json()["document_id"]
+    status = "unknown"
+    with client.stream("GET", f"{url}/api/documents/{doc_id}/events") as stream:
+        event = None
+        for line in stream.iter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                now = time.perf_counter()
+                if data.get("status") == "processing":
+                    marks.setdefault("processing", now)
+                elif data.get("status") == "calling_llm":
+                    marks.setdefault("calling_llm", now)
+                elif event == "extracted":
+                    marks.setdefault("extracted", now)
+                    timings = data.get("timings")
+                elif event == "done":
+                    status = data.get("status", "unknown")
+                    break
+    marks["done"] = time.perf_counter()
+    return {"marks": marks, "status": status, "timings": timings}
+
+def stage_intervals(marks: dict) -> dict[str, tuple[float, float]]:
+    spans = {"upload": ("start", "uploaded"), "queue": ("uploaded", "processing"),
+             "render": ("processing", "calling_llm"), "llm": ("calling_llm", "extracted"),
+             "total": ("start", "done")}
+    return {stage: (marks[a], marks[b]) for stage, (a, b) in spans.items() if a in marks and b in marks}
+
+def report(results: list[dict], elapsed: float, samples: list[tuple[float, int]]):
+    ok = [r for r in results if r["status"] in ("extracted", "saved")]
+    failed = len(results) - len(ok)
+    print(f"\n{len(ok)} extracted, {failed} failed in {elapsed:.1f} s  ->  {len(ok) / elapsed:.2f} docs/s")
+    if samples:
+        print(f"server RSS: start {samples[0][1] / 2**20:.0f} MB, peak {max(s for _, s in samples) / 2**20:.0f} MB")
+    print(f"\n{'stage':8} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'peak RSS MB':>12}")
+    for stage in STAGES:
+        spans = [stage_intervals(r["marks"]).get(stage) for r in ok]
+        spans = [s for s in spans if s]
+        if not spans:
+            continue
+        durations = [1000 * (b - a) for a, b in spans]
+        in_stage = [rss for t, rss in samples if any(a <= t <= b for a, b in spans)]
+        peak = f"{max(in_stage) / 2**20:12.0f}" if in_stage else f"{'-':>12}"
+        print(f"{stage:8} {len(spans):5} {pct(durations, 50):9.1f} {pct(durations, 95):9.1f} "
+              f"{pct(durations, 99):9.1f} {max(durations):9.1f} {peak}")
+    server = [r["timings"] for r in ok if r.get("timings")]
+    if server:
+        print(f"\n{'server':12} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for stage in dict.fromkeys(name for t in server for name in t["stages_ms"]):
+            durations = [t["stages_ms"][stage] for t in server if stage in t["stages_ms"]]
+            print(f"{stage:12} {len(durations):5} {pct(durations, 50):9.1f} {pct(durations, 95):9.1f} "
+                  f"{pct(durations, 99):9.1f} {max(durations):9.1f}")
+        print(f"tokens: {sum(t['input_tokens'] for t in server):,} in, "
+              f"{sum(t['output_tokens'] for t in server):,} out over {sum(t['llm_requests'] for t in server)} requests")
+    statuses = sorted({r["status"] for r in results} - {"extracted", "saved"})
+    if statuses:
+        print("\nother outcomes: " + ", ".join(f"{s} x{sum(r['status'] == s for r in results)}" for s in statuses))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=100, help="Documents to upload")
+    ap.add_argument("--concurrency", type=int, default=10, help="Clients uploading at once")
+    ap.add_argument("--latency-ms", type=float, default=500.0, help="Fake provider latency per page")
+    ap.add_argument("--jitter-ms", type=float, default=100.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with a retryable 529")
+    ap.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls failing for good")
+    ap.add_argument("--server", choices=["dev", "gunicorn"], default="dev",
+                    help="dev: threaded werkzeug server; gunicorn: gunicorn.conf.py with one worker")
+    ap.add_argument("--url", default=None, help="Load-test this running server instead of starting one")
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve:
+        serve(args.port)
+        return
+
+    t0 = time.perf_counter()
+    invoices = [make_invoice(i) for i in range(args.n)]
+    print(f"rendered {args.n} invoices in {time.perf_counter() - t0:.1f} s "
+          f"({sum(map(len, invoices)) / args.n / 1024:.1f} KB avg)")
+
+    proc = sampler = None
+    url = args.url
+    if url is None:
+        proc, url = start_server(args, tempfile.mkdtemp(prefix="loadtest-"))
+        sampler = RssSampler(proc.pid)
+        sampler.start()
+    print(f"server {url}  provider=fake latency={args.latency_ms:.0f}±{args.jitter_ms:.0f} ms "
+          f"error_rate={args.error_rate} failure_rate={args.failure_rate}  concurrency={args.concurrency}")
+
+    limits = httpx.Limits(max_connections=2 * args.concurrency)
+    try:
+        with httpx.Client(limits=limits, timeout=httpx.Timeout(10.0, read=None)) as client:
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                results = list(pool.map(lambda i: run_document(client, url, i, invoices[i]), range(args.n)))
+            elapsed = time.perf_counter() - t0
+    finally:
+        if sampler:
+            sampler.stopped.set()
+            sampler.join()
+        if proc:
+            proc.terminate()
+            proc.wait(10)
+    report(results, elapsed, sampler.samples if sampler else [])
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,48 @@
+"""
+Seeds the sales order tables from the case study dataset.
+
+    python scripts/seed_from_excel.py --xlsx "../Case Study Data.xlsx"
+    python scripts/seed_from_excel.py --xlsx ../data/csv --sync
+
+--xlsx also takes a directory holding SalesOrderHeader/SalesOrderDetail as .csv or
+.parquet. Without --sync the tables must be empty; with it, new and changed rows
+are upserted and the counts printed.
+"""
 import argparse
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 load_dotenv()
 
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+
 from app import create_app  # noqa: E402
-from app.seed import _seed  # noqa: E402
+from app.seed import _seed, sync_source  # noqa: E402
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--xlsx", required=True, help="Path to Case Study Data.xlsx")
+    ap.add_argument("--xlsx", required=True,
+                    help="Path to Case Study Data.xlsx, or a directory of .csv/.parquet files per table")
+    ap.add_argument("--sync", action="store_true",
+                    help="Upsert new and changed rows into populated tables instead of inserting into empty ones")
     args = ap.parse_args()
 
+    if not os.path.exists(args.xlsx):
+        raise SystemExit(f"Source not found: {args.xlsx}")
     app = create_app()
+    settings = app.config["SETTINGS"]
     with app.app_context():
-        if not os.path.exists(args.xlsx):
-            raise SystemExit(f"XLSX not found: {args.xlsx}")
-        _seed(args.xlsx)
+        if args.sync:
+            for table, counts in sync_source(args.xlsx, settings).items():
+                print(f"{table}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                      f"{counts['unchanged']} unchanged")
+            return
+        try:
+            _seed(args.xlsx, settings)
+        except IntegrityError:
+            raise SystemExit("The tables already hold orders; rerun with --sync to update them")
         print("Seed completed")
 
 if __name__ == "__main__":
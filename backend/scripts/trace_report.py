@@ -0,0 +1,135 @@
+"""
+Where the time goes in a trace file (TRACING=file, or scripts/fake_otlp_collector.py --out).
+
+    python scripts/trace_report.py data/traces.jsonl [--root extract.document] [--slowest 3]
+
+Prints:
+  - latency per span name (n, p50/p95/p99/max, errors)
+  - tail attribution: for --root spans slower than their p95, the average time spent in
+    each kind of descendant span, next to the same average over all --root spans, so
+    the stage that makes slow documents slow stands out
+  - the --slowest root spans as waterfalls (offset from the root, duration, attributes)
+"""
+import argparse
+import json
+from collections import defaultdict
+
+WATERFALL_ATTRIBUTES = ("document.id", "page.index", "page.bytes", "gen_ai.system", "gen_ai.usage.input_tokens",
+                        "http.response.status_code", "db.statement", "job.attempt")
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def load_spans(path: str) -> list[dict]:
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for rs in json.loads(line).get("resourceSpans", []):
+                resource = _attributes(rs.get("resource", {}).get("attributes", []))
+                for scope in rs.get("scopeSpans", []):
+                    for s in scope.get("spans", []):
+                        start, end = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                        spans.append({
+                            "trace": s["traceId"], "id": s["spanId"], "parent": s.get("parentSpanId"),
+                            "name": s["name"], "start": start, "ms": (end - start) / 1e6,
+                            "error": (s.get("status") or {}).get("code") == 2,
+                            "attributes": _attributes(s.get("attributes", [])),
+                            "role": resource.get("app.role", "?"),
+                        })
+    return spans
+
+def _attributes(items: list) -> dict:
+    out = {}
+    for item in items:
+        value = item.get("value", {})
+        for kind in ("stringValue", "intValue", "doubleValue", "boolValue"):
+            if kind in value:
+                out[item["key"]] = int(value[kind]) if kind == "intValue" else value[kind]
+    return out
+
+def descendants(span: dict, children: dict) -> list[dict]:
+    out, todo = [], list(children[span["id"]])
+    while todo:
+        s = todo.pop()
+        out.append(s)
+        todo.extend(children[s["id"]])
+    return out
+
+def by_name_table(spans: list[dict]):
+    groups = defaultdict(list)
+    for s in spans:
+        groups[s["name"]].append(s)
+    print(f"{'span':28} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for name, group in sorted(groups.items(), key=lambda kv: -sum(s["ms"] for s in kv[1])):
+        ms = [s["ms"] for s in group]
+        print(f"{name[:28]:28} {len(ms):6} {pct(ms, 50):9.1f} {pct(ms, 95):9.1f} {pct(ms, 99):9.1f} "
+              f"{max(ms):9.1f} {sum(s['error'] for s in group):7}")
+
+def tail_table(roots: list[dict], children: dict, root_name: str):
+    threshold = pct([r["ms"] for r in roots], 95)
+    tail = [r for r in roots if r["ms"] > threshold] or roots[-1:]
+
+    def per_name(group):
+        totals = defaultdict(float)
+        for root in group:
+            for s in descendants(root, children):
+                totals[s["name"]] += s["ms"]
+        return {name: total / len(group) for name, total in totals.items()}
+
+    overall, slow = per_name(roots), per_name(tail)
+    print(f"\ntail attribution: {len(tail)} {root_name} span(s) over p95 = {threshold:.1f} ms "
+          f"(avg {sum(r['ms'] for r in tail) / len(tail):.1f} ms vs {sum(r['ms'] for r in roots) / len(roots):.1f} ms)")
+    print(f"{'inside':28} {'all avg ms':>11} {'tail avg ms':>12} {'x':>6}")
+    for name in sorted(set(overall) | set(slow), key=lambda n: -(slow.get(n, 0) - overall.get(n, 0))):
+        a, t = overall.get(name, 0.0), slow.get(name, 0.0)
+        ratio = f"{t / a:6.1f}" if a else f"{'-':>6}"
+        print(f"{name[:28]:28} {a:11.1f} {t:12.1f} {ratio}")
+
+def waterfall(root: dict, spans_by_trace: dict, children: dict):
+    trace = spans_by_trace[root["trace"]]
+    top = min(trace, key=lambda s: s["start"])
+    print(f"\ntrace {root['trace']}  {root['name']} {root['ms']:.1f} ms "
+          f"(trace starts at {top['name']}, {(root['start'] - top['start']) / 1e6:.1f} ms earlier)")
+
+    def show(span, depth):
+        attrs = " ".join(f"{k}={str(span['attributes'][k])[:60]}" for k in WATERFALL_ATTRIBUTES
+                         if k in span["attributes"])
+        offset = (span["start"] - root["start"]) / 1e6
+        flag = " ERROR" if span["error"] else ""
+        print(f"  {offset:9.1f} {span['ms']:9.1f}  {'  ' * depth}{span['name']} [{span['role']}]{flag}  {attrs}")
+        for child in sorted(children[span["id"]], key=lambda s: s["start"]):
+            show(child, depth + 1)
+    print(f"  {'+ms':>9} {'ms':>9}")
+    show(root, 0)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("path", help="OTLP/JSON lines (TRACE_FILE, or the collector's --out)")
+    ap.add_argument("--root", default="extract.document", help="Span name to analyse the tail of")
+    ap.add_argument("--slowest", type=int, default=3, help="Waterfalls to print")
+    args = ap.parse_args()
+
+    spans = load_spans(args.path)
+    if not spans:
+        raise SystemExit("no spans in file")
+    children, spans_by_trace = defaultdict(list), defaultdict(list)
+    for s in spans:
+        spans_by_trace[s["trace"]].append(s)
+        if s["parent"]:
+            children[s["parent"]].append(s)
+    print(f"{len(spans)} spans in {len(spans_by_trace)} traces\n")
+    by_name_table(spans)
+
+    roots = sorted((s for s in spans if s["name"] == args.root), key=lambda s: s["ms"])
+    if not roots:
+        print(f"\nno {args.root} spans")
+        return
+    tail_table(roots, children, args.root)
+    for root in reversed(roots[-args.slowest:]):
+        waterfall(root, spans_by_trace, children)
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,9 @@ type Order = {
 
 export default function OrdersPage() {
   const [orders, setOrders] = useState<Order[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
@@ -24,6 +26,7 @@ export default function OrdersPage() {
       .then((r) => r.json())
       .then((d) => {
         setOrders(d.orders || []);
+        setNextCursor(d.next_cursor ?? null);
         setLoading(false);
       })
       .catch((e) => {
@@ -32,6 +35,19 @@ export default function OrdersPage() {
       });
   }, []);
 
+  const loadMore = () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    fetch(`${BACKEND}/api/orders?limit=50&cursor=${encodeURIComponent(nextCursor)}`)
+      .then((r) => r.json())
+      .then((d) => {
+        setOrders((prev) => [...prev, ...(d.orders || [])]);
+        setNextCursor(d.next_cursor ?? null);
+      })
+      .catch((e) => setError(String(e)))
+      .finally(() => setLoadingMore(false));
+  };
+
   return (
     <div className="space-y-6 animate-fade-in">
       {/* Page Header */}
@@ -170,10 +186,19 @@ export default function OrdersPage() {
           </div>
           
           {/* Table Footer */}
-          <div className="px-6 py-4 bg-gray-50 border-t border-gray-200">
+          <div className="px-6 py-4 bg-gray-50 border-t border-gray-200 flex items-center justify-between">
             <p className="text-sm text-gray-500">
               Showing {orders.length} order{orders.length !== 1 ? "s" : ""}
             </p>
+            {nextCursor && (
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="text-sm font-medium text-blue-600 hover:text-blue-800 disabled:text-gray-400"
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            )}
           </div>
         </div>
       )}
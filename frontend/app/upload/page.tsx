@@ -39,6 +39,7 @@ const statusConfig: Record<string, { color: string; bg: string; icon: string; te
   uploading: { color: "text-blue-600", bg: "bg-blue-50", icon: "↑", text: "Uploading..." },
   processing: { color: "text-amber-600", bg: "bg-amber-50", icon: "◐", text: "Processing document..." },
   calling_llm: { color: "text-purple-600", bg: "bg-purple-50", icon: "◑", text: "Analyzing with AI..." },
+  retrying: { color: "text-amber-600", bg: "bg-amber-50", icon: "↻", text: "Temporary error, retrying..." },
   extracted: { color: "text-green-600", bg: "bg-green-50", icon: "✓", text: "Extraction complete" },
   saved: { color: "text-green-600", bg: "bg-green-50", icon: "✓", text: "Saved to database" },
   failed: { color: "text-red-600", bg: "bg-red-50", icon: "✕", text: "Processing failed" },
@@ -55,7 +56,7 @@ export default function UploadPage() {
   const [saving, setSaving] = useState(false);
 
   const canSave = extracted && docId && !saving && 
-    status !== "failed" && status !== "processing" && status !== "calling_llm";
+    status !== "failed" && status !== "processing" && status !== "calling_llm" && status !== "retrying";
 
   const handleDrag = useCallback((e: React.DragEvent) => {
     e.preventDefault();
@@ -124,12 +125,17 @@ export default function UploadPage() {
     });
     
     es.addEventListener("error", (e: MessageEvent) => {
+      // Connection drops have no data; EventSource reconnects and resumes by itself
+      if (!e.data) return;
       try {
         const msg = JSON.parse(e.data);
         setError(msg.message || "Processing failed");
       } catch {}
       setStatus("failed");
     });
+
+    // Server closes the stream once the document is finished; don't reconnect
+    es.addEventListener("done", () => es.close());
     
     return () => es.close();
   }, [docId]);
@@ -194,7 +200,7 @@ export default function UploadPage() {
   }
 
   const statusInfo = statusConfig[status] || statusConfig.idle;
-  const isProcessing = status === "uploading" || status === "processing" || status === "calling_llm";
+  const isProcessing = status === "uploading" || status === "processing" || status === "calling_llm" || status === "retrying";
 
   return (
     <div className="space-y-6 animate-fade-in">